@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+import asyncio
+import collections
+import errno
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+import pyaudacity as pa
+import typer
+
+import audacity_funcs as af
+
+"""
+audacity_async.py
+
+asyncio client for mod-script-pipe.
+
+Unlike audacity_funcs, which opens the pipes for every exchange and blocks
+until Audacity answers, AsyncAudacity keeps the pipes open, writes commands
+without waiting and hands out the responses in order as they come in. Every
+command has a deadline: if Audacity doesn't answer in time, DeadlineExceeded
+is raised instead of hanging forever, and the late response is dropped when it
+arrives. Meanwhile, the event loop is free for other work (e.g. preparing the
+next song in a thread pool, see rebuild_batch).
+
+Cancelling a command only stops waiting for it: once written to the pipe,
+Audacity executes it anyway. Commands of do_all that aren't written yet when
+it's cancelled (or a command fails) are never sent.
+
+Don't use audacity_funcs' pipe functions while an AsyncAudacity is connected,
+the commands would interleave on the pipe. Connecting closes the pipes held by
+audacity_funcs.connect().
+
+Unix only (named pipes on Windows aren't supported by asyncio's pipe transports).
+
+"""
+
+# seconds Audacity gets to answer a command
+DEFAULT_TIMEOUT = 60.0
+
+# seconds Audacity gets to open its ends of the pipes
+CONNECT_TIMEOUT = 5.0
+
+# first and max pause between attempts to open the pipe to Audacity
+CONNECT_RETRY = 0.01
+CONNECT_RETRY_MAX = 0.5
+
+
+class DeadlineExceeded(pa.PyAudacityException):
+    pass
+
+
+def _release_reader(pipe: str):
+    """
+    Lets a blocking open for reading of the given pipe return by briefly
+    opening it for writing.
+    """
+    try:
+        os.close(os.open(pipe, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError:
+        pass
+
+
+class AsyncAudacity:
+    """
+    asyncio client for mod-script-pipe with per-command deadlines, see module
+    docstring. Use as async context manager:
+
+        async with AsyncAudacity() as client:
+            response = await client.do("Help: Command=Help")
+    """
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._pending = collections.deque()
+        self._reader = None
+        self._read_transport = None
+        self._write_transport = None
+        self._read_task = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def connect(self, timeout: float = CONNECT_TIMEOUT):
+        """
+        Opens the pipes to and from Audacity.
+        Raises DeadlineExceeded if Audacity doesn't open its ends in time.
+        """
+        if sys.platform == "win32":
+            raise pa.PyAudacityException("audacity_async needs Unix named pipes.")
+        af.disconnect()  # the pipes are ours now
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = CONNECT_RETRY
+        while True:
+            try:
+                write_fd = os.open(af.PIPE_TO_AUDACITY, os.O_WRONLY | os.O_NONBLOCK)
+                break
+            except FileNotFoundError:
+                raise pa.PyAudacityException(
+                    f"{af.PIPE_TO_AUDACITY} does not exist. Ensure Audacity is running and "
+                    "mod-script-pipe is set to Enabled in the Preferences window."
+                ) from None
+            except OSError as e:
+                # ENXIO: Audacity hasn't opened its end (yet)
+                if e.errno != errno.ENXIO or loop.time() + delay > deadline:
+                    raise DeadlineExceeded(
+                        f"Audacity didn't open {af.PIPE_TO_AUDACITY}: {e}"
+                    ) from None
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, CONNECT_RETRY_MAX)
+        # Audacity opens its end of the response pipe once we opened the command pipe
+        opening = loop.run_in_executor(
+            None, os.open, af.PIPE_FROM_AUDACITY, os.O_RDONLY
+        )
+        try:
+            read_fd = await asyncio.wait_for(
+                asyncio.shield(opening), max(deadline - loop.time(), 0)
+            )
+        except asyncio.TimeoutError:
+            os.close(write_fd)
+            opening.add_done_callback(lambda f: f.exception() or os.close(f.result()))
+            _release_reader(af.PIPE_FROM_AUDACITY)
+            raise DeadlineExceeded(
+                f"Audacity didn't open {af.PIPE_FROM_AUDACITY}"
+            ) from None
+        self._reader = asyncio.StreamReader()
+        self._read_transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(self._reader),
+            os.fdopen(read_fd, "rb", buffering=0),
+        )
+        self._write_transport, _ = await loop.connect_write_pipe(
+            asyncio.Protocol, os.fdopen(write_fd, "wb", buffering=0)
+        )
+        self._read_task = loop.create_task(self._read_responses())
+
+    def close(self):
+        """
+        Closes the pipes. Commands still waiting for their response fail.
+        """
+        if self._write_transport is not None:
+            self._write_transport.close()
+            self._write_transport = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        if self._read_transport is not None:
+            self._read_transport.close()
+            self._read_transport = None
+        self._fail_pending(pa.PyAudacityException("mod-script-pipe closed."))
+
+    def _fail_pending(self, exception: Exception):
+        while self._pending:
+            future, *_ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(exception)
+
+    async def _read_response(self) -> str:
+        """
+        Reads one response. A response ends with an empty line.
+        """
+        response = ""
+        while True:
+            line = (await self._reader.readline()).decode("utf-8")
+            if not line:
+                raise pa.PyAudacityException("mod-script-pipe closed by Audacity.")
+            if line == "\n" and response:
+                return response
+            response += line
+
+    async def _read_responses(self):
+        """
+        Hands out the responses to the pending commands in order. Responses to
+        commands nobody waits for anymore (deadline passed, cancelled) are dropped.
+        """
+        try:
+            while True:
+                response = await self._read_response()
+                if self._pending:
+                    future, command, function, sent = self._pending.popleft()
+                    if function is not None:
+                        af.record_command(
+                            command, function, sent, time.perf_counter(), response
+                        )
+                    if not future.done():
+                        future.set_result(response)
+        except pa.PyAudacityException as e:
+            self._fail_pending(e)
+
+    def _send(self, command: str) -> asyncio.Future:
+        """
+        Writes the given command and returns the future of its response.
+        """
+        if self._write_transport is None:
+            raise pa.PyAudacityException("Not connected to mod-script-pipe.")
+        future = asyncio.get_running_loop().create_future()
+        function = af.profile_caller() if af.is_profiling() else None
+        self._pending.append((future, command, function, time.perf_counter()))
+        self._write_transport.write((command + af.PIPE_EOL).encode("utf-8"))
+        if not af.is_read_only_command(command):
+            af.invalidate_track_cache()
+        return future
+
+    async def _wait(self, command: str, future: asyncio.Future, timeout: float) -> str:
+        """
+        Waits for the response of the given command until its deadline.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(
+                f"{command}\nno response within {timeout} s"
+            ) from None
+
+    async def do(self, command: str, timeout: float = None) -> str:
+        """
+        Sends the given command and returns its response.
+        Raises PyAudacityException if it didn't succeed, DeadlineExceeded if
+        Audacity doesn't answer within timeout seconds (self.timeout if not given).
+        """
+        response = await self._wait(command, self._send(command), timeout)
+        if not af.is_response_ok(response):
+            raise pa.PyAudacityException(f"{command}\n{response}")
+        return response
+
+    async def do_all(self, commands: List[str], timeout: float = None) -> List[str]:
+        """
+        Sends the given commands pipelined (up to af.BATCH_WINDOW ahead of their
+        responses) and returns their responses. The deadline applies per command.
+        Raises PyAudacityException for the first command that didn't succeed,
+        the commands after it that weren't written yet aren't sent.
+        Tested
+        """
+        sent = []
+        responses = []
+        try:
+            while len(responses) < len(commands):
+                while (
+                    len(sent) < len(commands)
+                    and len(sent) - len(responses) < af.BATCH_WINDOW
+                ):
+                    sent.append(self._send(commands[len(sent)]))
+                command = commands[len(responses)]
+                response = await self._wait(command, sent[len(responses)], timeout)
+                if not af.is_response_ok(response):
+                    raise pa.PyAudacityException(f"{command}\n{response}")
+                responses.append(response)
+        finally:
+            for future in sent[len(responses) :]:
+                future.cancel()
+        return responses
+
+    async def get_tracks(self, timeout: float = None) -> List[Dict]:
+        """
+        Returns a list of dicts representing track meta info (see af.get_tracks).
+        Tested
+        """
+        info = await self.do(
+            f'GetInfo: Type="{af.GET_INFO_TRACKS}" Format="{af.GET_INFO_JSON}"', timeout
+        )
+        return json.loads(info[: -len(af.RESPONSE_OK)])
+
+
+async def _print_tracks(timeout: float):
+    async with AsyncAudacity(timeout) as client:
+        for track in await client.get_tracks():
+            print(track)
+
+
+def main(timeout: float = DEFAULT_TIMEOUT):
+    """
+    Prints the tracks of the current project.
+    """
+    asyncio.run(_print_tracks(timeout))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -2,20 +2,28 @@
 
 import glob
 import json
+import math
+import os
 import re
+import sys
+import threading
+import time
+from collections import defaultdict, deque
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import pyaudacity as pa
-import pyperclip
 import typer
 
+import labels as lb
+
 """
 audacity_funcs.py
 
 References
 [1] https://manual.audacityteam.org/man/scripting_reference.html
+[2] https://github.com/audacity/audacity/issues/4220
 
 """
 
@@ -28,8 +36,24 @@ LABEL_PRIORITY_ORDER = [LABEL_PART, LABEL_CHORD, LABEL_LYRIC]
 
 AUDACITY_EXTENSION = "aup3"
 
+AUDIO_EXTENSIONS = ("mp3", "wav", "flac", "ogg", "m4a", "aif", "aiff", "opus")
+
 # when mod-script-pipe worked out fine:
-RESPONSE_OK = "\nBatchCommand finshed: OK\n"
+RESPONSE_OK = "\nBatchCommand finished: OK\n"
+
+# mod-script-pipe endpoints (same as used by pyaudacity.do)
+if sys.platform == "win32":
+    PIPE_TO_AUDACITY = "\\\\.\\pipe\\ToSrvPipe"
+    PIPE_FROM_AUDACITY = "\\\\.\\pipe\\FromSrvPipe"
+    PIPE_EOL = "\r\n\0"
+else:
+    PIPE_TO_AUDACITY = f"/tmp/audacity_script_pipe.to.{os.getuid()}"
+    PIPE_FROM_AUDACITY = f"/tmp/audacity_script_pipe.from.{os.getuid()}"
+    PIPE_EOL = "\n"
+
+# max number of commands written ahead of their responses in a batch.
+# Keeps Audacity from blocking on a full response pipe while we're still writing.
+BATCH_WINDOW = 64
 
 KIND_LABEL = "label"
 KIND_AUDIO = "wave"
@@ -39,16 +63,97 @@ PROPERTY_SELECTED = "selected"
 PROPERTY_MUTED = "mute"
 PROPERTY_SOLO = "solo"
 
+# track state properties applied by SetTrack to the selected tracks and the
+# corresponding SetTrack parameters, see set_track_states
+SET_TRACK_PARAMETERS = {PROPERTY_MUTED: "Mute", PROPERTY_SOLO: "Solo"}
+
 SELECT_MODE_SET = "Set"
 SELECT_MODE_ADD = "Add"
 SELECT_MODE_REMOVE = "Remove"
 
 GET_INFO_TRACKS = "Tracks"
+GET_INFO_LABELS = "Labels"
 GET_INFO_JSON = "JSON"
 
+# GetInfo formats numbers with printf's %g, i.e. with 6 significant digits [2]
+GET_INFO_SIGNIFICANT_DIGITS = 6
+
+# seconds a directory must be unmodified for its scan to be kept (see LabelIndex):
+# entries added within the same mtime tick as the scan wouldn't change the mtime
+LABEL_INDEX_RACY_SECONDS = 2.0
+
+# stem of exported label files if the project has no audio track to name them after
+DEFAULT_LABEL_STEM = "labels"
+
+# format of exported audio tracks, <name>_<stem>.<extension> like label files
+AUDIO_EXPORT_EXTENSION = "mp3"
+
+# name of the exported audio track named like the song itself
+ORIGINAL_TRACK_NAME = "orig"
+
+# what sync_label_tracks did to a label track
+SYNC_UNCHANGED = "unchanged"
+SYNC_UPDATED = "updated"
+SYNC_REPLACED = "replaced"
+SYNC_ADDED = "added"
+
+# commands that leave the track state (as reported by GetInfo Tracks) untouched.
+# Any other command sent via do() invalidates the cached track state.
+READ_ONLY_COMMANDS = (
+    "GetInfo",
+    "Help",
+    "Message",
+    "ExportLabels",
+    "Export2",
+    "SaveProject2",
+)
+
+# generation-tracked snapshot of GetInfo Tracks:
+# the snapshot is valid as long as its generation equals the current generation.
+_track_cache = {
+    "generation": 0,
+    "snapshot_generation": None,
+    "tracks": None,
+    "hits": 0,
+    "misses": 0,
+}
+
+# round trips over mod-script-pipe: exchanges (one per _exchange, a pipelined
+# batch is one exchange), commands sent and GetInfo commands among them
+_pipe_stats = {"exchanges": 0, "commands": 0, "get_info": 0}
+
+# per-command records collected between start_profiling() and stop_profiling(),
+# callers of the commands on their way to the pipe (see profile_caller)
+_profile = {"records": None, "callers": deque(), "start": 0.0, "last": 0.0}
+
+# functions moving commands to the pipes, per module (None: all of the module).
+# Profiled commands are attributed to the first function calling in from
+# outside them.
+PIPE_FUNCTIONS = {
+    __name__: {
+        "do",
+        "query",
+        "send_commands",
+        "flush_batch",
+        "_send_queued",
+        "_exchange",
+        "_note_callers",
+    },
+    "audacity_async": {"do", "do_all", "_send"},
+    "contextlib": None,
+}
+
+# commands queued by do() while a batch() is active
+_batch = {"queue": None}
+
+# pipes held open across exchanges between connect() and disconnect()
+_pipes = {"write": None, "read": None}
+
 
 @contextmanager
 def save_clipboard():
+    import pyperclip  # only needed by make_label_track_01
+
     original_content = pyperclip.paste()
     try:
         yield
@@ -71,7 +176,450 @@ def save_focus():
     try:
         yield
     finally:
-        focus_track(idx)
+        if idx is not None:
+            focus_track(idx)
+
+
+def command_name(command: str) -> str:
+    """
+    Returns the name of the given scripting command, e.g. "SelectTracks" for
+    "SelectTracks: Track=0 Mode=Set".
+    Tested
+    """
+    return command.split(":", 1)[0].split(maxsplit=1)[0] if command.strip() else ""
+
+
+def is_read_only_command(command: str) -> bool:
+    """
+    Returns true if the given command doesn't change the track state.
+    Tested
+    """
+    return command_name(command) in READ_ONLY_COMMANDS
+
+
+def invalidate_track_cache():
+    """
+    Invalidates the cached track state.
+    Call this when the project was changed behind our back (e.g. by the user
+    in the Audacity GUI or by calling pyaudacity directly).
+    Tested indirectly
+    """
+    _track_cache["generation"] += 1
+
+
+def get_track_cache_stats() -> Dict[str, int]:
+    """
+    Returns hits (saved GetInfo round trips) and misses of the track cache.
+    Tested
+    """
+    return {
+        "hits": _track_cache["hits"],
+        "misses": _track_cache["misses"],
+        "generation": _track_cache["generation"],
+    }
+
+
+def reset_track_cache_stats():
+    """
+    Resets hit and miss counters of the track cache.
+    Tested
+    """
+    _track_cache["hits"] = 0
+    _track_cache["misses"] = 0
+
+
+def get_pipe_stats() -> Dict[str, int]:
+    """
+    Returns the number of exchanges, commands and GetInfo commands sent over
+    mod-script-pipe since the last reset_pipe_stats().
+    Tested
+    """
+    return dict(_pipe_stats)
+
+
+def reset_pipe_stats():
+    """
+    Resets the counters of get_pipe_stats.
+    Tested
+    """
+    for key in _pipe_stats:
+        _pipe_stats[key] = 0
+
+
+def start_profiling():
+    """
+    Starts recording every command sent over mod-script-pipe, see stop_profiling.
+    Tested
+    """
+    _profile["records"] = []
+    _profile["callers"].clear()
+    _profile["start"] = _profile["last"] = time.perf_counter()
+
+
+def stop_profiling() -> List[Dict]:
+    """
+    Stops recording and returns a record per command sent since
+    start_profiling(), in order:
+        command: the command's name
+        function: the function it's attributed to (see profile_caller)
+        start: seconds from start_profiling() until it was sent
+        latency: seconds from sending it until its response was read
+        seconds: seconds Audacity was busy with it. Unlike latency, this
+            doesn't count waiting for the commands pipelined before it, so the
+            seconds of all commands add up to the time spent on the pipe.
+        bytes: size of its response
+    Tested
+    """
+    records, _profile["records"] = _profile["records"], None
+    _profile["callers"].clear()
+    return records or []
+
+
+def is_profiling() -> bool:
+    """
+    Returns true between start_profiling() and stop_profiling().
+    Tested indirectly
+    """
+    return _profile["records"] is not None
+
+
+def profile_caller() -> str:
+    """
+    Returns the function the command being sent is attributed to: the
+    innermost function on the stack that isn't one of PIPE_FUNCTIONS, by name
+    if it's one of this module's, else qualified by its module.
+    Tested indirectly
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__")
+        name = frame.f_code.co_name
+        if module not in PIPE_FUNCTIONS or (
+            PIPE_FUNCTIONS[module] is not None and name not in PIPE_FUNCTIONS[module]
+        ):
+            return name if module == __name__ else f"{module}.{name}"
+        frame = frame.f_back
+    return "?"
+
+
+def _note_callers(count: int):
+    if _profile["records"] is not None:
+        _profile["callers"].extend([profile_caller()] * count)
+
+
+def record_command(
+    command: str, function: str, sent: float, received: float, response: str
+):
+    """
+    Records the given command while profiling (see stop_profiling).
+    sent and received are time.perf_counter() values.
+    Tested indirectly
+    """
+    if _profile["records"] is None:
+        return
+    busy_from = max(sent, _profile["last"])
+    _profile["last"] = received
+    _profile["records"].append(
+        {
+            "command": command_name(command),
+            "function": function,
+            "start": sent - _profile["start"],
+            "latency": received - sent,
+            "seconds": received - busy_from,
+            "bytes": len(response.encode("utf-8")),
+        }
+    )
+
+
+def is_response_ok(response: str) -> bool:
+    """
+    Returns true if the given mod-script-pipe response reports success.
+    Tested
+    """
+    return response.rstrip().endswith(RESPONSE_OK.strip())
+
+
+def _read_response(read_pipe) -> str:
+    """
+    Reads one response from the given pipe. A response ends with an empty line.
+    """
+    response = ""
+    while True:
+        line = read_pipe.readline()
+        if not line:
+            raise pa.PyAudacityException("mod-script-pipe closed by Audacity.")
+        if line == "\n" and response:
+            return response
+        response += line
+
+
+def _check_pipes():
+    for pipe in (PIPE_TO_AUDACITY, PIPE_FROM_AUDACITY):
+        if not os.path.exists(pipe):
+            raise pa.PyAudacityException(
+                f"{pipe} does not exist. Ensure Audacity is running and "
+                "mod-script-pipe is set to Enabled in the Preferences window."
+            )
+
+
+def connect():
+    """
+    Opens the pipes to and from Audacity and keeps them open for all following
+    exchanges until disconnect(), instead of reopening them for every exchange.
+    Does nothing if already connected.
+    Tested indirectly
+    """
+    if is_connected():
+        return
+    _check_pipes()
+    _pipes["write"] = open(PIPE_TO_AUDACITY, "w")
+    _pipes["read"] = open(PIPE_FROM_AUDACITY)
+
+
+def disconnect():
+    """
+    Closes the pipes opened by connect(), if any.
+    Tested indirectly
+    """
+    for end in ("write", "read"):
+        pipe, _pipes[end] = _pipes[end], None
+        if pipe is not None:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+
+def is_connected() -> bool:
+    """
+    Returns true between connect() and disconnect().
+    Tested
+    """
+    return _pipes["write"] is not None
+
+
+def _exchange(commands: List[str]) -> List[str]:
+    """
+    Writes the given commands back-to-back (up to BATCH_WINDOW ahead of their
+    responses) and collects all responses. Uses the pipes held by connect(),
+    if any (dropping them if they broke), else opens them for this exchange.
+    Raises PyAudacityException for the first command that didn't succeed, after
+    all responses have been read.
+    """
+    if not commands:
+        return []
+    _pipe_stats["exchanges"] += 1
+    _pipe_stats["commands"] += len(commands)
+    _pipe_stats["get_info"] += sum(command_name(c) == "GetInfo" for c in commands)
+    profiling = _profile["records"] is not None
+    if profiling:
+        callers = _profile["callers"]
+        functions = [callers.popleft() if callers else "?" for _ in commands]
+        sent_at = []
+    connected = is_connected()
+    if connected:
+        write_pipe, read_pipe = _pipes["write"], _pipes["read"]
+    else:
+        _check_pipes()
+        write_pipe = open(PIPE_TO_AUDACITY, "w")
+        read_pipe = open(PIPE_FROM_AUDACITY)
+    responses = []
+    try:
+        sent = 0
+        while len(responses) < len(commands):
+            while sent < len(commands) and sent - len(responses) < BATCH_WINDOW:
+                write_pipe.write(commands[sent] + PIPE_EOL)
+                sent += 1
+            write_pipe.flush()
+            if profiling:
+                sent_at += [time.perf_counter()] * (sent - len(sent_at))
+            responses.append(_read_response(read_pipe))
+            if profiling:
+                i = len(responses) - 1
+                record_command(
+                    commands[i],
+                    functions[i],
+                    sent_at[i],
+                    time.perf_counter(),
+                    responses[i],
+                )
+    except (OSError, pa.PyAudacityException):
+        if connected:
+            disconnect()
+        raise
+    finally:
+        if not connected:
+            write_pipe.close()
+            read_pipe.close()
+    for command, response in zip(commands, responses):
+        if not is_response_ok(response):
+            raise pa.PyAudacityException(f"{command}\n{response}")
+    return responses
+
+
+def _send_queued(commands: List[str]) -> List[str]:
+    """
+    Sends commands queued by do(), which already invalidated the track cache
+    (or updated it, see _write_through) when queueing them.
+    """
+    try:
+        return _exchange(commands)
+    except Exception:
+        invalidate_track_cache()
+        raise
+
+
+def send_commands(commands: List[str]) -> List[str]:
+    """
+    Sends the given commands pipelined, i.e. writes them back-to-back and
+    collects the responses afterwards instead of waiting for each response
+    before sending the next command.
+    Raises PyAudacityException for the first command that didn't succeed.
+    Tested
+    """
+    _note_callers(len(commands))
+    try:
+        return _exchange(commands)
+    finally:
+        if not all(is_read_only_command(command) for command in commands):
+            invalidate_track_cache()
+
+
+def flush_batch() -> List[str]:
+    """
+    Sends the commands queued in the current batch, if any.
+    Tested indirectly
+    """
+    queue = _batch["queue"]
+    if not queue:
+        return []
+    commands = list(queue)
+    queue.clear()
+    return _send_queued(commands)
+
+
+@contextmanager
+def batch():
+    """
+    Queues the commands issued via do() and sends them pipelined when the
+    block is left (see send_commands). Queries issued within the block (e.g.
+    get_tracks) first flush the queue. Nested batches join the outer one.
+    If the block raises, the commands still queued are discarded.
+    Tested
+    """
+    if _batch["queue"] is not None:
+        yield
+        return
+    _batch["queue"] = []
+    try:
+        yield
+        flush_batch()
+    except BaseException:
+        invalidate_track_cache()
+        _profile["callers"].clear()  # of the discarded commands
+        raise
+    finally:
+        _batch["queue"] = None
+
+
+def query(command: str) -> str:
+    """
+    Sends the given read-only command and returns its response.
+    Within a batch(), the queued commands are sent along in the same exchange.
+    Tested indirectly
+    """
+    queue = _batch["queue"]
+    if queue is not None:
+        _note_callers(1)
+        commands = queue + [command]
+        queue.clear()
+        return _send_queued(commands)[-1]
+    return do(command)
+
+
+def _write_through(tracks: List[Dict]):
+    """
+    Stores the given tracks as the current snapshot. Used after issuing
+    commands whose effect on the track state is known exactly, so the next
+    query doesn't need another GetInfo round trip.
+    """
+    _track_cache["tracks"] = tracks
+    _track_cache["snapshot_generation"] = _track_cache["generation"]
+
+
+def track_runs(tracks: List[int]) -> List[Tuple[int, int]]:
+    """
+    Returns the given track indices as runs of contiguous tracks, i.e. as
+    (first track, track count) tuples.
+    Tested
+    """
+    runs = []
+    for track in sorted(set(tracks)):
+        if runs and runs[-1][0] + runs[-1][1] == track:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((track, 1))
+    return runs
+
+
+def select_tracks_command(first: int, count: int, mode: str) -> str:
+    """
+    Returns the "SelectTracks:" command for a run of count tracks starting at first.
+    Tested
+    """
+    track_count = f" TrackCount={count}" if count > 1 else ""
+    return f"SelectTracks: Track={first}{track_count} Mode={mode}"
+
+
+def plan_selection(current: List[int], target: List[int]) -> List[str]:
+    """
+    Returns the fewest commands turning the current track selection into the
+    target selection. Candidates are:
+        adding what's missing and removing what's surplus (run by run),
+        setting the first run and adding the remaining runs.
+    Contiguous tracks are handled by a single command using TrackCount,
+    hence the cost is O(runs) instead of O(tracks).
+    An unchanged selection costs no command at all.
+    Tested
+    """
+    current, target = set(current), set(target)
+    incremental = [
+        select_tracks_command(first, count, SELECT_MODE_ADD)
+        for first, count in track_runs(target - current)
+    ] + [
+        select_tracks_command(first, count, SELECT_MODE_REMOVE)
+        for first, count in track_runs(current - target)
+    ]
+    target_runs = track_runs(target)
+    if target_runs:
+        replacing = [select_tracks_command(*target_runs[0], SELECT_MODE_SET)] + [
+            select_tracks_command(first, count, SELECT_MODE_ADD)
+            for first, count in target_runs[1:]
+        ]
+    else:
+        replacing = ["SelectNone:"]
+    return min(incremental, replacing, key=len)
+
+
+def do(command: str) -> str:
+    """
+    Sends the given command to Audacity via mod-script-pipe.
+    Invalidates the cached track state unless the command is read-only.
+    Within a batch(), the command is queued and an empty response is returned.
+    All commands issued by this module go through here.
+    Tested indirectly
+    """
+    _note_callers(1)
+    if _batch["queue"] is not None:
+        _batch["queue"].append(command)
+        if not is_read_only_command(command):
+            invalidate_track_cache()
+        return ""
+    try:
+        return _exchange([command])[0]
+    finally:
+        if not is_read_only_command(command):
+            invalidate_track_cache()
 
 
 def is_project_empty() -> bool:
@@ -85,9 +633,19 @@ def is_project_empty() -> bool:
 def get_tracks() -> List[Dict]:
     """
     Returns a list of dicts representing track meta info.
+    Served from the track cache unless a mutating command was sent since the
+    last GetInfo.
     Tested
     """
-    return json.loads(pa.get_info(GET_INFO_TRACKS, GET_INFO_JSON)[: -len(RESPONSE_OK)])
+    if _track_cache["snapshot_generation"] == _track_cache["generation"]:
+        _track_cache["hits"] += 1
+    else:
+        _track_cache["misses"] += 1
+        info = query(f'GetInfo: Type="{GET_INFO_TRACKS}" Format="{GET_INFO_JSON}"')
+        generation = _track_cache["generation"]
+        _track_cache["tracks"] = json.loads(info[: -len(RESPONSE_OK)])
+        _track_cache["snapshot_generation"] = generation
+    return [dict(track) for track in _track_cache["tracks"]]
 
 
 def get_track_count() -> int:
@@ -106,8 +664,8 @@ def make_label_track(label_track_name: str):
     # note:
     # undoing make_label_track will remove the label track
     # issuing redo after this will recreate the label track but not set its name as it was!
-    pa.do("NewLabelTrack:")
-    pa.do(f'SetTrack: Name="{label_track_name}"')
+    do("NewLabelTrack:")
+    do(f'SetTrack: Name="{label_track_name}"')
 
 
 def select_first_audio_track():
@@ -118,12 +676,124 @@ def select_first_audio_track():
     Tested
     """
     first_audio_track = get_track_indices_by_kind(KIND_AUDIO)[0]
-    pa.do(f"SelectTracks: Track={first_audio_track} Mode={SELECT_MODE_SET}")
+    do(f"SelectTracks: Track={first_audio_track} Mode={SELECT_MODE_SET}")
+
+
+def quote(value: str) -> str:
+    """
+    Returns the given value as quoted command parameter value.
+    Tested
+    """
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def get_labels() -> List[Tuple[int, List]]:
+    """
+    Returns (track index, [[start, end, title], ...]) for all label tracks.
+    Tested indirectly
+    """
+    info = query(f'GetInfo: Type="{GET_INFO_LABELS}" Format="{GET_INFO_JSON}"')
+    return [tuple(track) for track in json.loads(info[: -len(RESPONSE_OK)])]
+
+
+def get_label_texts() -> Dict[int, List[List[str]]]:
+    """
+    Returns {track index: [[start, end, title], ...]} for all label tracks,
+    with the numbers as formatted by GetInfo (see is_precise).
+    Tested indirectly
+    """
+    info = query(f'GetInfo: Type="{GET_INFO_LABELS}" Format="{GET_INFO_JSON}"')
+    return {
+        int(index): track_labels
+        for index, track_labels in json.loads(
+            info[: -len(RESPONSE_OK)], parse_float=str, parse_int=str
+        )
+    }
+
+
+def get_label_count() -> int:
+    """
+    Returns the number of labels in all label tracks.
+    Tested
+    """
+    return sum(len(labels) for _, labels in get_labels())
+
+
+def plan_label_fill(labels: lb.Labels, first_label: int) -> List[str]:
+    """
+    Returns the commands filling the focused, empty label track with the given
+    labels. first_label is the project wide index (as used by SetLabel) its
+    first label will get, i.e. the number of labels in the label tracks before.
+    All labels are added behind the last label end (where they don't disturb
+    the order of the labels already set) and then moved to their place in order.
+    Spectral selections aren't supported by SetLabel and get lost.
+    Tested
+    """
+    if not labels:
+        return []
+    parking = max(labels.ends) + 1
+    commands = [f"SelectTime: Start={parking} End={parking} RelativeTo=ProjectStart"]
+    commands += ["AddLabel:"] * len(labels)
+    commands += [
+        f"SetLabel: Label={first_label + i} Text={quote(title)} Start={start} End={end}"
+        for i, (start, end, title) in enumerate(
+            zip(labels.starts, labels.ends, labels.titles)
+        )
+    ]
+    return commands
+
+
+def plan_label_track(
+    new_track: int, first_label: int, label_track_name: str, labels: lb.Labels
+) -> List[str]:
+    """
+    Returns the commands appending a label track with the given name and
+    labels. new_track is the number of tracks before, first_label the number
+    of labels in them (see plan_label_fill).
+    Tested
+    """
+    return [
+        "NewLabelTrack:",
+        select_tracks_command(new_track, 1, SELECT_MODE_SET),
+        f"SetTrack: Focused=1 Name={quote(label_track_name)}",
+    ] + plan_label_fill(labels, first_label)
 
 
-def make_label_track_from_file(label_file: str, label_track_name: str = None):
+def plan_label_import(
+    new_track: int, label_file: str, label_track_name: str, audio_track: int = None
+) -> List[str]:
+    """
+    Returns the commands appending a label track with the given name and the
+    labels of the given file, imported by ImportLabels. new_track is the number
+    of tracks before. The Nyquist plugin needs an audio track's extent selected
+    (see select_first_audio_track). Unlike filling a label track label by label
+    (see plan_label_track), this pushes a single undo state.
+    Tested
+    """
+    commands = []
+    if audio_track is not None:
+        commands += [
+            select_tracks_command(audio_track, 1, SELECT_MODE_SET),
+            "SelTrackStartToEnd:",
+        ]
+    return commands + [
+        f"ImportLabels: fname={quote(str(Path(label_file).expanduser().resolve()))}",
+        select_tracks_command(new_track, 1, SELECT_MODE_SET),
+        f"SetTrack: Focused=1 Name={quote(label_track_name)}",
+    ]
+
+
+def make_label_track_from_file(
+    label_file: str, label_track_name: str = None, native: bool = False
+):
     """
     Makes a new label track from the given file and names the label track according to the given name.
+    The label file is imported by the ImportLabels Nyquist plugin (see README).
+    With native, the labels are added and set by direct commands instead, which
+    doesn't need the plugin, but pushes an undo state (copying all labels) per
+    command, see benchmarks/label_import.py. Either way, the commands are sent
+    pipelined in one batch.
+    Tested
     """
 
     label_track_name = (
@@ -131,14 +801,225 @@ def make_label_track_from_file(label_file: str, label_track_name: str = None):
         if label_track_name
         else re.sub(r"_?label_?", "", Path(label_file).stem)
     )
-    abs_path = Path(label_file).expanduser().resolve()
 
+    with batch(), save_selection():
+        new_track = get_track_count()  # both routes append a label track
+        if native:
+            commands = plan_label_track(
+                new_track,
+                get_label_count(),
+                label_track_name,
+                lb.read_labels(label_file),
+            )
+        else:
+            audio_tracks = get_track_indices_by_kind(KIND_AUDIO)
+            commands = plan_label_import(
+                new_track,
+                label_file,
+                label_track_name,
+                audio_tracks[0] if audio_tracks else None,
+            )
+        for command in commands:
+            do(command)
+
+
+def same_time(text: str, value: float, digits: int = lb.LABEL_DIGITS) -> bool:
+    """
+    Returns true if the given time as formatted by GetInfo is known to be the
+    given value at the precision of label files. A time cut by GetInfo's
+    precision limit (see is_precise) never is: it can't be told apart from
+    times differing by less than what's cut.
+    Tested
+    """
+    return is_precise(text, digits) and (
+        f"{float(text):.{digits}f}" == f"{value:.{digits}f}"
+    )
+
+
+def plan_label_sync(
+    track: int, current: List[List[str]], labels: lb.Labels, first_label: int
+) -> Optional[List[str]]:
+    """
+    Returns the commands turning the labels of the given label track, current
+    as reported by GetInfo Labels (see get_label_texts), into the given labels
+    in place: only labels differing get set, missing labels are added behind
+    the last label end first (see plan_label_fill). Times cut by GetInfo are
+    set in any case (see same_time). first_label is the project wide index of
+    the track's first label.
+    Returns None if the track has more labels than wanted (Audacity can't
+    remove single labels) or the labels wouldn't end up in the given order.
+    SetLabel with Start sorts the track's labels by start, which is simulated
+    to address the labels right.
+    Tested
+    """
+    targets = list(zip(labels.starts, labels.ends, labels.titles))
+    if len(current) > len(targets):
+        return None
+    # [start text, end text, title, target index, start for sorting]
+    simulated = [
+        [start, end, title, i, float(start)]
+        for i, (start, end, title) in enumerate(current)
+    ]
+    commands = []
+    if len(targets) > len(current):
+        parking = max([float(end) for _, end, _ in current] + list(labels.ends)) + 1
+        commands += [
+            select_tracks_command(track, 1, SELECT_MODE_SET),
+            "SetTrack: Focused=1",
+            f"SelectTime: Start={parking} End={parking} RelativeTo=ProjectStart",
+        ]
+        commands += ["AddLabel:"] * (len(targets) - len(current))
+        simulated += [
+            [f"{parking}", f"{parking}", "", i, parking]
+            for i in range(len(current), len(targets))
+        ]
+    for i, (start, end, title) in enumerate(targets):
+        position = next(p for p, label in enumerate(simulated) if label[3] == i)
+        label = simulated[position]
+        parameters = []
+        if label[2] != title:
+            parameters.append(f"Text={quote(title)}")
+        if not same_time(label[0], start):
+            parameters.append(f"Start={start}")
+        if not same_time(label[1], end):
+            parameters.append(f"End={end}")
+        if not parameters:
+            continue
+        commands.append(
+            f"SetLabel: Label={first_label + position} {' '.join(parameters)}"
+        )
+        label[4] = start
+        if not same_time(label[0], start):
+            simulated.sort(key=lambda label: label[4])
+    if [label[3] for label in simulated] != list(range(len(targets))):
+        return None
+    return commands
+
+
+def plan_track_move(track: int, target: int) -> List[str]:
+    """
+    Returns the fewest commands moving the focused track from index track to
+    index target.
+    Tested
+    """
+    if target < track:
+        up = ["TrackMoveUp:"] * (track - target)
+        top = ["TrackMoveTop:"] + ["TrackMoveDown:"] * target
+        return min(up, top, key=len)
+    return ["TrackMoveDown:"] * (target - track)
+
+
+def sync_label_tracks(
+    label_files: List[Tuple[str, str]], verbose: bool = False
+) -> Dict[str, str]:
+    """
+    Brings the label tracks of the open project in line with the given (label
+    file, label track name) pairs, leaving everything else as it is: label
+    tracks are matched by name (repeated names with numeric suffix, see
+    labels.unique_names) and only labels that changed are set, in place (see
+    plan_label_sync). Every AddLabel and SetLabel pushes an undo state copying
+    all labels, so a track is replaced by a new one at its position, imported
+    by ImportLabels (see plan_label_import), if that takes fewer undo states or
+    it can't be changed in place. Label files without track get a new label
+    track at the end. The edits and imports are sent in one pipelined exchange,
+    the moves and removals of replaced tracks in a second one, only once all
+    imports succeeded: a failed import removes what was imported and raises
+    PyAudacityException, leaving the replaced tracks in place.
+    Returns the label track names and what was done: SYNC_UNCHANGED,
+    SYNC_UPDATED, SYNC_REPLACED or SYNC_ADDED.
+    Tested
+    """
+    wanted = {
+        name: (label_file, lb.read_labels(label_file))
+        for label_file, name in label_files
+    }
+    tracks = get_tracks()
+    label_info = get_label_texts()
+    names = get_label_track_names()
+    audio_tracks = get_track_indices_by_kind(KIND_AUDIO)
+    audio_track = audio_tracks[0] if audio_tracks else None
+    track_count = len(tracks)
+    status = {}
+    commands = []
+    replaced = []  # indices of the tracks replaced, in order
+    imports = []  # (label file, track name) imported, replacements first
+    total = 0  # project wide index of the next label track's first label
+    for index, name in names.items():
+        current = label_info.get(index, [])
+        if name not in wanted:
+            total += len(current)
+            continue
+        label_file, labels = wanted[name]
+        moves = plan_track_move(track_count, index + 1)
+        plan = plan_label_sync(index, current, labels, total)
+        # undo states: one per label edit, or importing, each move and removing
+        if plan is None or len(
+            [c for c in plan if c.startswith(("AddLabel:", "SetLabel:"))]
+        ) > 2 + len(moves):
+            replaced.append(index)
+            imports.append((label_file, tracks[index]["name"]))
+            status[name] = SYNC_REPLACED
+            total += len(current)
+            continue
+        status[name] = SYNC_UPDATED if plan else SYNC_UNCHANGED
+        commands += plan
+        total += len(labels)
+    for name, (label_file, _) in wanted.items():
+        if name not in status:
+            imports.append((label_file, name))
+            status[name] = SYNC_ADDED
+    if not commands and not imports:
+        return _report_sync(status, verbose)
     with save_selection():
-        select_first_audio_track()  # needed for nyquist
-        pa.do("SelTrackStartToEnd:")  # needed for nyquist
-        pa.do(f'ImportLabels: fname="{abs_path}"')
-        pa.do(f"SelectTracks: Track={get_track_count() - 1} Mode={SELECT_MODE_SET}")
-        pa.do(f'SetTrack: Name="{label_track_name}"')
+        # the edits address labels by index, which appending tracks keeps
+        failure = None
+        try:
+            with batch():
+                for command in commands:
+                    do(command)
+                for new_track, (label_file, name) in enumerate(imports, track_count):
+                    for command in plan_label_import(
+                        new_track, label_file, name, audio_track
+                    ):
+                        do(command)
+        except pa.PyAudacityException as e:
+            failure = e
+        imported = get_track_count() - track_count if imports else 0
+        if failure or imported != len(imports):
+            # no track was removed yet: drop the imports, keep the originals
+            if imported > 0:
+                send_commands(
+                    [
+                        select_tracks_command(track_count, imported, SELECT_MODE_SET),
+                        "RemoveTracks:",
+                    ]
+                )
+            raise failure or pa.PyAudacityException(
+                f"ImportLabels: {imported} of {len(imports)} label tracks imported."
+            )
+        # each replaced track's import is at track_count when its turn comes
+        with batch():
+            for index in replaced:
+                for command in (
+                    [
+                        select_tracks_command(track_count, 1, SELECT_MODE_SET),
+                        "SetTrack: Focused=1",
+                    ]
+                    + plan_track_move(track_count, index + 1)
+                    + [
+                        select_tracks_command(index, 1, SELECT_MODE_SET),
+                        "RemoveTracks:",
+                    ]
+                ):
+                    do(command)
+    return _report_sync(status, verbose)
+
+
+def _report_sync(status: Dict[str, str], verbose: bool) -> Dict[str, str]:
+    if verbose:
+        for name, done in status.items():
+            print(f"labels: >{name}< {done}")
+    return status
 
 
 def make_label_track_01(label_file: str, label_track_name: str):
@@ -146,19 +1027,16 @@ def make_label_track_01(label_file: str, label_track_name: str):
     Makes a new label track from the given file and names the label track according to the given name.
     Uses an unreliable way, hence use not recommended, but might inspire ideas for other funcs.
     """
-    pa.do("NewLabelTrack:")
-    pa.do(f'SetTrack: Name="{label_track_name}"')
-    count = 1
-    with save_clipboard:
-        with open(label_file) as f:
-            for line in f:
-                s_e_l = line.strip().split("\t")
-                pa.do(
-                    f"SelectTime: Start={s_e_l[0]} End={s_e_l[1]} RelativeTo=ProjectStart"
-                )
-                pyperclip.copy(s_e_l[2] if len(s_e_l) == 3 else str(count))
-                count += 1
-                pa.do("PasteNewLabel:")
+    import pyperclip
+
+    labels = lb.read_labels(label_file)
+    do("NewLabelTrack:")
+    do(f'SetTrack: Name="{label_track_name}"')
+    with save_clipboard():
+        for count, (start, end, title, _, _) in enumerate(labels, 1):
+            do(f"SelectTime: Start={start} End={end} RelativeTo=ProjectStart")
+            pyperclip.copy(title if title else str(count))
+            do("PasteNewLabel:")
 
 
 def get_tracks_by_property(prop: str) -> List[Dict]:
@@ -235,14 +1113,71 @@ def get_muted_track_indices():
     return get_track_indices_by_property(PROPERTY_MUTED)
 
 
+def plan_track_states(
+    tracks: List[Dict], states: Dict[int, Dict[str, bool]]
+) -> List[str]:
+    """
+    Returns the commands turning the given track meta info into the given
+    states, e.g. {1: {"mute": True}, 3: {"solo": False, "selected": True}}.
+    Only changed properties are applied: tracks needing the same change are
+    selected together (see plan_selection) and changed by a single
+    "SetTrack:". Finally the selection is set to the original selection
+    amended by the requested "selected" states.
+    Properties a track doesn't have (e.g. "mute" of a label track) are ignored.
+    Tested
+    """
+    selection = [i for i, track in enumerate(tracks) if track[PROPERTY_SELECTED]]
+    target_selection = set(selection)
+    commands = []
+    for prop, parameter in SET_TRACK_PARAMETERS.items():
+        for value in (True, False):
+            changed = [
+                idx
+                for idx, state in sorted(states.items())
+                if prop in state
+                and prop in tracks[idx]
+                and bool(state[prop]) == value
+                and bool(tracks[idx][prop]) != value
+            ]
+            if changed:
+                commands += plan_selection(selection, changed)
+                commands.append(f"SetTrack: {parameter}={int(value)}")
+                selection = changed
+    for idx, state in states.items():
+        if PROPERTY_SELECTED in state:
+            if state[PROPERTY_SELECTED]:
+                target_selection.add(idx)
+            else:
+                target_selection.discard(idx)
+    return commands + plan_selection(selection, target_selection)
+
+
+def set_track_states(states: Dict[int, Dict[str, bool]]):
+    """
+    Sets mute, solo and selected states of the given tracks, e.g.
+    set_track_states({1: {"mute": True}, 3: {"solo": False, "selected": True}})
+    Takes one snapshot, applies only the needed changes in one batch (see
+    plan_track_states) and writes the result through to the track cache.
+    Tested
+    """
+    with batch():
+        tracks = get_tracks()
+        for command in plan_track_states(tracks, states):
+            do(command)
+        for idx, state in states.items():
+            for prop, value in state.items():
+                if prop in tracks[idx]:
+                    tracks[idx][prop] = int(bool(value))
+        _write_through(tracks)
+
+
 def toggle_solo_track(track: int):
     """
     Toggles solo state of track
     Tested indirectly
     """
-    with save_focus():
-        focus_track(track)
-        pa.do("TrackSolo:")
+    solo = get_tracks()[track].get(PROPERTY_SOLO, 0)
+    set_track_states({track: {PROPERTY_SOLO: not solo}})
 
 
 def solo_track(track: int):
@@ -250,9 +1185,7 @@ def solo_track(track: int):
     Soloes the given track.
     Tested
     """
-    if track in get_solo_track_indices():
-        return
-    toggle_solo_track(track)
+    solo_tracks([track])
 
 
 def solo_tracks(tracks: List[int]):
@@ -260,8 +1193,7 @@ def solo_tracks(tracks: List[int]):
     Soloes the given tracks.
     Tested
     """
-    for track in tracks:
-        solo_track(track)
+    set_track_states({track: {PROPERTY_SOLO: True} for track in tracks})
 
 
 def unsolo_track(track: int):
@@ -269,9 +1201,7 @@ def unsolo_track(track: int):
     Unsoloes the given track.
     Tested
     """
-    if track not in get_solo_track_indices():
-        return
-    toggle_solo_track(track)
+    unsolo_tracks([track])
 
 
 def unsolo_tracks(tracks: List[int]):
@@ -279,47 +1209,33 @@ def unsolo_tracks(tracks: List[int]):
     Unsoloes the given tracks.
     Tested
     """
-    for track in tracks:
-        unsolo_track(track)
+    set_track_states({track: {PROPERTY_SOLO: False} for track in tracks})
 
 
-def focus_track(track: int):
+def focus_track(track: int) -> int:
     """
-    Focuses the given track.
-    Optimizes by finding the closes of first, last, currently focused track to the desired
-    new target track.
+    Focuses the given track and returns the index of the focused track.
+    Addresses the track directly instead of navigating to it: the track is
+    selected, focused via "SetTrack: Focused=1", and the previous selection is
+    restored, all in one pipelined batch (see plan_selection). Hence the cost
+    doesn't depend on the distance to the currently focused track.
+    The resulting focus is written through to the track cache.
     Tested
     """
-    tc = get_track_count()
-    current_track = get_focused_track_index()
-
-    # Calculate distances
-    distance_from_first = track
-    distance_from_last = tc - track - 1
-    distance_from_current = abs(track - current_track)
-
-    # Determine the minimum distance and the corresponding fixpoint
-    if (
-        distance_from_first <= distance_from_last
-        and distance_from_first <= distance_from_current
-    ):
-        pa.do("FirstTrack:")
-        for _ in range(distance_from_first):
-            pa.do("NextTrack:")
-    elif (
-        distance_from_last <= distance_from_first
-        and distance_from_last <= distance_from_current
-    ):
-        pa.do("LastTrack:")
-        for _ in range(distance_from_last):
-            pa.do("PrevTrack:")
-    else:
-        if track > current_track:
-            for _ in range(distance_from_current):
-                pa.do("NextTrack:")
-        elif track < current_track:
-            for _ in range(distance_from_current):
-                pa.do("PrevTrack:")
+    with batch():
+        tracks_info = get_tracks()
+        if tracks_info[track][PROPERTY_FOCUSED]:
+            return track
+        selected = [i for i, t in enumerate(tracks_info) if t[PROPERTY_SELECTED]]
+        for command in plan_selection(selected, [track]):
+            do(command)
+        do("SetTrack: Focused=1")
+        for command in plan_selection([track], selected):
+            do(command)
+        for i, track_info in enumerate(tracks_info):
+            track_info[PROPERTY_FOCUSED] = int(i == track)
+        _write_through(tracks_info)
+    return track
 
 
 def mute_track(track: int):
@@ -327,9 +1243,7 @@ def mute_track(track: int):
     Mutes the given track.
     Tested
     """
-    with save_selection():
-        select_track(track)
-        pa.do("MuteTracks:")
+    mute_tracks([track])
 
 
 def mute_tracks(tracks: List[int]):
@@ -337,9 +1251,7 @@ def mute_tracks(tracks: List[int]):
     Mutes the given tracks.
     Tested
     """
-    with save_selection():
-        select_tracks(tracks)
-        pa.do("MuteTracks:")
+    set_track_states({track: {PROPERTY_MUTED: True} for track in tracks})
 
 
 def unmute_track(track: int):
@@ -347,19 +1259,15 @@ def unmute_track(track: int):
     Unmutes the given track.
     Tested
     """
-    with save_selection():
-        select_track(track)
-        pa.do("UnmuteTracks:")
+    unmute_tracks([track])
 
 
-def unmute_tracks(track: List[int]):
+def unmute_tracks(tracks: List[int]):
     """
     Unmutes the given tracks.
     Tested
     """
-    with save_selection():
-        select_tracks(track)
-        pa.do("UnmuteTracks:")
+    set_track_states({track: {PROPERTY_MUTED: False} for track in tracks})
 
 
 def select_track(track: int):
@@ -367,21 +1275,27 @@ def select_track(track: int):
     Selects track
     Tested
     """
-    unselect_tracks()
-    pa.do(f"SelectTracks: Track={track} Mode={SELECT_MODE_ADD}")
+    select_tracks([track])
 
 
 def select_tracks(tracks: List[int]):
     """
+    Selects exactly the given tracks, using the fewest commands (see plan_selection).
     Parameters to "SelectTracks:" command (see [1]):
     Track - first track to select, tracks are numbered starting from 0
     TrackCount - how many tracks to select
     Mode - either one of SELECT_MODE_SET, SELECT_MODE_ADD, SELECT_MODE_REMOVE
     Tested
     """
-    unselect_tracks()
-    for track in tracks:
-        pa.do(f"SelectTracks: Track={track} Mode={SELECT_MODE_ADD}")
+    tracks = set(tracks)
+    with batch():
+        tracks_info = get_tracks()
+        current = [i for i, track in enumerate(tracks_info) if track[PROPERTY_SELECTED]]
+        for command in plan_selection(current, tracks):
+            do(command)
+        for i, track in enumerate(tracks_info):
+            track[PROPERTY_SELECTED] = int(i in tracks)
+        _write_through(tracks_info)
 
 
 def unselect_track(idx: int):
@@ -389,7 +1303,7 @@ def unselect_track(idx: int):
     See select_tracks.
     Tested
     """
-    pa.do(f"SelectTracks: Track={idx} Mode={SELECT_MODE_REMOVE}")
+    do(f"SelectTracks: Track={idx} Mode={SELECT_MODE_REMOVE}")
 
 
 def unselect_tracks():
@@ -397,7 +1311,7 @@ def unselect_tracks():
     Unselects all tracks.
     Tested
     """
-    pa.do("SelectNone:")
+    do("SelectNone:")
 
 
 def select_tracks_by_kind(kind: str):
@@ -511,7 +1425,7 @@ def remove_selected_tracks():
     Removes selected tracks.
     Tested
     """
-    return pa.do("RemoveTracks:")
+    return do("RemoveTracks:")
 
 
 def undo():
@@ -519,7 +1433,7 @@ def undo():
     Undo
     Tested
     """
-    return pa.do("Undo:")
+    return do("Undo:")
 
 
 def redo():
@@ -527,14 +1441,14 @@ def redo():
     Redo
     Tested
     """
-    return pa.do("Redo:")
+    return do("Redo:")
 
 
 def export_labels():
     """
     Unavoidably interactive.
     """
-    return pa.do("ExportLabels:")
+    return do("ExportLabels:")
 
 
 def export_labels_list(labels: List[int]):
@@ -587,12 +1501,196 @@ def export_selected_or_all_label_tracks():
     export_labels_list(label_track_indices)
 
 
-def import_audio(filename: str):
+def is_precise(text: str, digits: int = lb.LABEL_DIGITS) -> bool:
+    """
+    Returns true if the given number as formatted by GetInfo carries at least
+    the given number of decimals, i.e. GetInfo's precision limit didn't cut it.
+    Tested
+    """
+    value = abs(float(text))
+    if value == 0:
+        return True
+    exponent = math.floor(math.log10(value))
+    return GET_INFO_SIGNIFICANT_DIGITS - 1 - exponent >= digits
+
+
+def resolve_labels(track_labels: List[List[str]]) -> Optional[lb.Labels]:
+    """
+    Returns the labels of one label track of a GetInfo Labels response, given
+    as [start, end, title] with the numbers as formatted by GetInfo, None if
+    GetInfo's precision limit cut any of its times (see is_precise). Cut times
+    can't be told apart from times differing by less than what's cut, so they
+    aren't guessed.
+    Tested
+    """
+    labels = lb.Labels()
+    for start, end, title in track_labels:
+        if not (is_precise(start) and is_precise(end)):
+            return None
+        labels.append(float(start), float(end), title)
+    return labels
+
+
+def get_label_track_names() -> Dict[int, str]:
+    """
+    Returns {track index: name} of all label tracks, label tracks with the
+    same name get a numeric suffix (see labels.unique_names).
+    Tested indirectly
+    """
+    all_tracks = get_tracks()
+    indices = [
+        i for i, track in enumerate(all_tracks) if track[PROPERTY_KIND] == KIND_LABEL
+    ]
+    return dict(zip(indices, lb.unique_names([all_tracks[i]["name"] for i in indices])))
+
+
+def get_default_label_stem() -> str:
+    """
+    Returns the stem of label files: the first audio track's name.
+    Tested indirectly
+    """
+    audio = [
+        track["name"] for track in get_tracks() if track[PROPERTY_KIND] == KIND_AUDIO
+    ]
+    return audio[0] if audio else DEFAULT_LABEL_STEM
+
+
+def write_label_files(
+    tracks: List[int] = None,
+    directory: str = None,
+    stem: str = None,
+    verbose: bool = False,
+) -> Tuple[List[str], List[int]]:
+    """
+    Writes the given label tracks (all if not given) into <name>_<stem>.txt in
+    the given directory (the current one if not given), getting all labels in
+    a single GetInfo Labels exchange. stem defaults to the first audio track's
+    name. Label tracks with the same name get a numeric suffix.
+    Tracks with times cut by GetInfo's precision limit are left out, they need
+    an exact export (see export_label_files).
+    Returns the written file names and the indices of the tracks left out.
+    Tested
+    """
+    label_info = get_label_texts()
+    names = get_label_track_names()
+    stem = stem or get_default_label_stem()
+    target_dir = Path(directory or ".").expanduser()
+    written = []
+    inexact = []
+    for index in label_info if tracks is None else tracks:
+        labels = resolve_labels(label_info[index])
+        if labels is None:
+            inexact.append(index)
+            continue
+        label_file = target_dir / lb.label_file_name(names[index], stem)
+        lb.write_labels(str(label_file), labels)
+        if verbose:
+            print(f"labels: >{names[index]}< ({len(labels)}) -> {label_file}")
+        written.append(str(label_file))
+    return written, inexact
+
+
+def export_label_files(
+    tracks: List[int] = None,
+    directory: str = None,
+    stem: str = None,
+    verbose: bool = False,
+    project: str = None,
+) -> List[str]:
+    """
+    Exports the given label tracks (all if not given) non-interactively, see
+    write_label_files. Tracks whose times are cut by GetInfo's precision limit
+    get an exact export, read from an aup3: the given one, the file the open
+    project was opened from and is unchanged since, or else the project saved
+    into a temporary directory (SaveProject2, like Save As, hence the project
+    window refers to that copy afterwards, which is kept). Only tracks missing
+    from that aup3 go through the interactive export (see export_labels_list).
+    Returns the written file names (not those exported interactively).
+    Tested
+    """
+    written, inexact = write_label_files(tracks, directory, stem, verbose)
+    if inexact:
+        import tempfile
+
+        import aup3
+
+        if project is None:
+            copy_dir = tempfile.mkdtemp(prefix="rebuildap-")
+            project = str(Path(copy_dir) / f"labels.{AUDACITY_EXTENSION}")
+            if verbose:
+                print(f"saving the project as {project} for exact label times")
+            save_project(project)
+        names = get_label_track_names()
+        saved = aup3.get_label_tracks(aup3.read_project_document(project))
+        saved = dict(zip(lb.unique_names([name for name, _ in saved]), saved))
+        target_dir = Path(directory or ".").expanduser()
+        stem = stem or get_default_label_stem()
+        for index in [index for index in inexact if names[index] in saved]:
+            label_file = target_dir / lb.label_file_name(names[index], stem)
+            labels = saved[names[index]][1]
+            label_file.write_text(lb.format_labels(labels), encoding="utf-8")
+            if verbose:
+                print(f"labels: >{names[index]}< ({len(labels)}) -> {label_file}")
+            written.append(str(label_file))
+            inexact.remove(index)
+    if inexact:
+        if verbose:
+            print(f"exporting {len(inexact)} label track(s) interactively (precision)")
+        export_labels_list(inexact)
+    return written
+
+
+def audio_file_names(
+    track_names: List[str], stem: str, extension: str = AUDIO_EXPORT_EXTENSION
+) -> List[str]:
+    """
+    Returns the file names the audio tracks with the given names are exported
+    into: <name>_<stem>.<extension>, the track named stem (the imported song)
+    as ORIGINAL_TRACK_NAME. Tracks with the same name get a numeric suffix.
+    Tested
+    """
+    names = [ORIGINAL_TRACK_NAME if name == stem else name for name in track_names]
+    return [f"{name}_{stem}.{extension}" for name in lb.unique_names(names)]
+
+
+def export_audio_files(files: List[Tuple[int, str]], verbose: bool = False):
+    """
+    Exports each of the given audio tracks into its file, given as (track
+    index, file name) pairs. All commands are sent in a single pipelined
+    exchange: one time selection spanning the project, then per track
+    selecting it alone and exporting it.
+    Tested
+    """
+    if not files:
+        return
+    tracks = get_tracks()
+    end = max(track["end"] for track in tracks)
+    with batch():
+        do(f'SelectTime: Start="0" End="{end}"')
+        for index, filename in files:
+            do(select_tracks_command(index, 1, SELECT_MODE_SET))
+            channels = tracks[index].get("channels", 1)
+            do(f'Export2: Filename="{filename}" NumChannels="{channels}"')
+            if verbose:
+                print(f"audio: >{tracks[index]['name']}< -> {filename}")
+
+
+def import_audio(filename: str, cached: bool = True):
     """
     Imports audio into Audacity.
+    If cached, the audio already decoded is imported instead if it's in the
+    decoded-audio cache, see audio_cache.py.
+    Tested
     """
     abs_path = Path(filename).expanduser().resolve()
-    pa.import_audio(abs_path)
+    if not abs_path.exists():
+        raise pa.PyAudacityException(f"{abs_path} file not found.")
+    source = str(abs_path)
+    if cached:
+        import audio_cache  # only this path needs it
+
+        source = audio_cache.source_for_import(source)
+    do(f'Import2: Filename="{source}"')
 
 
 def open_project(filename: str):
@@ -600,7 +1698,30 @@ def open_project(filename: str):
     Opens the Audacity project given by filename.
     """
     abs_path = Path(filename).expanduser().resolve()
-    pa.do(f'OpenProject2: Filename="{abs_path}"')
+    do(f'OpenProject2: Filename="{abs_path}"')
+
+
+def save_project(filename: str):
+    """
+    Saves the current project as the Audacity project given by filename.
+    """
+    abs_path = Path(filename).expanduser().resolve()
+    do(f'SaveProject2: Filename="{abs_path}"')
+
+
+def new_project():
+    """
+    Opens a new, empty project window, which becomes the target of subsequent commands.
+    """
+    do("New:")
+
+
+def close_project():
+    """
+    Closes the current project window.
+    Audacity prompts for saving unless the project is unchanged since it was saved.
+    """
+    do("Close:")
 
 
 def is_audacity_project(filename: str) -> bool:
@@ -654,12 +1775,90 @@ def reorder_labels(filenames: List[str]) -> List[str]:
     return sorted(filenames, key=get_priority)
 
 
-def open_audio(filename: str, verbose=False):
+class LabelIndex:
+    """
+    Maps the audio stems of a directory to their label files (the files
+    create_labels_glob finds), in import order (see reorder_labels).
+    A directory is scanned in one pass with os.scandir when first looked up
+    and only rescanned after its mtime changed, i.e. label files were added,
+    removed or renamed. So a batch over a large library scans each directory
+    once instead of globbing it per song. Thread safe.
+    """
+
+    def __init__(self, racy_seconds: float = LABEL_INDEX_RACY_SECONDS):
+        self.racy_seconds = racy_seconds
+        self.scans = 0
+        self._directories = {}  # directory: (mtime_ns, racy, {stem: label files})
+        self._lock = threading.Lock()
+
+    def lookup(self, directory: str, stem: str) -> List[str]:
+        """
+        Returns the label files of the audio stem in the given (absolute)
+        directory, in import order.
+        Tested
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            entry = self._directories.get(directory)
+            if entry is None or entry[0] != mtime or entry[1]:
+                # a scan within the mtime's tick might miss later entries
+                racy = time.time_ns() - mtime < self.racy_seconds * 1e9
+                entry = (mtime, racy, self._scan(directory))
+                self._directories[directory] = entry
+        return list(entry[2].get(stem, ()))
+
+    def _scan(self, directory: str) -> Dict[str, List[str]]:
+        self.scans += 1
+        suffix = f".{lb.LABEL_FILE_EXTENSION}"
+        stems = defaultdict(list)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(".") or not name.endswith(suffix):
+                    continue
+                if not entry.is_file():
+                    continue
+                # <name>_<stem>.txt, both may contain "_"
+                base = name[: -len(suffix)]
+                separator = base.find("_")
+                while separator != -1:
+                    stems[base[separator + 1 :]].append(entry.path)
+                    separator = base.find("_", separator + 1)
+        return {stem: reorder_labels(sorted(files)) for stem, files in stems.items()}
+
+
+# label files of the directories looked up so far, kept for the whole run
+_label_index = LabelIndex()
+
+
+def get_label_files(filename: str) -> List[Tuple[str, str]]:
+    """
+    Returns (label file, label track name) of all label files associated with
+    the audio file given by name, in import order (see reorder_labels).
+    The label track name is the label file's stem without "_<audio stem>".
+    Looked up in the label index kept for the whole run (see LabelIndex).
+    Tested
+    """
+    abs_path = Path(filename).expanduser().resolve()
+    stem = abs_path.stem
+    return [
+        (lfile, Path(lfile).stem[: -len(stem) - 1])
+        for lfile in _label_index.lookup(str(abs_path.parent), stem)
+    ]
+
+
+def open_audio(filename: str, verbose=False, label_files: List[Tuple[str, str]] = None):
     """
     Opens the audio file given by name.
     If it's an audacity project, simply opens it.
     If it's any other format, imports it and any
     labels associated with it.
+    label_files are already validated (label file, label track name) pairs,
+    see get_label_files. If they're not given, they're looked up and validated
+    (see labels.read_labels) before anything is sent to Audacity.
     """
     if is_audacity_project(filename):
         if verbose:
@@ -668,15 +1867,16 @@ def open_audio(filename: str, verbose=False):
         if verbose:
             print(f'Done opening "{filename}"')
     else:
+        if label_files is None:
+            label_files = get_label_files(filename)
+            for lfile, _ in label_files:
+                lb.read_labels(lfile)
         if verbose:
             print(f'Importing "{filename}"')
         import_audio(filename)
         if verbose:
             print(f'Done importing "{filename}"')
-        abs_path = Path(filename).expanduser().resolve()
-        label_files = reorder_labels(create_labels_glob(filename))
-        for lfile in label_files:
-            lblname = Path(lfile).stem.replace(f"_{abs_path.stem}", "")
+        for lfile, lblname in label_files:
             if verbose:
                 print(f"labels: >{lblname}<")
             make_label_track_from_file(lfile, lblname)
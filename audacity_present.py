@@ -2,9 +2,11 @@
 
 import os
 import subprocess
+import sys
 import time
+from typing import Callable
 
-import psutil
+import pyaudacity as pa
 import typer
 
 import audacity_funcs as af
@@ -12,9 +14,30 @@ import audacity_funcs as af
 """
 audacity_present.py
 
+Makes sure Audacity is running with an empty project window.
+
+Instead of sleeping for fixed times after starting Audacity or opening a
+window, readiness is probed with bounded exponential backoff: Audacity is
+ready once its script pipe exists and answers a cheap command.
 
 """
 
+# seconds Audacity gets to start and answer on mod-script-pipe
+READY_TIMEOUT = 60.0
+
+# seconds a new project window gets to show up
+WINDOW_TIMEOUT = 10.0
+
+# seconds a single probe gets to be answered
+PROBE_TIMEOUT = 1.0
+
+# first and max pause between probes
+PROBE_INTERVAL = 0.05
+PROBE_INTERVAL_MAX = 1.0
+
+# cheap command answered by Audacity without touching the project
+PROBE_COMMAND = 'Message: Text="rebuildap"'
+
 
 def is_audacity_window_open():
     """
@@ -36,16 +59,88 @@ def is_audacity_window_open():
 
 def is_audacity_running():
     """
-    Returns true if Audacity is running.
+    Returns true if Audacity is running with mod-script-pipe enabled, i.e. has
+    its end of the command pipe open. Doesn't send any command.
+    Tested
+    """
+    if sys.platform == "win32":
+        return os.path.exists(af.PIPE_TO_AUDACITY)
+    try:
+        # fails with ENXIO if nobody has the pipe open for reading
+        os.close(os.open(af.PIPE_TO_AUDACITY, os.O_WRONLY | os.O_NONBLOCK))
+    except OSError:
+        return False
+    return True
+
+
+async def _probe(timeout: float):
+    import audacity_async as aa
+
+    client = aa.AsyncAudacity(timeout)
+    await client.connect(timeout)
+    try:
+        await client.do(PROBE_COMMAND)
+    finally:
+        client.close()
+
+
+def is_audacity_ready(timeout: float = PROBE_TIMEOUT) -> bool:
+    """
+    Returns true if Audacity answers a cheap command on mod-script-pipe
+    within the given seconds.
+    Tested
+    """
+    if not is_audacity_running():
+        return False
+    # imported here: probing is only needed while Audacity starts, the other
+    # paths through this module don't pay for asyncio
+    import asyncio
+
+    try:
+        asyncio.run(_probe(timeout))
+    except pa.PyAudacityException:
+        return False
+    return True
+
+
+def wait_until(condition: Callable[[], bool], timeout: float, what: str) -> float:
+    """
+    Polls the given condition with exponential backoff (PROBE_INTERVAL up to
+    PROBE_INTERVAL_MAX) until it's true and returns the seconds it took.
+    Raises PyAudacityException naming what was waited for after timeout seconds.
+    Tested
+    """
+    start = time.perf_counter()
+    delay = PROBE_INTERVAL
+    while not condition():
+        elapsed = time.perf_counter() - start
+        if elapsed >= timeout:
+            raise pa.PyAudacityException(
+                f"Gave up waiting for {what} after {elapsed:.1f} s."
+            )
+        time.sleep(min(delay, timeout - elapsed))
+        delay = min(delay * 2, PROBE_INTERVAL_MAX)
+    return time.perf_counter() - start
+
+
+def wait_for_audacity(timeout: float = READY_TIMEOUT) -> float:
+    """
+    Waits until Audacity answers on mod-script-pipe (see is_audacity_ready)
+    and returns the seconds it took.
     """
-    for proc in psutil.process_iter(["pid", "name"]):
-        try:
-            # Check if the process name is "Audacity"
-            if "Audacity" in proc.info["name"]:
-                return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-            pass
-    return False
+    return wait_until(
+        is_audacity_ready,
+        timeout,
+        "Audacity to answer on mod-script-pipe (is it enabled in Preferences>Modules?)",
+    )
+
+
+def is_new_project_window_open() -> bool:
+    """
+    Returns true if an Audacity window is open and its project is empty.
+    """
+    af.invalidate_track_cache()  # the window might have been opened by keystroke
+    return is_audacity_window_open() and af.is_project_empty()
 
 
 def start_audacity():
@@ -65,8 +160,11 @@ def bring_audacity_window_to_front_as():
         activate
     end tell
     tell application "System Events"
-        -- Wait a bit for Audacity to become active
-        delay 1
+        -- Wait for Audacity to become active (at most 5 s)
+        repeat 100 times
+            if frontmost of process "Audacity" then exit repeat
+            delay 0.05
+        end repeat
         -- Simulate Cmd+N to open a new project
         keystroke "n" using {command down}
     end tell
@@ -84,31 +182,50 @@ def close_audacity_window_as():
     subprocess.run(["osascript", "-e", script])
 
 
-def assert_audacity_running(verbose: bool = True):
+def assert_audacity_running(verbose: bool = True) -> float:
+    """
+    Starts Audacity unless it's running and waits until it answers on
+    mod-script-pipe. Returns the seconds startup took (0 if it was running).
+    """
     if is_audacity_running():
         if verbose:
             print("Audacity is running.")
-    else:
-        if verbose:
-            print("Audacity is not running. Starting it.")
-        start_audacity()
-        time.sleep(2)  # give it time to start
+        return 0.0
+    if verbose:
+        print("Audacity is not running. Starting it.")
+    start_audacity()
+    elapsed = wait_for_audacity()
+    if verbose:
+        print(f"Audacity started in {elapsed:.2f} s.")
+    return elapsed
 
 
-def assert_audacity_window(verbose: bool = True):
+def assert_audacity_window(verbose: bool = True) -> float:
+    """
+    Makes sure an Audacity window with an empty project is open, waiting for a
+    new one to show up if needed. Returns the seconds that took.
+    """
     if is_audacity_window_open() and af.is_project_empty():
         if verbose:
             print("An Audacity window is open. Will use this.")
-    else:
-        if verbose:
-            print("Bringing Audacity window to the front with a new project.")
-        bring_audacity_window_to_front_as()
-        time.sleep(1)  # give it time
-
-
-def assert_audacity(verbose: bool = True):
-    assert_audacity_running(verbose)
-    assert_audacity_window(verbose)
+        return 0.0
+    if verbose:
+        print("Bringing Audacity window to the front with a new project.")
+    bring_audacity_window_to_front_as()
+    elapsed = wait_until(
+        is_new_project_window_open, WINDOW_TIMEOUT, "a new Audacity window"
+    )
+    if verbose:
+        print(f"New Audacity window ready in {elapsed:.2f} s.")
+    return elapsed
+
+
+def assert_audacity(verbose: bool = True) -> float:
+    """
+    Makes sure Audacity is running with an empty project window.
+    Returns the seconds spent waiting for it.
+    """
+    return assert_audacity_running(verbose) + assert_audacity_window(verbose)
 
 
 def main():
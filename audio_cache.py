@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+
+import freshness
+
+"""
+audio_cache.py
+
+Local cache of decoded audio, so Audacity imports a rebuilt song's audio
+quickly instead of decoding the original (e.g. an hour-long mp3) again.
+
+An entry is the source decoded by ffmpeg to a 32-bit float WAV (Audacity's
+default sample format, at the source's rate), written as RF64 where it
+exceeds the 4 GiB a plain WAV can address (about 3.4 hours of stereo at
+44.1 kHz), which Audacity imports as well; stored as
+<cache>/<source hash>/<source stem>.wav: content addressed by the hash of the
+source (see freshness.input_digest), and named like the source, so the
+imported track gets the same name as if the source had been imported.
+
+On a miss, the source is imported as usual and the entry is filled by a
+background process (running this script), which outlives rebuildap.
+Entries are evicted least recently used first (by modification time, which a
+hit renews) when the cache exceeds MAX_BYTES.
+
+The cache lives in REBUILDAP_AUDIO_CACHE (default ~/.cache/rebuildap/audio),
+REBUILDAP_AUDIO_CACHE_SIZE bounds it in bytes, 0 disables it.
+Without ffmpeg, no entries are filled.
+
+"""
+
+CACHE_DIR = os.environ.get(
+    "REBUILDAP_AUDIO_CACHE",
+    os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "rebuildap",
+        "audio",
+    ),
+)
+
+MAX_BYTES = int(os.environ.get("REBUILDAP_AUDIO_CACHE_SIZE", 20 << 30))
+
+CACHE_EXTENSION = "wav"
+
+# sources Audacity imports without decoding, caching them gains nothing
+DIRECT_EXTENSIONS = {"wav", "aif", "aiff"}
+
+PART_SUFFIX = ".part"
+
+# seconds after which an unfinished entry is considered abandoned
+STALE_PART_SECONDS = 3600
+
+
+def is_enabled() -> bool:
+    return MAX_BYTES > 0
+
+
+def is_cacheable(filename: str) -> bool:
+    """
+    Returns true if the given audio file benefits from the cache.
+    Tested
+    """
+    return Path(filename).suffix[1:].lower() not in DIRECT_EXTENSIONS
+
+
+def entry_path(digest: str, stem: str, cache_dir: Optional[str] = None) -> Path:
+    """
+    Returns the path of the cache entry of a source with the given hash and stem.
+    Tested indirectly
+    """
+    return Path(cache_dir or CACHE_DIR) / digest / f"{stem}.{CACHE_EXTENSION}"
+
+
+def lookup(
+    filename: str, digest: Optional[str] = None, cache_dir: Optional[str] = None
+) -> Optional[str]:
+    """
+    Returns the cache entry of the given source, None if there's none.
+    A hit marks the entry as recently used.
+    Tested
+    """
+    digest = digest or freshness.input_digest(filename)
+    entry = entry_path(digest, Path(filename).stem, cache_dir)
+    try:
+        os.utime(entry)
+    except OSError:
+        return None
+    return str(entry)
+
+
+def decode(source: str, target: str):
+    """
+    Decodes the given source into a 32-bit float WAV file with ffmpeg, RF64
+    if it's too large for a WAV file.
+    """
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-nostdin", "-y", "-i", source, "-map", "0:a:0"]
+        + ["-c:a", "pcm_f32le", "-rf64", "auto", "-f", CACHE_EXTENSION, target],
+        check=True,
+        stdin=subprocess.DEVNULL,
+    )
+
+
+def fill(
+    filename: str,
+    digest: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> Optional[str]:
+    """
+    Decodes the given source into its cache entry unless it's there or being
+    filled already, then evicts entries exceeding max_bytes. Returns the
+    entry, None if it's being filled by someone else.
+    Tested
+    """
+    digest = digest or freshness.input_digest(filename)
+    entry = entry_path(digest, Path(filename).stem, cache_dir)
+    if entry.exists():
+        return str(entry)
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    part = entry.with_name(entry.name + PART_SUFFIX)
+    try:
+        os.close(os.open(part, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        if time.time() - part.stat().st_mtime < STALE_PART_SECONDS:
+            return None
+    try:
+        decode(filename, str(part))
+        os.replace(part, entry)
+    finally:
+        if part.exists():
+            part.unlink()
+    evict(cache_dir, max_bytes)
+    return str(entry)
+
+
+def fill_in_background(filename: str) -> Optional[subprocess.Popen]:
+    """
+    Starts filling the cache entry of the given source in a process of its
+    own, which outlives the caller. Returns None if the entry can't be filled.
+    """
+    if not is_enabled() or not shutil.which("ffmpeg"):
+        return None
+    return subprocess.Popen(
+        [sys.executable, str(Path(__file__).resolve()), filename]
+        + ["--cache-dir", CACHE_DIR, "--max-bytes", str(MAX_BYTES)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def evict(
+    cache_dir: Optional[str] = None, max_bytes: Optional[int] = None
+) -> List[str]:
+    """
+    Removes the least recently used entries until the cache holds at most
+    max_bytes. Returns the removed entries.
+    Tested
+    """
+    cache = Path(cache_dir or CACHE_DIR)
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for entry in cache.glob(f"*/*.{CACHE_EXTENSION}"):
+        try:
+            stat = entry.stat()
+        except OSError:
+            continue  # evicted concurrently
+        entries.append((stat.st_mtime_ns, stat.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            entry.unlink()
+            entry.parent.rmdir()
+        except OSError:
+            pass  # evicted concurrently or other stems of the same source
+        total -= size
+        removed.append(str(entry))
+    return removed
+
+
+def source_for_import(filename: str, digest: Optional[str] = None) -> str:
+    """
+    Returns the file to import for the given audio file: its cache entry on a
+    hit, the file itself otherwise (starting to fill its entry in the
+    background). digest is the file's content hash, if known already.
+    Tested
+    """
+    if not is_enabled() or not is_cacheable(filename):
+        return filename
+    digest = digest or freshness.input_digest(filename)
+    entry = lookup(filename, digest)
+    if entry is not None:
+        return entry
+    fill_in_background(filename)
+    return filename
+
+
+def main(
+    filenames: List[str],
+    max_bytes: int = typer.Option(
+        MAX_BYTES, "-m", "--max-bytes", help="Size bound of the cache."
+    ),
+    cache_dir: str = typer.Option(CACHE_DIR, "-d", "--cache-dir", help="Cache."),
+):
+    """
+    Fills the decoded-audio cache with the given audio files.
+    """
+    for filename in filenames:
+        entry = fill(filename, cache_dir=cache_dir, max_bytes=max_bytes)
+        print(f"{filename}: {entry or 'being filled'}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
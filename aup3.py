@@ -0,0 +1,781 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import wave
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import typer
+
+import labels as lb
+
+"""
+aup3.py
+
+Reads and writes Audacity projects (aup3) without Audacity.
+
+An aup3 is an SQLite database. Its project table holds the project document
+in Audacity's binary XML serialization (see [1]): the "dict" column holds the
+names of tags and attributes, the "doc" column the document referring to them
+by id. Attribute values are stored in binary, e.g. label times as doubles,
+hence they can be read with full precision (unlike GetInfo, see README).
+Audio is stored in the sampleblocks table (see [2]), referenced by the
+waveblock tags of the document.
+
+Writing projects needs numpy (pip install rebuildap[headless]) and, for
+anything but PCM WAV files, ffmpeg/ffprobe to decode the audio.
+The audio is decoded and stored a sample block at a time, so memory doesn't
+grow with the song's length.
+
+References
+[1] https://github.com/audacity/audacity/blob/master/libraries/lib-project-file-io/ProjectSerializer.cpp
+[2] https://github.com/audacity/audacity/blob/master/libraries/lib-project-file-io/SqliteSampleBlock.cpp
+
+"""
+
+# field types of the binary XML serialization, see [1]
+FT_CHAR_SIZE = 0
+FT_START_TAG = 1
+FT_END_TAG = 2
+FT_STRING = 3
+FT_INT = 4
+FT_BOOL = 5
+FT_LONG = 6
+FT_LONG_LONG = 7
+FT_SIZE_T = 8
+FT_FLOAT = 9
+FT_DOUBLE = 10
+FT_DATA = 11
+FT_RAW = 12
+FT_PUSH = 13
+FT_POP = 14
+FT_NAME = 15
+
+# struct formats of numeric field types
+FIELD_FORMATS = {
+    FT_INT: "<i",
+    FT_BOOL: "<B",
+    FT_LONG: "<i",
+    FT_LONG_LONG: "<q",
+    FT_SIZE_T: "<I",
+    FT_FLOAT: "<fi",  # value, digits
+    FT_DOUBLE: "<di",  # value, digits
+}
+
+# string encodings by character size as stored in FT_CHAR_SIZE
+CHAR_ENCODINGS = {1: "utf-8", 2: "utf-16-le", 4: "utf-32-le"}
+
+TAG_PROJECT = "project"
+TAG_LABEL_TRACK = "labeltrack"
+TAG_LABEL = "label"
+TAG_WAVE_TRACK = "wavetrack"
+
+# sqlite pragmas identifying an aup3: "AUDY" and project format version 3.0.0.0
+APPLICATION_ID = 0x41554459
+PROJECT_FORMAT_VERSION = 3 << 24
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS project
+(
+  id                   INTEGER PRIMARY KEY,
+  dict                 BLOB,
+  doc                  BLOB
+);
+CREATE TABLE IF NOT EXISTS autosave
+(
+  id                   INTEGER PRIMARY KEY,
+  dict                 BLOB,
+  doc                  BLOB
+);
+CREATE TABLE IF NOT EXISTS sampleblocks
+(
+  blockid              INTEGER PRIMARY KEY AUTOINCREMENT,
+  sampleformat         INTEGER,
+  summin               REAL,
+  summax               REAL,
+  sumrms               REAL,
+  summary256           BLOB,
+  summary64k           BLOB,
+  samples              BLOB
+);
+"""
+
+# Audacity's floatSample format and the max block size for it (1 MB)
+SAMPLE_FORMAT_FLOAT = 0x0004000F
+MAX_BLOCK_SAMPLES = 262144
+
+# channel attribute of wave tracks
+CHANNEL_LEFT = 0
+CHANNEL_RIGHT = 1
+CHANNEL_MONO = 2
+
+# written into the project tag, Audacity refuses documents without file version
+FILE_FORMAT_VERSION = "1.3.0"
+AUDACITY_VERSION = "3.0.0"
+XML_NAMESPACE = "http://audacity.sourceforge.net/xml/"
+
+HASH_ALGORITHM = "sha256"
+
+
+# wave track attributes not affecting the audio (left out of track digests)
+DISPLAY_ATTRIBUTES = {"name", "height", "minimized", "isSelected", "colorindex"}
+
+
+class Aup3Error(Exception):
+    pass
+
+
+def decode_document(data: bytes) -> ET.Element:
+    """
+    Decodes Audacity's binary XML serialization into an element tree.
+    data is the concatenation of the dict and doc blobs.
+    Attribute values keep their serialized type (str, int, bool, float).
+    Tested
+    """
+    view = memoryview(data)
+    offset = 0
+    encoding = CHAR_ENCODINGS[4]
+    names = {}
+    names_stack = []
+    root = None
+    elements = []
+
+    def unpack(fmt: str):
+        nonlocal offset
+        values = struct.unpack_from(fmt, view, offset)
+        offset += struct.calcsize(fmt)
+        return values
+
+    def read_bytes(length: int) -> bytes:
+        nonlocal offset
+        value = bytes(view[offset : offset + length])
+        offset += length
+        return value
+
+    def current_element(field_type: int) -> ET.Element:
+        if not elements:
+            raise Aup3Error(f"field type {field_type} outside of any tag")
+        return elements[-1]
+
+    try:
+        while offset < len(view):
+            field_type = view[offset]
+            offset += 1
+            if field_type == FT_CHAR_SIZE:
+                encoding = CHAR_ENCODINGS[view[offset]]
+                offset += 1
+            elif field_type == FT_NAME:
+                name_id, length = unpack("<HH")
+                names[name_id] = read_bytes(length).decode(encoding)
+            elif field_type == FT_PUSH:
+                names_stack.append(names)
+                names = {}
+            elif field_type == FT_POP:
+                names = names_stack.pop()
+            elif field_type == FT_START_TAG:
+                (name_id,) = unpack("<H")
+                element = ET.Element(names[name_id])
+                if elements:
+                    elements[-1].append(element)
+                elif root is None:
+                    root = element
+                elements.append(element)
+            elif field_type == FT_END_TAG:
+                unpack("<H")
+                current_element(field_type)
+                elements.pop()
+            elif field_type == FT_STRING:
+                name_id, length = unpack("<Hi")
+                value = read_bytes(length).decode(encoding)
+                current_element(field_type).set(names[name_id], value)
+            elif field_type in FIELD_FORMATS:
+                (name_id,) = unpack("<H")
+                value = unpack(FIELD_FORMATS[field_type])[0]
+                if field_type == FT_BOOL:
+                    value = bool(value)
+                current_element(field_type).set(names[name_id], value)
+            elif field_type in (FT_DATA, FT_RAW):
+                (length,) = unpack("<i")
+                value = read_bytes(length).decode(encoding)
+                if elements:
+                    element = elements[-1]
+                    element.text = (element.text or "") + value
+            else:
+                raise Aup3Error(f"unknown field type {field_type} at {offset - 1}")
+    except (struct.error, KeyError, IndexError, UnicodeDecodeError) as e:
+        raise Aup3Error(f"corrupt project document at {offset}: {e!r}") from e
+
+    if root is None:
+        raise Aup3Error("empty project document")
+    return root
+
+
+def read_project_document(filename: str) -> ET.Element:
+    """
+    Reads the project document of the given aup3 file.
+    Uses the saved document, falling back to the autosaved one.
+    Tested
+    """
+    path = Path(filename).expanduser()
+    if not path.is_file():
+        raise Aup3Error(f"{filename} not found.")
+    uri = f"{path.resolve().as_uri()}?mode=ro"
+    try:
+        with sqlite3.connect(uri, uri=True) as con:
+            for table in ("project", "autosave"):
+                row = con.execute(
+                    f"SELECT dict, doc FROM {table} WHERE id = 1"
+                ).fetchone()
+                if row and row[1]:
+                    return decode_document(bytes(row[0] or b"") + bytes(row[1]))
+    except sqlite3.DatabaseError as e:
+        raise Aup3Error(f"{filename} is not an Audacity project: {e}") from e
+    raise Aup3Error(f"{filename} contains no project document.")
+
+
+def get_label_tracks(
+    project: ET.Element,
+) -> List[Tuple[str, List[Tuple[float, float, str, float, float]]]]:
+    """
+    Returns (name, labels) for all label tracks of the given project document.
+    Labels are (start, end, title, low frequency, high frequency) tuples,
+    frequencies are UNDEFINED_FREQUENCY (see labels) unless the label has a spectral selection.
+    Tested
+    """
+    return [
+        (
+            track.get("name", ""),
+            [
+                (
+                    float(label.get("t", 0.0)),
+                    float(label.get("t1", label.get("t", 0.0))),
+                    label.get("title", ""),
+                    float(label.get("selLow", lb.UNDEFINED_FREQUENCY)),
+                    float(label.get("selHigh", lb.UNDEFINED_FREQUENCY)),
+                )
+                for label in track.iter(TAG_LABEL)
+            ],
+        )
+        for track in project.iter(TAG_LABEL_TRACK)
+    ]
+
+
+def get_wave_track_extents(project: ET.Element) -> List[Tuple[str, int, int, float]]:
+    """
+    Returns (name, rate, channels, seconds) for all wave tracks of the given
+    project document, the channels of a stereo track counting as one track.
+    seconds is the end of the track's last clip.
+    Tested
+    """
+    tracks = []
+    linked = False
+    for track in project.iter(TAG_WAVE_TRACK):
+        rate = int(track.get("rate", 0))
+        seconds = max(
+            (
+                float(clip.get("offset", 0.0))
+                + sum(int(s.get("numsamples", 0)) for s in clip.iter("sequence"))
+                / (rate or 1)
+                for clip in track.iter("waveclip")
+            ),
+            default=0.0,
+        )
+        if linked:
+            name, rate, channels, end = tracks[-1]
+            tracks[-1] = (name, rate, channels + 1, max(end, seconds))
+        else:
+            tracks.append((track.get("name", ""), rate, 1, seconds))
+        linked = not linked and bool(track.get("linked"))
+    return tracks
+
+
+def _digest_track(con: sqlite3.Connection, digest, track: ET.Element):
+    """
+    Feeds the audio of the given wavetrack element into digest: its attributes
+    and those of its clips etc., and the samples of its blocks.
+    """
+    for element in track.iter():
+        attributes = {
+            key: value
+            for key, value in element.attrib.items()
+            if key not in DISPLAY_ATTRIBUTES and key != "blockid"
+        }
+        digest.update(repr((element.tag, sorted(attributes.items()))).encode())
+        block_id = element.get("blockid")
+        if block_id is None:
+            continue
+        if block_id < 0:  # silent block of -blockid samples, see [2]
+            digest.update(repr(("silence", -block_id)).encode())
+            continue
+        row = con.execute(
+            "SELECT samples FROM sampleblocks WHERE blockid = ?", (block_id,)
+        ).fetchone()
+        if row is None:
+            raise Aup3Error(f"sample block {block_id} missing")
+        digest.update(bytes(row[0]))
+
+
+def get_wave_tracks(filename: str) -> List[Tuple[str, str]]:
+    """
+    Returns (name, content digest) for all wave tracks of the given aup3 file,
+    the channels of a stereo track counting as one track. The digest covers
+    the samples and whatever else affects the exported audio (clip offsets,
+    rate, gain, pan, envelopes, ...) but not the track's name or display.
+    Tested
+    """
+    import hashlib  # not needed for exporting labels
+
+    project = read_project_document(filename)
+    uri = f"{Path(filename).expanduser().resolve().as_uri()}?mode=ro"
+    tracks = []
+    linked = False
+    with sqlite3.connect(uri, uri=True) as con:
+        for track in project.iter(TAG_WAVE_TRACK):
+            if not linked:
+                tracks.append((track.get("name", ""), hashlib.new(HASH_ALGORITHM)))
+            _digest_track(con, tracks[-1][1], track)
+            linked = not linked and bool(track.get("linked"))
+    return [(name, digest.hexdigest()) for name, digest in tracks]
+
+
+def export_label_tracks(
+    filename: str,
+    directory: Optional[str] = None,
+    digits: int = lb.LABEL_DIGITS,
+    verbose: bool = False,
+) -> List[str]:
+    """
+    Exports each label track of the given aup3 file into <name>_<stem>.txt,
+    without Audacity. Files are written next to the aup3 unless a directory
+    is given. Label tracks with the same name get a numeric suffix.
+    Returns the written file names.
+    Tested
+    """
+    path = Path(filename).expanduser()
+    target_dir = Path(directory).expanduser() if directory else path.parent
+    project = read_project_document(filename)
+    written = []
+    tracks = get_label_tracks(project)
+    names = lb.unique_names([name for name, _ in tracks])
+    for name, (_, labels) in zip(names, tracks):
+        label_file = target_dir / lb.label_file_name(name, path.stem)
+        label_file.write_text(lb.format_labels(labels, digits), encoding="utf-8")
+        if verbose:
+            print(f"labels: >{name}< ({len(labels)}) -> {label_file}")
+        written.append(str(label_file))
+    return written
+
+
+class _Encoder:
+    """
+    Encodes an element tree into Audacity's binary XML serialization.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.dict = bytearray([FT_CHAR_SIZE, 4])
+        self.doc = bytearray([FT_CHAR_SIZE, 4])
+
+    def name(self, name: str) -> bytes:
+        if name not in self.names:
+            encoded = name.encode(CHAR_ENCODINGS[4])
+            self.names[name] = len(self.names)
+            self.dict += bytes([FT_NAME])
+            self.dict += struct.pack("<HH", self.names[name], len(encoded)) + encoded
+        return struct.pack("<H", self.names[name])
+
+    def element(self, element: ET.Element):
+        self.doc += bytes([FT_START_TAG]) + self.name(element.tag)
+        for key, value in element.attrib.items():
+            if isinstance(value, bool):
+                self.doc += bytes([FT_BOOL]) + self.name(key) + bytes([value])
+            elif isinstance(value, int) and -(2**31) <= value < 2**31:
+                self.doc += bytes([FT_INT]) + self.name(key)
+                self.doc += struct.pack("<i", value)
+            elif isinstance(value, int):
+                self.doc += bytes([FT_LONG_LONG]) + self.name(key)
+                self.doc += struct.pack("<q", value)
+            elif isinstance(value, float):
+                self.doc += bytes([FT_DOUBLE]) + self.name(key)
+                self.doc += struct.pack("<di", value, -1)
+            else:
+                encoded = str(value).encode(CHAR_ENCODINGS[4])
+                self.doc += bytes([FT_STRING]) + self.name(key)
+                self.doc += struct.pack("<i", len(encoded)) + encoded
+        if element.text:
+            encoded = element.text.encode(CHAR_ENCODINGS[4])
+            self.doc += bytes([FT_DATA]) + struct.pack("<i", len(encoded)) + encoded
+        for child in element:
+            self.element(child)
+        self.doc += bytes([FT_END_TAG]) + self.name(element.tag)
+
+
+def encode_document(project: ET.Element) -> Tuple[bytes, bytes]:
+    """
+    Encodes the given element tree into Audacity's binary XML serialization,
+    returns the dict and doc blobs. Attribute values are encoded according to
+    their Python type (see decode_document).
+    Tested
+    """
+    encoder = _Encoder()
+    encoder.element(project)
+    return bytes(encoder.dict), bytes(encoder.doc)
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise Aup3Error(
+            "Writing aup3 files needs numpy: pip install rebuildap[headless]"
+        ) from None
+    return numpy
+
+
+def _pcm_to_float(np, frames: bytes, width: int):
+    """
+    Converts interleaved PCM samples of the given byte width to float32.
+    """
+    if width == 1:
+        return (np.frombuffer(frames, dtype="u1").astype("f4") - 128) / 128
+    if width == 3:
+        raw = np.frombuffer(frames, dtype="u1").reshape(-1, 3)
+        ints = (
+            raw[:, 0].astype("<i4")
+            | (raw[:, 1].astype("<i4") << 8)
+            | (raw[:, 2].astype("<i4") << 16)
+        )
+        return ((ints << 8) >> 8).astype("f4") / 2**23
+    dtype = {2: "<i2", 4: "<i4"}[width]
+    return np.frombuffer(frames, dtype=dtype).astype("f4") / 2 ** (8 * width - 1)
+
+
+def _ffmpeg_blocks(np, filename: str, channels: int, frames: int):
+    """
+    Yields the samples ffmpeg decodes from the given file, frames at a time.
+    """
+    process = subprocess.Popen(
+        ["ffmpeg", "-v", "error", "-nostdin", "-i", filename, "-map", "0:a:0"]
+        + ["-f", "f32le", "-acodec", "pcm_f32le", "-"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        while True:
+            data = process.stdout.read(frames * channels * 4)
+            if not data:
+                break
+            yield np.frombuffer(data, dtype="<f4").reshape(-1, channels)
+        error = process.stderr.read()
+        if process.wait() != 0:
+            raise Aup3Error(f"ffmpeg can't decode {filename}: {error.decode().strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def _wave_blocks(np, w: wave.Wave_read, frames: int):
+    """
+    Yields the samples of the given open PCM WAV file, frames at a time.
+    """
+    with w:
+        channels, width = w.getnchannels(), w.getsampwidth()
+        while True:
+            data = w.readframes(frames)
+            if not data:
+                break
+            yield _pcm_to_float(np, data, width).astype("f4").reshape(-1, channels)
+
+
+def decode_audio_blocks(filename: str, frames: int = MAX_BLOCK_SAMPLES):
+    """
+    Decodes the given audio file block by block, returns (sample rate,
+    channels, blocks) with blocks yielding float32 numpy arrays of shape
+    (frames, channels), the last one shorter. Only a block is held in memory.
+    Uses ffmpeg if available, Python's wave module for PCM WAV otherwise.
+    Tested
+    """
+    np = _numpy()
+    if shutil.which("ffprobe") and shutil.which("ffmpeg"):
+        probe = subprocess.run(
+            [
+                "ffprobe",
+                "-v",
+                "error",
+                "-select_streams",
+                "a:0",
+                "-show_entries",
+                "stream=sample_rate,channels",
+                "-of",
+                "json",
+                filename,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        stream = json.loads(probe.stdout)["streams"][0]
+        rate, channels = int(stream["sample_rate"]), int(stream["channels"])
+        return rate, channels, _ffmpeg_blocks(np, filename, channels, frames)
+    try:
+        w = wave.open(filename, "rb")
+    except (wave.Error, EOFError) as e:
+        raise Aup3Error(f"Can't decode {filename} without ffmpeg: {e}") from e
+    return w.getframerate(), w.getnchannels(), _wave_blocks(np, w, frames)
+
+
+def _summary(np, samples, frame: int):
+    """
+    Returns min, max and rms of each frame of the given samples as float32
+    triplets, like SqliteSampleBlock::CalcSummary (see [2]).
+    """
+    frames = -(-len(samples) // frame)
+    padded = np.zeros(frames * frame, dtype="f4")
+    padded[: len(samples)] = samples
+    counts = np.full(frames, frame, dtype="f8")
+    counts[-1] = len(samples) - (frames - 1) * frame
+    squares = np.square(padded, dtype="f8").reshape(frames, frame).sum(axis=1)
+    summary = np.empty((frames, 3), dtype="<f4")
+    mins = padded.reshape(frames, frame).min(axis=1)
+    maxs = padded.reshape(frames, frame).max(axis=1)
+    # the padding must not show up in the last frame's min/max
+    last = samples[(frames - 1) * frame :]
+    mins[-1], maxs[-1] = last.min(), last.max()
+    summary[:, 0], summary[:, 1] = mins, maxs
+    summary[:, 2] = np.sqrt(squares / counts)
+    return summary
+
+
+def _insert_block(con: sqlite3.Connection, np, samples) -> int:
+    """
+    Inserts a sample block with its summaries, returns its block id.
+    """
+    samples = np.ascontiguousarray(samples, dtype="<f4")
+    summary256 = _summary(np, samples, 256)
+    summary64k = _summary(np, samples, 65536)
+    sumrms = float(np.sqrt(np.square(samples, dtype="f8").mean()))
+    cursor = con.execute(
+        "INSERT INTO sampleblocks (sampleformat, summin, summax, sumrms, "
+        "summary256, summary64k, samples) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            SAMPLE_FORMAT_FLOAT,
+            float(samples.min()),
+            float(samples.max()),
+            sumrms,
+            summary256.tobytes(),
+            summary64k.tobytes(),
+            samples.tobytes(),
+        ),
+    )
+    return cursor.lastrowid
+
+
+def wave_track_element(name: str, rate: int, channel: int) -> ET.Element:
+    """
+    Returns a wavetrack element without clips for the given channel.
+    """
+    return ET.Element(
+        TAG_WAVE_TRACK,
+        {
+            "name": name,
+            "channel": channel,
+            "linked": int(channel == CHANNEL_LEFT),  # with the next, right one
+            "mute": 0,
+            "solo": 0,
+            "height": 150,
+            "minimized": 0,
+            "isSelected": 0,
+            "rate": rate,
+            "gain": 1.0,
+            "pan": 0.0,
+            "colorindex": 0,
+            "sampleformat": SAMPLE_FORMAT_FLOAT,
+        },
+    )
+
+
+def channel_layout(channels: int) -> List[int]:
+    """
+    Returns the channel attribute of the wave track of each of the given
+    number of channels: mono, left and right for stereo, or like Audacity
+    imports more channels, a mono track per channel.
+    Tested
+    """
+    if channels == 2:
+        return [CHANNEL_LEFT, CHANNEL_RIGHT]
+    return [CHANNEL_MONO] * channels
+
+
+def _wave_track(
+    name: str, rate: int, channel: int, blocks: List[Tuple[int, int]], samples: int
+) -> ET.Element:
+    """
+    Returns the wavetrack element of a channel of the given number of samples,
+    stored in the given sample blocks, (start, block id) pairs.
+    """
+    track = wave_track_element(name, rate, channel)
+    clip = ET.SubElement(track, "waveclip", {"offset": 0.0, "colorindex": 0})
+    sequence = ET.SubElement(
+        clip,
+        "sequence",
+        {
+            "maxsamples": MAX_BLOCK_SAMPLES,
+            "sampleformat": SAMPLE_FORMAT_FLOAT,
+            "numsamples": samples,
+        },
+    )
+    for start, block_id in blocks:
+        ET.SubElement(sequence, "waveblock", {"start": start, "blockid": block_id})
+    ET.SubElement(clip, "envelope", {"numpoints": 0})
+    return track
+
+
+def label_track_element(
+    name: str, labels: List[Tuple[float, float, str, float, float]]
+) -> ET.Element:
+    """
+    Returns the labeltrack element for the given labels.
+    """
+    track = ET.Element(
+        TAG_LABEL_TRACK,
+        {
+            "name": name,
+            "numlabels": len(labels),
+            "height": 73,
+            "minimized": 0,
+            "isSelected": 0,
+        },
+    )
+    for start, end, title, low, high in labels:
+        label = ET.SubElement(track, TAG_LABEL, {"t": start, "t1": end})
+        if low != lb.UNDEFINED_FREQUENCY or high != lb.UNDEFINED_FREQUENCY:
+            label.set("selLow", low)
+            label.set("selHigh", high)
+        label.set("title", title)
+    return track
+
+
+def project_element(rate: float) -> ET.Element:
+    """
+    Returns an empty project element of the given sample rate.
+    """
+    project = ET.Element(
+        TAG_PROJECT,
+        {
+            "xmlns": XML_NAMESPACE,
+            "version": FILE_FORMAT_VERSION,
+            "audacityversion": AUDACITY_VERSION,
+            "sel0": 0.0,
+            "sel1": 0.0,
+            "vpos": 0,
+            "h": 0.0,
+            "rate": float(rate),
+            "snapto": "off",
+        },
+    )
+    ET.SubElement(project, "tags")
+    return project
+
+
+def _write_database(filename: str, fill):
+    """
+    Writes an aup3 file: creates the database in a temporary file, calls fill
+    with the connection to store the project (within a transaction) and
+    replaces filename only when complete. Returns the path written.
+    """
+    path = Path(filename).expanduser()
+    tmp = path.with_name(f".{path.name}.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    con = sqlite3.connect(tmp)
+    try:
+        with con:
+            con.execute(f"PRAGMA application_id = {APPLICATION_ID}")
+            con.execute(f"PRAGMA user_version = {PROJECT_FORMAT_VERSION}")
+            con.executescript(SCHEMA)
+            fill(con)
+    finally:
+        con.close()
+    os.replace(tmp, path)
+    return path
+
+
+def _insert_document(con: sqlite3.Connection, project: ET.Element):
+    dict_blob, doc_blob = encode_document(project)
+    con.execute(
+        "INSERT INTO project (id, dict, doc) VALUES (1, ?, ?)", (dict_blob, doc_blob)
+    )
+
+
+def write_document(filename: str, project: ET.Element):
+    """
+    Writes an aup3 file holding just the given project document (see
+    project_element), e.g. label tracks, or wave tracks without audio.
+    Tested indirectly
+    """
+    _write_database(filename, lambda con: _insert_document(con, project))
+
+
+def write_project(
+    filename: str,
+    audio_file: str,
+    label_files: List[Tuple[str, str]],
+    verbose: bool = False,
+):
+    """
+    Writes an aup3 file from the given audio file and (label file, label
+    track name) pairs, without Audacity. The audio track is named after the
+    audio file's stem, like Audacity names imported tracks (see channel_layout
+    for files of more than two channels). The audio is decoded and stored
+    block by block. Label tracks follow in the given order. The aup3 is
+    written to a temporary file first and replaces filename only when complete.
+    Tested
+    """
+    np = _numpy()
+    rate, channels, blocks = decode_audio_blocks(str(Path(audio_file).expanduser()))
+    if verbose:
+        print(f"decoding {audio_file}: {channels} channel(s), {rate} Hz")
+    project = project_element(rate)
+
+    def fill(con: sqlite3.Connection):
+        stored = [[] for _ in range(channels)]  # (start, block id) per channel
+        samples = 0
+        for block in blocks:
+            for channel in range(channels):
+                block_id = _insert_block(con, np, block[:, channel])
+                stored[channel].append((samples, block_id))
+            samples += len(block)
+        stem = Path(audio_file).stem
+        for channel, channel_blocks in zip(channel_layout(channels), stored):
+            project.append(_wave_track(stem, rate, channel, channel_blocks, samples))
+        for label_file, name in label_files:
+            labels = lb.read_labels(label_file)
+            if verbose:
+                print(f"labels: >{name}< ({len(labels)})")
+            project.append(label_track_element(name, labels))
+        _insert_document(con, project)
+
+    path = _write_database(filename, fill)
+    if verbose:
+        print(f"wrote {path}")
+
+
+def main(filename: str):
+    """
+    Exports the label tracks of the given aup3 file.
+    """
+    export_label_tracks(filename, verbose=True)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+import typer
+
+"""
+import_time.py
+
+Tracks what rebuildap's code paths pay for imports, measured with
+python -X importtime in fresh interpreters:
+    startup: the CLI itself, i.e. --help and what every path pays
+    client: the thin client forwarding to rebuildapd
+    label: rebuildap -l, importing a label file into the open project
+    aup3: exporting the label tracks of an aup3 file
+    batch: rebuildap --batch
+
+Per path, the modules imported and the median cumulative import time are
+compared against the baseline stored next to this script: a path importing a
+module its baseline doesn't, or importing more than TOLERANCE slower, fails
+the run. Only rebuildap's own modules and the HEAVY_MODULES packages count:
+which standard library and other modules a dependency pulls in depends on
+the Python and package versions installed. Update the baseline with --update
+after intended changes.
+
+"""
+
+ROOT = Path(__file__).resolve().parent.parent
+
+BASELINE = Path(__file__).resolve().parent / "import_time_baseline.json"
+
+# modules imported by each code path
+PATHS = {
+    "startup": ["rebuildap"],
+    "client": ["rebuildap_client"],
+    "label": ["rebuildap", "audacity_funcs", "labels"],
+    "aup3": ["rebuildap", "audacity_funcs", "aup3"],
+    "batch": ["rebuildap", "audacity_funcs", "rebuild_batch"],
+}
+
+# third-party packages worth keeping off a path, tracked as a whole
+HEAVY_MODULES = ("pyaudacity", "typer", "psutil", "numpy")
+
+RUNS = 5
+
+# relative slowdown against the baseline failing the run
+TOLERANCE = 0.5
+
+
+def measure(modules: List[str]) -> Dict:
+    """
+    Imports the given modules in a fresh interpreter and returns the
+    cumulative import time in microseconds and the names of all modules
+    imported (the interpreter's own startup imports excluded).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        imported.append(name.strip())
+        if len(name) - len(name.lstrip()) == 1:  # top level import
+            total += int(cumulative)
+    return {"microseconds": total, "modules": imported}
+
+
+def tracked_modules(modules: List[str]) -> List[str]:
+    """
+    Returns the given modules that are rebuildap's own (the scripts in ROOT)
+    or belong to a HEAVY_MODULES package (given by its name), sorted.
+    Tested
+    """
+    own = {path.stem for path in ROOT.glob("*.py")}
+    tracked = set()
+    for module in modules:
+        package = module.split(".")[0]
+        if package in HEAVY_MODULES:
+            tracked.add(package)
+        elif package in own:
+            tracked.add(module)
+    return sorted(tracked)
+
+
+def run_paths(runs: int = RUNS) -> Dict[str, Dict]:
+    """
+    Returns median import time and imported modules (see tracked_modules)
+    per code path.
+    """
+    results = {}
+    for path, modules in PATHS.items():
+        measurements = [measure(modules) for _ in range(runs)]
+        results[path] = {
+            "microseconds": int(
+                statistics.median(m["microseconds"] for m in measurements)
+            ),
+            "modules": tracked_modules(measurements[0]["modules"]),
+        }
+    return results
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float = TOLERANCE) -> List[str]:
+    """
+    Returns the regressions of results against the baseline: tracked modules
+    (see tracked_modules) not imported in the baseline and import times
+    exceeding it by more than tolerance.
+    Tested
+    """
+    regressions = []
+    for path, result in results.items():
+        expected = baseline.get(path)
+        if expected is None:
+            continue
+        new = sorted(
+            set(tracked_modules(result["modules"]))
+            - set(tracked_modules(expected["modules"]))
+        )
+        if new:
+            regressions.append(f"{path}: imports {', '.join(new)}")
+        limit = expected["microseconds"] * (1 + tolerance)
+        if result["microseconds"] > limit:
+            regressions.append(
+                f"{path}: {result['microseconds'] / 1000:.1f} ms"
+                f" > baseline {expected['microseconds'] / 1000:.1f} ms"
+            )
+    return regressions
+
+
+def main(
+    runs: int = typer.Option(RUNS, "-r", "--runs", help="Measurements per path."),
+    tolerance: float = typer.Option(
+        TOLERANCE, "-t", "--tolerance", help="Relative slowdown failing the run."
+    ),
+    update: bool = typer.Option(
+        False, "-u", "--update", help="Store the results as baseline."
+    ),
+    baseline_file: Path = typer.Option(
+        BASELINE, "-b", "--baseline", help="Baseline file."
+    ),
+):
+    """
+    Prints the import time and module count per code path and fails on
+    regressions against the baseline.
+    """
+    baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+    results = run_paths(runs)
+    print(f"{'path':<8}  {'ms':>7}  {'baseline':>8}  {'modules':>7}")
+    for path, result in results.items():
+        expected = baseline.get(path, {})
+        print(
+            f"{path:<8}  {result['microseconds'] / 1000:7.1f}"
+            f"  {expected.get('microseconds', 0) / 1000:8.1f}"
+            f"  {len(result['modules']):>7}"
+        )
+    if update:
+        baseline_file.write_text(json.dumps(results, indent=1) + "\n")
+        print(f"Baseline written to {baseline_file}")
+        return
+    regressions = compare(results, baseline, tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+import functools
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import typer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import audacity_funcs as af  # noqa: E402
+import audacity_present as ap  # noqa: E402
+import labels as lb  # noqa: E402
+
+"""
+label_import.py
+
+Compares the label import routes into the running Audacity:
+    nyquist: make_label_track_from_file (ImportLabels Nyquist plugin, see README)
+    native: make_label_track_from_file with native (batched AddLabel/SetLabel)
+
+for small, medium and large (beat track sized) label files.
+Every imported label track is removed again afterwards.
+
+"""
+
+SIZES = {"small": 100, "medium": 5_000, "large": 50_000}
+
+# seconds between two generated labels, i.e. 120 bpm
+LABEL_SPACING = 0.5
+
+ROUTES = {
+    "nyquist": af.make_label_track_from_file,
+    "native": functools.partial(af.make_label_track_from_file, native=True),
+}
+
+
+def write_label_file(directory: str, count: int) -> str:
+    """
+    Writes a label file with count beat labels and returns its name.
+    """
+    filename = str(Path(directory) / f"beat{count}_bench.txt")
+    lb.write_labels(
+        filename,
+        lb.Labels(
+            (i * LABEL_SPACING, i * LABEL_SPACING, str(i % 4 + 1)) for i in range(count)
+        ),
+    )
+    return filename
+
+
+def time_import(route: Callable, filename: str) -> float:
+    """
+    Returns the seconds the given route takes to import the given label file.
+    Removes the imported label track again.
+    """
+    track = af.get_track_count()
+    start = time.perf_counter()
+    route(filename, "bench")
+    elapsed = time.perf_counter() - start
+    with af.batch():
+        af.select_tracks([track])
+        af.remove_selected_tracks()
+    return elapsed
+
+
+def main(
+    sizes: List[str] = typer.Option(
+        list(SIZES), "-s", "--size", help="Label file sizes."
+    ),
+    routes: List[str] = typer.Option(
+        list(ROUTES), "-r", "--route", help="Import routes."
+    ),
+):
+    """
+    Prints the import time per route and label file size.
+    """
+    ap.assert_audacity(False)
+    if not af.get_audio_tracks():  # the Nyquist plugin needs an audio track
+        af.do("NewMonoTrack:")
+        af.do('SelectTime: Start="0" End="1"')
+        af.do('Noise: Type="Brownian" Amplitude="0.8"')
+    print(f"{'size':<8}  {'labels':>7}  " + "  ".join(f"{r:>9}" for r in routes))
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            filename = write_label_file(directory, SIZES[size])
+            times = [time_import(ROUTES[route], filename) for route in routes]
+            print(
+                f"{size:<8}  {SIZES[size]:>7}  "
+                + "  ".join(f"{seconds:9.3f}" for seconds in times)
+            )
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+
+import json
+import struct
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import typer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import audacity_funcs as af  # noqa: E402
+import audacity_present as ap  # noqa: E402
+import fake_audacity  # noqa: E402
+import labels as lb  # noqa: E402
+
+"""
+roundtrips.py
+
+Counts what the high-level operations cost on mod-script-pipe for projects of
+several sizes (number of tracks, half of them label tracks):
+    open_audio: import an audio file with its label files
+    focus_track: focus the last, the first and the middle track
+    solo_tracks: solo all audio tracks and unsolo them again
+    export_label_tracks: export all label tracks via ExportLabels, one by one
+        (interactive in Audacity, hence measured against the fake only)
+    write_label_files: write the label tracks GetInfo reports exactly into
+        label files (none: the labels span minutes, see af.is_precise)
+    export_label_files: the same, plus the fallback for the others, reading
+        them from the project saved as a copy
+
+and records exchanges (round trips, a pipelined batch is one), commands sent,
+GetInfo commands among them, and wall time per operation (see
+af.get_pipe_stats). Against the fake, also the undo states Audacity pushes and
+the labels it copies into them, the hidden cost of editing labels one by one
+(see fake_audacity.py). Every operation starts with a cold track cache.
+
+The counts are compared against the baseline stored next to this script:
+any count above its baseline fails the run. Wall times are informative only.
+Update the baseline with --update after intended changes.
+
+Runs against an in-process fake Audacity (see fake_audacity.py) unless
+--audacity is given.
+
+"""
+
+SIZES = [4, 40, 400]
+
+BASELINE = Path(__file__).resolve().parent / "roundtrips_baseline.json"
+
+COUNTS = ("exchanges", "commands", "get_info", "undo_states", "undo_labels")
+
+# counts only the fake knows
+UNDO_COUNTS = ("undo_states", "undo_labels")
+
+# labels per generated label file, spread over a song of SONG_SECONDS
+LABELS_PER_FILE = 8
+
+SONG_SECONDS = 240
+
+# of the generated audio file, low to keep a 400 track project small
+SONG_RATE = 8000
+
+AUDIO_STEM = "bench"
+
+
+def write_audio_file(directory: str, seconds: float = SONG_SECONDS) -> str:
+    """
+    Writes a silent mono PCM WAV file and returns its name.
+    """
+    filename = str(Path(directory) / f"{AUDIO_STEM}.wav")
+    with wave.open(filename, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SONG_RATE)
+        w.writeframes(struct.pack("<h", 0) * int(SONG_RATE * seconds))
+    return filename
+
+
+def write_label_files(directory: str, count: int) -> List:
+    """
+    Writes count label files for the audio file and returns the
+    (label file, label track name) pairs.
+    """
+    label_files = []
+    step = SONG_SECONDS / LABELS_PER_FILE
+    for i in range(count):
+        name = f"track{i}"
+        filename = str(Path(directory) / lb.label_file_name(name, AUDIO_STEM))
+        starts = [round(j * step + i * 0.012345, 6) for j in range(LABELS_PER_FILE)]
+        lb.write_labels(
+            filename,
+            lb.Labels(
+                (start, round(start + step / 2, 6), f"{name}.{j}")
+                for j, start in enumerate(starts)
+            ),
+        )
+        label_files.append((filename, name))
+    return label_files
+
+
+def measure(operation: Callable, *args) -> Dict:
+    """
+    Runs the given operation with a cold track cache and returns its counts
+    and wall time.
+    """
+    fake = fake_audacity.running()
+    undo_stats = dict(fake.undo_stats) if fake else {}
+    af.invalidate_track_cache()
+    af.reset_pipe_stats()
+    start = time.perf_counter()
+    operation(*args)
+    result = {"seconds": time.perf_counter() - start}
+    result.update(af.get_pipe_stats())
+    if fake is not None:
+        for count in UNDO_COUNTS:
+            result[count] = fake.undo_stats[count] - undo_stats.get(count, 0)
+    return result
+
+
+def focus_tracks(tracks: List[int]):
+    for track in tracks:
+        af.focus_track(track)
+
+
+def solo_and_unsolo(tracks: List[int]):
+    af.solo_tracks(tracks)
+    af.unsolo_tracks(tracks)
+
+
+def run_size(size: int) -> Dict[str, Dict]:
+    """
+    Builds a project with size tracks in a new project window, measures the
+    operations on it and closes the window again.
+    """
+    results = {}
+    af.new_project()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            audio = write_audio_file(directory)
+            label_files = write_label_files(directory, size // 2)
+            results["open_audio"] = measure(af.open_audio, audio, False, label_files)
+            for _ in range(size - 1 - size // 2):  # not measured
+                af.import_audio(audio)
+            results["focus_track"] = measure(focus_tracks, [size - 1, 0, size // 2])
+            results["solo_tracks"] = measure(
+                solo_and_unsolo, af.get_audio_track_indices()
+            )
+            if fake_audacity.running() is not None:
+                results["export_label_tracks"] = measure(af.export_label_tracks)
+            results["write_label_files"] = measure(
+                af.write_label_files, None, directory, AUDIO_STEM
+            )
+            # the copy export_label_files saves goes to the temporary directory
+            tempdir, tempfile.tempdir = tempfile.tempdir, directory
+            try:
+                results["export_label_files"] = measure(
+                    af.export_label_files, None, directory, AUDIO_STEM
+                )
+            finally:
+                tempfile.tempdir = tempdir
+    finally:
+        af.close_project()
+    return results
+
+
+def compare(results: Dict, baseline: Dict) -> List[str]:
+    """
+    Returns the counts of results exceeding their baseline.
+    Tested
+    """
+    regressions = []
+    for size, operations in results.items():
+        for operation, result in operations.items():
+            expected = baseline.get(size, {}).get(operation)
+            if expected is None:
+                continue
+            for count in COUNTS:
+                if count not in result or count not in expected:
+                    continue
+                if result[count] > expected[count]:
+                    regressions.append(
+                        f"{operation} ({size} tracks): {count} {result[count]}"
+                        f" > baseline {expected[count]}"
+                    )
+    return regressions
+
+
+def format_results(results: Dict, baseline: Dict) -> str:
+    """
+    Returns a table of the results, counts with their baseline in parentheses.
+    """
+    lines = [
+        f"{'tracks':>6}  {'operation':<20}"
+        + "".join(f"{count:>16}" for count in COUNTS)
+        + f"{'seconds':>10}"
+    ]
+    for size, operations in results.items():
+        for operation, result in operations.items():
+            expected = baseline.get(size, {}).get(operation, {})
+            lines.append(
+                f"{size:>6}  {operation:<20}"
+                + "".join(
+                    f"{result.get(count, '-'):>8} ({expected.get(count, '-'):>5})"
+                    for count in COUNTS
+                )
+                + f"{result['seconds']:10.3f}"
+            )
+    return "\n".join(lines)
+
+
+def main(
+    sizes: List[int] = typer.Option(
+        SIZES, "-s", "--size", help="Project sizes (tracks)."
+    ),
+    audacity: bool = typer.Option(
+        False,
+        "-a",
+        "--audacity",
+        help="Run against the running Audacity instead of the fake.",
+    ),
+    latency: float = typer.Option(
+        0.0, "-l", "--latency", help="Seconds the fake Audacity takes per command."
+    ),
+    update: bool = typer.Option(
+        False, "-u", "--update", help="Store the results as baseline."
+    ),
+    baseline_file: Path = typer.Option(
+        BASELINE, "-b", "--baseline", help="Baseline file."
+    ),
+):
+    """
+    Prints the mod-script-pipe cost of the high-level operations per project
+    size and fails if a count exceeds the baseline.
+    """
+    baseline = json.loads(baseline_file.read_text()) if baseline_file.exists() else {}
+    fake = None
+    if audacity:
+        ap.assert_audacity(False)
+    else:
+        fake = fake_audacity.FakeAudacity(latency)
+        fake.start()
+    try:
+        results = {str(size): run_size(size) for size in sizes}
+    finally:
+        af.disconnect()
+        if fake is not None:
+            fake.stop()
+    print(format_results(results, baseline))
+    if update:
+        stored = {
+            size: {
+                operation: {count: result[count] for count in COUNTS if count in result}
+                for operation, result in operations.items()
+            }
+            for size, operations in results.items()
+        }
+        baseline_file.write_text(json.dumps({**baseline, **stored}, indent=2) + "\n")
+        print(f"Baseline written to {baseline_file}")
+        return
+    regressions = compare(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}", file=sys.stderr)
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
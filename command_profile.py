@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+import json
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List
+
+import typer
+
+import audacity_funcs as af
+
+"""
+command_profile.py
+
+Where does the time of a rebuild go? Records every command sent over
+mod-script-pipe (see af.start_profiling), writes them as JSON trace and sums
+them up per calling function and per command, e.g. Import2 (Audacity
+decoding the audio) vs. AddLabel/SetLabel (label import) vs. GetInfo. What's
+not spent on the pipe is spent in Python (parsing label files and GetInfo
+responses, hashing, imports).
+
+"""
+
+TRACE_VERSION = 1
+
+
+def summarize(records: List[Dict], key: str = "function") -> List[Dict]:
+    """
+    Sums up the given command records (see af.stop_profiling) per function
+    (or per command, with key="command"), most expensive first.
+    Tested
+    """
+    sums = defaultdict(
+        lambda: {"commands": 0, "seconds": 0.0, "max_latency": 0.0, "bytes": 0}
+    )
+    for record in records:
+        entry = sums[record[key]]
+        entry["commands"] += 1
+        entry["seconds"] += record["seconds"]
+        entry["max_latency"] = max(entry["max_latency"], record["latency"])
+        entry["bytes"] += record["bytes"]
+    summary = [{key: name, **entry} for name, entry in sums.items()]
+    summary.sort(key=lambda entry: entry["seconds"], reverse=True)
+    return summary
+
+
+def format_summary(summary: List[Dict], wall: float, key: str = "function") -> str:
+    """
+    Returns the given summary as table, with the time spent outside
+    mod-script-pipe (wall time minus the time Audacity was busy) as last line.
+    Tested
+    """
+    width = max([len(key)] + [len(entry[key]) for entry in summary])
+    lines = [
+        f"{key:<{width}}  {'commands':>8}  {'seconds':>8}  {'share':>6}"
+        f"  {'max latency':>11}  {'bytes':>9}"
+    ]
+    for entry in summary:
+        share = entry["seconds"] / wall if wall else 0.0
+        lines.append(
+            f"{entry[key]:<{width}}  {entry['commands']:>8}  {entry['seconds']:8.3f}"
+            f"  {share:6.1%}  {entry['max_latency']:11.3f}  {entry['bytes']:>9}"
+        )
+    outside = wall - sum(entry["seconds"] for entry in summary)
+    share = outside / wall if wall else 0.0
+    lines.append(
+        f"{'(outside mod-script-pipe)':<{width}}  {'':>8}  {outside:8.3f}  {share:6.1%}"
+    )
+    return "\n".join(lines)
+
+
+def write_trace(filename: str, records: List[Dict], wall: float):
+    """
+    Writes the given command records with their summaries as JSON trace.
+    Tested indirectly
+    """
+    trace = {
+        "version": TRACE_VERSION,
+        "wall_seconds": wall,
+        "pipe_seconds": sum(record["seconds"] for record in records),
+        "functions": summarize(records),
+        "commands": summarize(records, "command"),
+        "trace": records,
+    }
+    with open(filename, "w") as f:
+        json.dump(trace, f, indent=1)
+
+
+@contextmanager
+def profile(trace_file: str = None):
+    """
+    Profiles the commands sent within the block, writes the trace to the given
+    file and prints the summaries when the block is left.
+    Does nothing if no trace file is given.
+    Tested
+    """
+    if not trace_file:
+        yield
+        return
+    af.start_profiling()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        records = af.stop_profiling()
+        write_trace(trace_file, records, wall)
+        print(format_summary(summarize(records), wall))
+        print()
+        print(format_summary(summarize(records, "command"), wall, "command"))
+        print(f"\n{len(records)} commands in {wall:.3f} s, trace: {trace_file}")
+
+
+def main(trace_file: str):
+    """
+    Prints the summaries of the given trace.
+    """
+    with open(trace_file) as f:
+        trace = json.load(f)
+    print(format_summary(trace["functions"], trace["wall_seconds"]))
+    print()
+    print(format_summary(trace["commands"], trace["wall_seconds"], "command"))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,739 @@
+#!/usr/bin/env python
+
+import errno
+import json
+import os
+import re
+import select
+import stat
+import threading
+import time
+import wave
+import xml.etree.ElementTree as ET
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import typer
+
+import audacity_funcs as af
+import aup3
+import labels as lb
+
+"""
+fake_audacity.py
+
+Stand-in for Audacity speaking the mod-script-pipe protocol over the named
+pipes (af.PIPE_TO_AUDACITY, af.PIPE_FROM_AUDACITY), so audacity_funcs and
+friends can be tested and benchmarked without a GUI, e.g. on Linux CI.
+
+Keeps an in-memory model of the projects: tracks (name, kind, selection,
+focus, mute/solo, extent), their labels, the time selection and the undo
+history. Covers the commands used by rebuildap, see FakeAudacity.COMMANDS.
+Unknown commands fail like in Audacity.
+
+As in Audacity, creating, importing and removing tracks and editing labels
+push an undo state, while selecting, focusing and SetTrack modify the current
+state in place (e.g. redoing NewLabelTrack brings back the track without the
+name SetTrack gave it). Like Audacity, every undo state holds a copy of all
+labels, so filling a label track label by label (AddLabel, SetLabel) costs
+time and memory quadratic in its labels. FakeAudacity.undo_stats counts the
+undo states pushed and the labels copied into them, see running().
+Closing a project with changes since it was saved, which Audacity answers
+with a modal prompt, is counted in FakeAudacity.save_prompts.
+
+Each command can be given a latency (seconds slept before answering) to
+mimic Audacity's response times, and commands can be made to fail (e.g. an
+ImportLabels or Import2 of a file Audacity can't read) to test error paths.
+
+Unix only. Run in-process (with FakeAudacity(): ...) or standalone (see main).
+
+"""
+
+RESPONSE_OK = "BatchCommand finished: OK\n"
+RESPONSE_FAILED = "BatchCommand finished: Failed!\n"
+
+# seconds the server waits for a command before checking whether it's stopped
+POLL_INTERVAL = 0.1
+
+# name of the tracks created by NewLabelTrack, NewMonoTrack and NewStereoTrack
+NEW_LABEL_TRACK_NAME = "Label"
+NEW_AUDIO_TRACK_NAME = "Audio"
+
+# commands generating audio into the time selection of the selected audio tracks
+GENERATORS = ("Noise", "Tone", "Chirp", "DTMFTones", "Silence")
+
+# fakes started in this process, see running()
+_running = []
+
+# sample rate of the (silent) audio files written by Export2
+EXPORT_RATE = 8000
+
+PARAMETER_PATTERN = re.compile(r'(\w+)=("(?:[^"\\]|\\.)*"|\S*)')
+
+
+class CommandFailed(Exception):
+    pass
+
+
+def parse_command(command: str):
+    """
+    Returns name and parameters of the given scripting command.
+    Tested
+    """
+    name, _, parameters = command.strip().partition(":")
+    name, _, rest = name.strip().partition(" ")
+    parameters = f"{rest} {parameters}"
+    result = {}
+    for key, value in PARAMETER_PATTERN.findall(parameters):
+        if value.startswith('"'):
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        result[key] = value
+    return name, result
+
+
+def to_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def format_number(value: float) -> str:
+    """
+    Formats the given number like Audacity's GetInfo (printf's %g).
+    """
+    return "%g" % value
+
+
+class Project:
+    """
+    In-memory project: tracks with their labels, focus, time selection and undo
+    history.
+    """
+
+    def __init__(self, stats: Counter = None):
+        self.tracks = []
+        self.focus = None  # id of the focused track
+        self.t0 = 0.0
+        self.t1 = 0.0
+        self.history = [[]]
+        self.current = 0
+        self.stats = Counter() if stats is None else stats
+        self.next_id = 1
+        self.filename = None
+        self.saved = 0  # undo state saved last
+
+    def new_track(self, kind: str, name: str, channels: int = 1) -> Dict:
+        """
+        Appends a track, which becomes the only selected and the focused track.
+        """
+        track = {
+            "id": self.next_id,
+            "name": name,
+            "kind": kind,
+            "selected": True,
+            "mute": False,
+            "solo": False,
+            "gain": 1.0,
+            "pan": 0.0,
+            "channels": channels,
+            "start": 0.0,
+            "end": 0.0,
+            "labels": [],
+        }
+        self.next_id += 1
+        for other in self.tracks:
+            other["selected"] = False
+        self.tracks.append(track)
+        self.focus = track["id"]
+        return track
+
+    def selected(self) -> List[Dict]:
+        return [track for track in self.tracks if track["selected"]]
+
+    def focused_index(self) -> Optional[int]:
+        for i, track in enumerate(self.tracks):
+            if track["id"] == self.focus:
+                return i
+        return None
+
+    def _snapshot(self) -> List[Dict]:
+        return [dict(track, labels=list(track["labels"])) for track in self.tracks]
+
+    def push(self):
+        """
+        Records the current state as new undo state.
+        """
+        del self.history[self.current + 1 :]
+        self.history.append(self._snapshot())
+        self.current += 1
+        self.stats["undo_states"] += 1
+        self.stats["undo_labels"] += sum(len(track["labels"]) for track in self.tracks)
+
+    def _restore(self, index: int):
+        position = self.focused_index()
+        self.current = index
+        self.tracks = [
+            dict(track, labels=list(track["labels"])) for track in self.history[index]
+        ]
+        if self.focused_index() is None:
+            self.focus = (
+                self.tracks[min(position or 0, len(self.tracks) - 1)]["id"]
+                if self.tracks
+                else None
+            )
+
+    def undo(self):
+        if self.current == 0:
+            raise CommandFailed("Nothing to undo.")
+        self._restore(self.current - 1)
+
+    def redo(self):
+        if self.current == len(self.history) - 1:
+            raise CommandFailed("Nothing to redo.")
+        self._restore(self.current + 1)
+
+    def label_position(self, label: int):
+        """
+        Returns the label track containing the given project wide label index
+        (as used by SetLabel) and the label's index within it.
+        """
+        for track in self.tracks:
+            if track["kind"] == af.KIND_LABEL:
+                if label < len(track["labels"]):
+                    return track, label
+                label -= len(track["labels"])
+        raise CommandFailed(f"No label {label}.")
+
+    def to_document(self) -> ET.Element:
+        """
+        Returns the aup3 project document of the tracks: wave tracks with a
+        clip of their extent, but without audio, and label tracks.
+        """
+        project = aup3.project_element(EXPORT_RATE)
+        for track in self.tracks:
+            if track["kind"] == af.KIND_LABEL:
+                labels = [
+                    (start, end, title, lb.UNDEFINED_FREQUENCY, lb.UNDEFINED_FREQUENCY)
+                    for start, end, title in track["labels"]
+                ]
+                project.append(aup3.label_track_element(track["name"], labels))
+                continue
+            if track["channels"] == 1:
+                channels = [aup3.CHANNEL_MONO]
+            else:
+                channels = [aup3.CHANNEL_LEFT, aup3.CHANNEL_RIGHT]
+            for channel in channels:
+                element = aup3.wave_track_element(track["name"], EXPORT_RATE, channel)
+                clip = ET.SubElement(element, "waveclip", {"offset": track["start"]})
+                samples = round((track["end"] - track["start"]) * EXPORT_RATE)
+                ET.SubElement(clip, "sequence", {"numsamples": samples})
+                project.append(element)
+        return project
+
+
+def running() -> Optional["FakeAudacity"]:
+    """
+    Returns the fake answering on the pipes from this process, None if there's
+    none (e.g. when talking to Audacity).
+    Tested
+    """
+    return _running[-1] if _running else None
+
+
+class FakeAudacity:
+    """
+    mod-script-pipe server answering from an in-memory model, see module
+    docstring. Use as context manager:
+
+        with FakeAudacity(latency=0.001):
+            af.get_tracks()
+
+    or call execute() directly, without pipes.
+    """
+
+    COMMANDS = (
+        "GetInfo Message Help SelectTracks SelectNone SelectAll SelectTime "
+        "SelTrackStartToEnd NewLabelTrack NewMonoTrack NewStereoTrack SetTrack "
+        "RemoveTracks TrackMoveUp TrackMoveDown TrackMoveTop TrackMoveBottom "
+        "Undo Redo PrevTrack NextTrack FirstTrack LastTrack Toggle "
+        "AddLabel SetLabel ImportLabels Import2 New Close SaveProject2 "
+        "ExportLabels Export2"
+    ).split() + list(GENERATORS)
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latencies: Dict[str, float] = None,
+        pipe_to: str = None,
+        pipe_from: str = None,
+        failures: Iterable[str] = (),
+    ):
+        self.latency = latency
+        self.latencies = dict(latencies or {})
+        self.failures = set(failures)  # names of commands that fail
+        self.pipe_to = pipe_to or af.PIPE_TO_AUDACITY
+        self.pipe_from = pipe_from or af.PIPE_FROM_AUDACITY
+        self.counts = Counter()  # commands answered, by name
+        self.undo_stats = Counter()  # undo_states pushed, undo_labels copied
+        self.save_prompts = 0  # Close of unsaved changes, modal in Audacity
+        self.projects = [Project(self.undo_stats)]
+        self._created = []
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def project(self) -> Project:
+        return self.projects[-1]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    # -- protocol ---------------------------------------------------------
+
+    def execute(self, command: str) -> str:
+        """
+        Executes the given command and returns its response (without the empty
+        line ending it on the pipe).
+        Tested
+        """
+        name, parameters = parse_command(command)
+        self.counts[name] += 1
+        delay = self.latencies.get(name, self.latency)
+        if delay > 0:
+            time.sleep(delay)
+        if name not in self.COMMANDS:
+            return (
+                f"Your batch command of {name} was not recognised.\n{RESPONSE_FAILED}"
+            )
+        if name in self.failures:
+            return f"{name} failed.\n{RESPONSE_FAILED}"
+        try:
+            handler = (
+                self._generate if name in GENERATORS else getattr(self, f"_do_{name}")
+            )
+            output = handler(**parameters)
+        except (CommandFailed, TypeError, ValueError) as e:
+            return f"{e}\n{RESPONSE_FAILED}"
+        return f"{output}\n{RESPONSE_OK}" if output else RESPONSE_OK
+
+    def start(self):
+        """
+        Creates the pipes (unless they exist) and starts answering on them in a
+        background thread.
+        """
+        for pipe in (self.pipe_to, self.pipe_from):
+            if os.path.exists(pipe):
+                if not stat.S_ISFIFO(os.stat(pipe).st_mode):
+                    raise RuntimeError(f"{pipe} exists and isn't a named pipe.")
+            else:
+                os.mkfifo(pipe, 0o600)
+                self._created.append(pipe)
+        try:
+            os.close(os.open(self.pipe_to, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        else:
+            self._remove_pipes()
+            raise RuntimeError(f"Audacity (or another fake) is reading {self.pipe_to}.")
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        _running.append(self)
+
+    def stop(self):
+        """
+        Stops answering and removes the pipes created by start().
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        # let blocking opens of the server return
+        for pipe, flags in (
+            (self.pipe_to, os.O_WRONLY | os.O_NONBLOCK),
+            (self.pipe_from, os.O_RDONLY | os.O_NONBLOCK),
+        ):
+            try:
+                os.close(os.open(pipe, flags))
+            except OSError:
+                pass
+        self._thread.join()
+        self._thread = None
+        self._remove_pipes()
+        _running.remove(self)
+
+    def _remove_pipes(self):
+        while self._created:
+            try:
+                os.unlink(self._created.pop())
+            except FileNotFoundError:
+                pass
+
+    def _serve(self):
+        # like Audacity: open the command pipe, then the response pipe, answer
+        # until the client closes the command pipe, start over
+        while not self._stopping.is_set():
+            read_fd = os.open(self.pipe_to, os.O_RDONLY)
+            try:
+                if self._stopping.is_set():
+                    break
+                write_fd = os.open(self.pipe_from, os.O_WRONLY)
+                try:
+                    self._session(read_fd, write_fd)
+                finally:
+                    os.close(write_fd)
+            finally:
+                os.close(read_fd)
+
+    def _session(self, read_fd: int, write_fd: int):
+        pending = b""
+        while not self._stopping.is_set():
+            if not select.select([read_fd], [], [], POLL_INTERVAL)[0]:
+                continue
+            data = os.read(read_fd, 1 << 16)
+            if not data:
+                return
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                command = line.decode("utf-8").strip("\r\0 ")
+                if not command:
+                    continue
+                response = (self.execute(command) + "\n").encode("utf-8")
+                try:
+                    while response:
+                        response = response[os.write(write_fd, response) :]
+                except BrokenPipeError:
+                    return
+
+    # -- queries ----------------------------------------------------------
+
+    def _track_info(self, track: Dict) -> Dict:
+        info = {
+            "name": track["name"],
+            "focused": int(track["id"] == self.project.focus),
+            "selected": int(track["selected"]),
+            "kind": track["kind"],
+        }
+        if track["kind"] == af.KIND_LABEL:
+            starts = [label[0] for label in track["labels"]]
+            ends = [label[1] for label in track["labels"]]
+            info["start"] = float(format_number(min(starts, default=0.0)))
+            info["end"] = float(format_number(max(ends, default=0.0)))
+        else:
+            info["start"] = float(format_number(track["start"]))
+            info["end"] = float(format_number(track["end"]))
+            info["pan"] = track["pan"]
+            info["gain"] = track["gain"]
+            info["channels"] = track["channels"]
+            info["solo"] = int(track["solo"])
+            info["mute"] = int(track["mute"])
+        return info
+
+    def _do_GetInfo(self, Type="Commands", Format="JSON", **_):
+        if Format != af.GET_INFO_JSON:
+            raise CommandFailed(f"Format {Format} isn't supported by the fake.")
+        if Type == af.GET_INFO_TRACKS:
+            return json.dumps([self._track_info(t) for t in self.project.tracks])
+        if Type == af.GET_INFO_LABELS:
+            return (
+                "["
+                + ",\n".join(
+                    f"[{index},["
+                    + ",".join(
+                        f"[{format_number(start)},{format_number(end)},{json.dumps(title)}]"
+                        for start, end, title in track["labels"]
+                    )
+                    + "]]"
+                    for index, track in enumerate(self.project.tracks)
+                    if track["kind"] == af.KIND_LABEL
+                )
+                + "]"
+            )
+        if Type == "Commands":
+            return json.dumps([{"id": name} for name in self.COMMANDS])
+        raise CommandFailed(f"Type {Type} isn't supported by the fake.")
+
+    def _do_Message(self, Text="", **_):
+        return Text
+
+    def _do_Help(self, Command="Help", **_):
+        if Command not in self.COMMANDS:
+            raise CommandFailed(f"Command {Command} not found")
+        return json.dumps({"id": Command})
+
+    # -- selection and focus ----------------------------------------------
+
+    def _do_SelectTracks(self, Track="0", TrackCount="1", Mode="Set", **_):
+        first, count = int(float(Track)), int(float(TrackCount))
+        for i, track in enumerate(self.project.tracks):
+            inside = first <= i < first + count
+            if Mode == af.SELECT_MODE_SET:
+                track["selected"] = inside
+            elif inside:
+                track["selected"] = Mode == af.SELECT_MODE_ADD
+
+    def _do_SelectNone(self, **_):
+        for track in self.project.tracks:
+            track["selected"] = False
+        self.project.t0 = self.project.t1 = 0.0
+
+    def _do_SelectAll(self, **_):
+        for track in self.project.tracks:
+            track["selected"] = True
+        self._do_SelectTime(Start="0", End=str(self._project_end()))
+
+    def _project_end(self) -> float:
+        return max(
+            (self._track_info(t)["end"] for t in self.project.tracks), default=0.0
+        )
+
+    def _do_SelectTime(self, Start=None, End=None, **_):
+        if Start is not None:
+            self.project.t0 = float(Start)
+        if End is not None:
+            self.project.t1 = float(End)
+
+    def _do_SelTrackStartToEnd(self, **_):
+        infos = [self._track_info(t) for t in self.project.selected()]
+        if infos:
+            self.project.t0 = min(info["start"] for info in infos)
+            self.project.t1 = max(info["end"] for info in infos)
+
+    def _move_focus(self, index: int):
+        tracks = self.project.tracks
+        if tracks:
+            self.project.focus = tracks[max(0, min(index, len(tracks) - 1))]["id"]
+
+    def _do_PrevTrack(self, **_):
+        focused = self.project.focused_index()
+        self._move_focus(0 if focused is None else focused - 1)
+
+    def _do_NextTrack(self, **_):
+        focused = self.project.focused_index()
+        self._move_focus(0 if focused is None else focused + 1)
+
+    def _do_FirstTrack(self, **_):
+        self._move_focus(0)
+
+    def _do_LastTrack(self, **_):
+        self._move_focus(len(self.project.tracks) - 1)
+
+    def _do_Toggle(self, **_):
+        focused = self.project.focused_index()
+        if focused is not None:
+            track = self.project.tracks[focused]
+            track["selected"] = not track["selected"]
+
+    # -- tracks -----------------------------------------------------------
+
+    def _do_NewLabelTrack(self, **_):
+        self.project.new_track(af.KIND_LABEL, NEW_LABEL_TRACK_NAME)
+        self.project.push()
+
+    def _do_NewMonoTrack(self, **_):
+        self.project.new_track(af.KIND_AUDIO, NEW_AUDIO_TRACK_NAME)
+        self.project.push()
+
+    def _do_NewStereoTrack(self, **_):
+        self.project.new_track(af.KIND_AUDIO, NEW_AUDIO_TRACK_NAME, channels=2)
+        self.project.push()
+
+    def _do_SetTrack(self, **parameters):
+        # rebuildap selects with SelectTracks first, Track= isn't modelled
+        if "Track" in parameters or "TrackCount" in parameters:
+            raise CommandFailed("SetTrack: Track= isn't modelled, use SelectTracks.")
+        for track in self.project.selected():
+            for key, value in parameters.items():
+                if key == "Name":
+                    track["name"] = value
+                elif key == "Selected":
+                    track["selected"] = to_bool(value)
+                elif key == "Focused":
+                    if to_bool(value):
+                        self.project.focus = track["id"]
+                elif key in ("Mute", "Solo"):
+                    if track["kind"] == af.KIND_AUDIO:
+                        track[key.lower()] = to_bool(value)
+                elif key in ("Gain", "Pan"):
+                    track[key.lower()] = float(value)
+
+    def _do_RemoveTracks(self, **_):
+        project = self.project
+        removed = [i for i, track in enumerate(project.tracks) if track["selected"]]
+        if not removed:
+            return
+        focused = project.focused_index()
+        project.tracks = [track for track in project.tracks if not track["selected"]]
+        if focused in removed:
+            project.focus = None
+            self._move_focus(removed[0])
+        project.push()
+
+    def _move_track(self, index: int):
+        # moves the focused track to the given index, like Audacity an undo state
+        project = self.project
+        focused = project.focused_index()
+        if focused is None:
+            return
+        index = max(0, min(index, len(project.tracks) - 1))
+        if index != focused:
+            project.tracks.insert(index, project.tracks.pop(focused))
+            project.push()
+
+    def _do_TrackMoveUp(self, **_):
+        self._move_track((self.project.focused_index() or 0) - 1)
+
+    def _do_TrackMoveDown(self, **_):
+        self._move_track((self.project.focused_index() or 0) + 1)
+
+    def _do_TrackMoveTop(self, **_):
+        self._move_track(0)
+
+    def _do_TrackMoveBottom(self, **_):
+        self._move_track(len(self.project.tracks) - 1)
+
+    def _do_Undo(self, **_):
+        self.project.undo()
+
+    def _do_Redo(self, **_):
+        self.project.redo()
+
+    def _generate(self, **_):
+        project = self.project
+        for track in project.selected():
+            if track["kind"] == af.KIND_AUDIO and project.t1 > project.t0:
+                if track["end"] > track["start"]:
+                    track["start"] = min(track["start"], project.t0)
+                    track["end"] = max(track["end"], project.t1)
+                else:
+                    track["start"], track["end"] = project.t0, project.t1
+
+    # -- labels -----------------------------------------------------------
+
+    def _do_AddLabel(self, **_):
+        # like Audacity: the first label track at or after the focused track
+        project = self.project
+        focused = project.focused_index() or 0
+        track = next(
+            (t for t in project.tracks[focused:] if t["kind"] == af.KIND_LABEL), None
+        )
+        if track is None:
+            track = project.new_track(af.KIND_LABEL, NEW_LABEL_TRACK_NAME)
+        track["selected"] = True
+        labels = track["labels"]
+        position = len(labels)
+        while position > 0 and labels[position - 1][0] >= project.t0:
+            position -= 1
+        labels.insert(position, (project.t0, project.t1, ""))
+        project.push()
+
+    def _do_SetLabel(self, Label, Text=None, Start=None, End=None, **_):
+        track, index = self.project.label_position(int(float(Label)))
+        start, end, title = track["labels"][index]
+        track["labels"][index] = (
+            start if Start is None else float(Start),
+            end if End is None else float(End),
+            title if Text is None else Text,
+        )
+        if Start is not None:
+            track["labels"].sort(key=lambda label: label[0])
+        self.project.push()
+
+    def _do_ImportLabels(self, fname, **_):
+        try:
+            labels = lb.read_labels(fname, validate=False)
+        except (OSError, lb.LabelFileError) as e:
+            raise CommandFailed(str(e))
+        track = self.project.new_track(af.KIND_LABEL, Path(fname).stem)
+        track["labels"] = sorted(
+            zip(labels.starts, labels.ends, labels.titles), key=lambda label: label[0]
+        )
+        self.project.push()
+
+    # -- files and projects -----------------------------------------------
+
+    def _do_Import2(self, Filename, **_):
+        if not os.path.isfile(Filename):
+            raise CommandFailed(f"Could not open file: {Filename}")
+        duration, channels = 0.0, 1
+        try:
+            with wave.open(Filename) as w:
+                duration = w.getnframes() / w.getframerate()
+                channels = w.getnchannels()
+        except (wave.Error, EOFError):
+            pass  # not a PCM WAV file, the fake doesn't decode it
+        track = self.project.new_track(af.KIND_AUDIO, Path(Filename).stem, channels)
+        track["end"] = duration
+        self.project.push()
+
+    def _do_New(self, **_):
+        self.projects.append(Project(self.undo_stats))
+
+    def _do_Close(self, **_):
+        if self.project.current != self.project.saved:
+            self.save_prompts += 1
+        self.projects.pop()
+        if not self.projects:
+            self.projects.append(Project(self.undo_stats))
+
+    def _do_SaveProject2(self, Filename, **_):
+        aup3.write_document(Filename, self.project.to_document())
+        self.project.filename = Filename
+        self.project.saved = self.project.current
+
+    def _do_ExportLabels(self, **_):
+        pass  # interactive in Audacity
+
+    def _do_Export2(self, Filename, NumChannels="1", **_):
+        # a silent PCM WAV file of the time selection, whatever the extension
+        if not any(t["kind"] == af.KIND_AUDIO for t in self.project.selected()):
+            raise CommandFailed("No audio selected")
+        frames = int(max(0.0, self.project.t1 - self.project.t0) * EXPORT_RATE)
+        with wave.open(Filename, "wb") as w:
+            w.setnchannels(int(NumChannels))
+            w.setsampwidth(2)
+            w.setframerate(EXPORT_RATE)
+            w.writeframes(b"\0\0" * frames * int(NumChannels))
+
+
+def main(
+    latency: float = typer.Option(
+        0.0, "-l", "--latency", help="Seconds slept before answering a command."
+    ),
+    command_latency: List[str] = typer.Option(
+        [], "-c", "--command-latency", help="Latency of a command: <Command>=<seconds>."
+    ),
+    fail: List[str] = typer.Option(
+        [], "-f", "--fail", help="Command that fails, e.g. ImportLabels."
+    ),
+    verbose: bool = typer.Option(
+        False, "-v", "--verbose", help="Print command counts."
+    ),
+):
+    """
+    Runs the fake Audacity on the mod-script-pipe pipes until Ctrl-C.
+    """
+    latencies = {}
+    for entry in command_latency:
+        name, _, seconds = entry.partition("=")
+        latencies[name] = float(seconds)
+    fake = FakeAudacity(latency, latencies, failures=fail)
+    fake.start()
+    print(f"Fake Audacity answering on {fake.pipe_to}. Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.stop()
+    if verbose:
+        for name, count in fake.counts.most_common():
+            print(f"{count:8d}  {name}")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+
+"""
+freshness.py
+
+Decides whether an aup3 needs to be rebuilt from its inputs (the audio file
+and its label files).
+
+After a rebuild, the inputs are recorded in a sidecar manifest next to the
+audio file (<stem>.rebuildap.json) with their sizes, modification times and
+content hashes. An input whose size and modification time match the manifest
+is considered unchanged without reading it. Otherwise its content hash decides,
+so merely touched files (e.g. by a git checkout) don't trigger a rebuild.
+
+Inputs are recorded in import order (the audio file, then its label files
+as ordered by af.reorder_labels) with the names of the tracks they were
+imported as. Thus the manifest lists exactly what the aup3 was built from and
+can be passed to rebuildap instead of the audio file to import just that,
+after verifying the files still match (see read_sources).
+
+Inputs are hashed in parallel (hashlib releases the GIL), reading them
+memory-mapped.
+
+The manifest also records the audio files exported from the aup3 (see
+rebuildap --audio) with the content hash of the track they were exported
+from, so unchanged tracks aren't exported again.
+
+"""
+
+MANIFEST_SUFFIX = ".rebuildap.json"
+MANIFEST_VERSION = 2
+
+HASH_ALGORITHM = "sha256"
+
+# threads hashing inputs
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def manifest_path(filename: str) -> Path:
+    """
+    Returns the path of the sidecar manifest of the given audio file.
+    Tested
+    """
+    path = Path(filename).expanduser().resolve()
+    return path.with_name(f"{path.stem}{MANIFEST_SUFFIX}")
+
+
+def file_digest(filename: str) -> str:
+    """
+    Returns the hex digest of the given file's content.
+    Tested
+    """
+    digest = hashlib.new(HASH_ALGORITHM)
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size:  # empty files can't be mapped
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data)
+    return digest.hexdigest()
+
+
+def file_digests(filenames: List[str]) -> List[str]:
+    """
+    Returns the hex digests of the given files' contents, hashing them in
+    parallel.
+    Tested
+    """
+    if len(filenames) < 2:
+        return [file_digest(filename) for filename in filenames]
+    from concurrent.futures import ThreadPoolExecutor  # not needed up to date
+
+    with ThreadPoolExecutor(min(HASH_WORKERS, len(filenames))) as executor:
+        return list(executor.map(file_digest, filenames))
+
+
+def read_manifest(filename: str) -> Optional[Dict]:
+    """
+    Returns the sidecar manifest of the given audio file, None if there's
+    none or it can't be read.
+    Tested indirectly
+    """
+    try:
+        manifest = json.loads(manifest_path(filename).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def _is_unchanged(stat: os.stat_result, previous: Optional[Dict]) -> bool:
+    return bool(
+        previous
+        and previous.get("size") == stat.st_size
+        and previous.get("mtime_ns") == stat.st_mtime_ns
+    )
+
+
+def describe_inputs(
+    filenames: List[str],
+    previous: Optional[List[Optional[Dict]]] = None,
+    digests: Optional[Dict[str, str]] = None,
+) -> List[Dict]:
+    """
+    Returns size, modification time and content hash of the given inputs.
+    A hash is taken from digests (file name: hash, e.g. filled by check) or
+    from previous (the inputs' manifest entries) if size and modification time
+    didn't change, the others are hashed in parallel.
+    Tested indirectly
+    """
+    previous = previous or [None] * len(filenames)
+    digests = dict(digests or {})
+    stats = [os.stat(filename) for filename in filenames]
+    changed = [
+        filename
+        for filename, stat, entry in zip(filenames, stats, previous)
+        if filename not in digests and not _is_unchanged(stat, entry)
+    ]
+    digests.update(zip(changed, file_digests(changed)))
+    return [
+        {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            HASH_ALGORITHM: (
+                digests[filename] if filename in digests else entry[HASH_ALGORITHM]
+            ),
+        }
+        for filename, stat, entry in zip(filenames, stats, previous)
+    ]
+
+
+def describe_input(filename: str, previous: Optional[Dict] = None) -> Dict:
+    """
+    Returns size, modification time and content hash of the given input, see
+    describe_inputs.
+    Tested indirectly
+    """
+    return describe_inputs([filename], [previous])[0]
+
+
+def _relative(path: str, base: Path) -> str:
+    return os.path.relpath(Path(path).expanduser().resolve(), base)
+
+
+def input_digest(filename: str) -> str:
+    """
+    Returns the content hash of the given audio file, taken from its sidecar
+    manifest if its size and modification time didn't change since.
+    Tested
+    """
+    manifest = read_manifest(filename) or {}
+    previous = manifest.get("inputs", {}).get(
+        _relative(filename, manifest_path(filename).parent)
+    )
+    return describe_input(filename, previous)[HASH_ALGORITHM]
+
+
+def check(
+    filename: str,
+    inputs: List[str],
+    target: str,
+    digests: Optional[Dict[str, str]] = None,
+) -> List[str]:
+    """
+    Returns the reasons why the target needs to be rebuilt from the given
+    inputs, an empty list if it's up to date. filename is the audio file the
+    manifest belongs to.
+    Only inputs whose size or modification time changed are hashed. If their
+    content turns out unchanged, the manifest is updated with their new
+    modification times. The hashes taken are added to digests (input: hash),
+    if given, to be passed on to describe.
+    Tested
+    """
+    if not Path(target).expanduser().exists():
+        return [f"{Path(target).name} doesn't exist"]
+    manifest = read_manifest(filename)
+    if manifest is None or "inputs" not in manifest:
+        return [f"no manifest {manifest_path(filename).name}"]
+    base = manifest_path(filename).parent
+    recorded = manifest.get("inputs", {})
+    current = {_relative(path, base): path for path in inputs}
+    reasons = [f"new input {name}" for name in current if name not in recorded]
+    reasons += [f"removed input {name}" for name in recorded if name not in current]
+    candidates = []  # same size, other modification time: hash decides
+    for name, path in current.items():
+        previous = recorded.get(name)
+        if previous is None:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            reasons.append(f"can't read {name}")
+            continue
+        if _is_unchanged(stat, previous):
+            continue
+        if stat.st_size != previous.get("size"):
+            reasons.append(f"changed input {name}")
+        else:
+            candidates.append((name, path, stat))
+    touched = {}
+    hashed = file_digests([path for _, path, _ in candidates])
+    if digests is not None:
+        digests.update(
+            (path, digest) for (_, path, _), digest in zip(candidates, hashed)
+        )
+    for (name, _, stat), digest in zip(candidates, hashed):
+        if digest != recorded[name].get(HASH_ALGORITHM):
+            reasons.append(f"changed input {name}")
+        else:
+            touched[name] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                HASH_ALGORITHM: digest,
+            }
+    if touched and not reasons:
+        # same content, new modification time: remember it to skip hashing next time
+        _write_manifest(filename, target, {**recorded, **touched})
+    return reasons
+
+
+def _write_manifest(filename: str, target: str, inputs: Dict[str, Dict]):
+    path = manifest_path(filename)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "target": _relative(target, path.parent),
+        "inputs": inputs,
+    }
+    exports = (read_manifest(filename) or {}).get("exports")
+    if exports:
+        manifest["exports"] = exports
+    path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+
+
+def describe(
+    filename: str, inputs: List[str], digests: Optional[Dict[str, str]] = None
+) -> List[Dict]:
+    """
+    Returns the descriptions of the given inputs to record in the sidecar
+    manifest of the given audio file (see record), hashing only inputs whose
+    hash is neither in digests (see check) nor in the manifest.
+    Tested indirectly
+    """
+    base = manifest_path(filename).parent
+    previous = (read_manifest(filename) or {}).get("inputs", {})
+    return describe_inputs(
+        inputs, [previous.get(_relative(name, base)) for name in inputs], digests
+    )
+
+
+def record(
+    filename: str,
+    inputs: List[str],
+    target: str,
+    tracks: Optional[List[str]] = None,
+    described: Optional[List[Dict]] = None,
+):
+    """
+    Records the given inputs of the target in the sidecar manifest of the
+    given audio file, in the given (import) order along with the names of the
+    tracks they were imported as (tracks, by default the inputs' stems).
+    described are the inputs' descriptions taken before the rebuild (see
+    describe), by default they're described now.
+    Tested
+    """
+    base = manifest_path(filename).parent
+    names = [_relative(name, base) for name in inputs]
+    tracks = tracks or [Path(name).stem for name in inputs]
+    described = described or describe(filename, inputs)
+    _write_manifest(
+        filename,
+        target,
+        {
+            name: {**description, "order": order, "track": track}
+            for order, (name, description, track) in enumerate(
+                zip(names, described, tracks)
+            )
+        },
+    )
+
+
+def is_manifest(filename: str) -> bool:
+    """
+    Returns true if the given file name is a manifest's.
+    Tested
+    """
+    return filename.endswith(MANIFEST_SUFFIX)
+
+
+def read_sources(manifest_file: str) -> Tuple[str, List[Tuple[str, str]], str]:
+    """
+    Returns the audio file, the (label file, label track name) pairs in
+    import order and the target recorded in the given manifest. Raises
+    ManifestError if it can't be read or an input doesn't match its record
+    (size and content hash, the latter checked unless size and modification
+    time match).
+    Tested
+    """
+    path = Path(manifest_file).expanduser().resolve()
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"{manifest_file}: {e}") from e
+    if manifest.get("version") != MANIFEST_VERSION or not manifest.get("inputs"):
+        raise ManifestError(
+            f"{manifest_file}: no inputs of manifest version {MANIFEST_VERSION}"
+        )
+    inputs = sorted(manifest["inputs"].items(), key=lambda item: item[1]["order"])
+    files = [str(path.parent / name) for name, _ in inputs]
+    missing = [
+        name for (name, _), file in zip(inputs, files) if not Path(file).is_file()
+    ]
+    if missing:
+        raise ManifestError(f"{manifest_file}: missing {', '.join(missing)}")
+    current = describe_inputs(files, [entry for _, entry in inputs])
+    changed = [
+        name
+        for (name, entry), description in zip(inputs, current)
+        if description[HASH_ALGORITHM] != entry.get(HASH_ALGORITHM)
+        or description["size"] != entry.get("size")
+    ]
+    if changed:
+        raise ManifestError(f"{manifest_file}: changed {', '.join(changed)}")
+    label_files = [
+        (file, entry["track"]) for file, (_, entry) in zip(files[1:], inputs[1:])
+    ]
+    return files[0], label_files, str(path.parent / manifest["target"])
+
+
+def stale_exports(filename: str, exports: Dict[str, str]) -> List[str]:
+    """
+    Returns the files of the given exports (file name: content hash of the
+    track to export into it) that need to be exported: files that don't exist,
+    weren't exported from a track with that content hash, or were modified
+    since. filename is the aup3 (or audio file) the manifest belongs to.
+    Tested
+    """
+    base = manifest_path(filename).parent
+    recorded = (read_manifest(filename) or {}).get("exports", {})
+    stale = []
+    for name, digest in exports.items():
+        previous = recorded.get(_relative(name, base), {})
+        try:
+            stat = os.stat(name)
+        except OSError:
+            stale.append(name)
+            continue
+        if (
+            previous.get(HASH_ALGORITHM) != digest
+            or previous.get("size") != stat.st_size
+            or previous.get("mtime_ns") != stat.st_mtime_ns
+        ):
+            stale.append(name)
+    return stale
+
+
+def record_exports(filename: str, exports: Dict[str, str]):
+    """
+    Records the given exports (file name: content hash of the track exported
+    into it) in the sidecar manifest of the given aup3 (or audio file).
+    Tested
+    """
+    path = manifest_path(filename)
+    manifest = read_manifest(filename) or {"version": MANIFEST_VERSION}
+    recorded = manifest.setdefault("exports", {})
+    for name, digest in exports.items():
+        stat = os.stat(name)
+        recorded[_relative(name, path.parent)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            HASH_ALGORITHM: digest,
+        }
+    path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+
+
+def exported_files(directory: str) -> List[str]:
+    """
+    Returns the files recorded as exports in the manifests of the given
+    directory.
+    Tested
+    """
+    exported = []
+    for path in Path(directory).expanduser().resolve().glob(f"*{MANIFEST_SUFFIX}"):
+        try:
+            manifest = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+        exported += [
+            os.path.normpath(path.parent / name) for name in manifest.get("exports", {})
+        ]
+    return exported
+
+
+def main(filename: str, target: str, inputs: List[str]):
+    """
+    Prints why target needs to be rebuilt from the given inputs.
+    """
+    for reason in check(filename, inputs, target) or ["up to date"]:
+        print(reason)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+import math
+from array import array
+from typing import Iterable, Iterator, List, Tuple
+
+import typer
+
+"""
+labels.py
+
+Parses, validates and writes label files in Audacity's label format:
+
+    start<TAB>end<TAB>title
+    \\<TAB>low frequency<TAB>high frequency
+
+Times are in seconds. The second line is optional and only present for labels
+with a spectral selection. end and title may be missing (end defaults to
+start, title to "").
+
+Start and end times (and frequencies) are kept in compact float arrays, titles
+in a separate list, so even beat tracks with tens of thousands of labels are
+cheap to parse and validate before anything is sent to Audacity.
+
+References
+[1] https://manual.audacityteam.org/man/importing_and_exporting_labels.html
+
+"""
+
+# Audacity marks undefined label frequencies (no spectral selection) with -1
+UNDEFINED_FREQUENCY = -1.0
+
+# digits after the decimal point in label files as written by ExportLabels (FLT_DIG)
+LABEL_DIGITS = 6
+
+SPECTRAL_MARKER = "\\"
+
+LABEL_FILE_EXTENSION = "txt"
+
+
+class LabelFileError(ValueError):
+    def __init__(self, filename: str, lineno: int, message: str):
+        super().__init__(f"{filename}:{lineno}: {message}")
+        self.filename = filename
+        self.lineno = lineno
+
+
+class Labels:
+    """
+    Labels of one label track, i.e. (start, end, title, low, high) tuples,
+    stored column-wise.
+    """
+
+    __slots__ = ("starts", "ends", "titles", "lows", "highs")
+
+    def __init__(self, labels: Iterable[Tuple] = ()):
+        self.starts = array("d")
+        self.ends = array("d")
+        self.titles = []
+        self.lows = array("d")
+        self.highs = array("d")
+        for label in labels:
+            self.append(*label)
+
+    def append(
+        self,
+        start: float,
+        end: float,
+        title: str = "",
+        low: float = UNDEFINED_FREQUENCY,
+        high: float = UNDEFINED_FREQUENCY,
+    ):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.titles.append(title)
+        self.lows.append(low)
+        self.highs.append(high)
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    def __getitem__(self, i: int) -> Tuple[float, float, str, float, float]:
+        return (
+            self.starts[i],
+            self.ends[i],
+            self.titles[i],
+            self.lows[i],
+            self.highs[i],
+        )
+
+    def __iter__(self) -> Iterator[Tuple[float, float, str, float, float]]:
+        return zip(self.starts, self.ends, self.titles, self.lows, self.highs)
+
+    def __eq__(self, other) -> bool:
+        try:
+            return list(self) == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"Labels({list(self)!r})"
+
+
+def _number(text: str, filename: str, lineno: int, what: str) -> float:
+    try:
+        value = float(text)
+    except ValueError:
+        raise LabelFileError(filename, lineno, f"{what} {text!r} isn't a number")
+    if not math.isfinite(value):
+        raise LabelFileError(filename, lineno, f"{what} {text!r} isn't finite")
+    return value
+
+
+def parse_labels(
+    lines: Iterable[str], filename: str = "<labels>", validate: bool = True
+) -> Labels:
+    """
+    Parses the given lines of a label file.
+    Raises LabelFileError for lines that can't be parsed and, if validate is
+    true, for labels ending before they start, labels not sorted by start time
+    (Audacity would silently reorder them) and spectral lines without label.
+    Tested
+    """
+    labels = Labels()
+    starts, ends, titles, lows, highs = (
+        labels.starts,
+        labels.ends,
+        labels.titles,
+        labels.lows,
+        labels.highs,
+    )
+    previous_start = -math.inf
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        fields = line.split("\t")
+        if fields[0] == SPECTRAL_MARKER:
+            if not titles:
+                if validate:
+                    raise LabelFileError(
+                        filename, lineno, "spectral line without label"
+                    )
+                continue
+            if len(fields) < 3:
+                raise LabelFileError(filename, lineno, "spectral line needs 2 values")
+            lows[-1] = _number(fields[1], filename, lineno, "low frequency")
+            highs[-1] = _number(fields[2], filename, lineno, "high frequency")
+            continue
+        try:
+            start = float(fields[0])
+            end = float(fields[1]) if len(fields) > 1 else start
+            if not (math.isfinite(start) and math.isfinite(end)):
+                raise ValueError
+        except ValueError:
+            _number(fields[0], filename, lineno, "start")
+            _number(fields[1], filename, lineno, "end")
+        if validate:
+            if end < start:
+                raise LabelFileError(
+                    filename, lineno, f"label ends ({end}) before it starts ({start})"
+                )
+            if start < previous_start:
+                raise LabelFileError(
+                    filename,
+                    lineno,
+                    f"labels not sorted: {start} follows {previous_start}",
+                )
+        previous_start = start
+        starts.append(start)
+        ends.append(end)
+        titles.append("\t".join(fields[2:]))
+        lows.append(UNDEFINED_FREQUENCY)
+        highs.append(UNDEFINED_FREQUENCY)
+    return labels
+
+
+def read_labels(filename: str, validate: bool = True) -> Labels:
+    """
+    Reads and parses the given label file (see parse_labels).
+    Tested
+    """
+    with open(filename, encoding="utf-8") as f:
+        return parse_labels(f, filename, validate)
+
+
+def format_labels(labels: Iterable[Tuple], digits: int = LABEL_DIGITS) -> str:
+    """
+    Formats labels as Audacity's ExportLabels does: start, end and title
+    separated by tabs, followed by a line starting with a backslash holding
+    low and high frequency for labels with a spectral selection.
+    Tested
+    """
+    lines = []
+    for start, end, title, low, high in labels:
+        lines.append(f"{start:.{digits}f}\t{end:.{digits}f}\t{title}\n")
+        if low != UNDEFINED_FREQUENCY or high != UNDEFINED_FREQUENCY:
+            lines.append(f"\\\t{low:.{digits}f}\t{high:.{digits}f}\n")
+    return "".join(lines)
+
+
+def write_labels(filename: str, labels: Iterable[Tuple], digits: int = LABEL_DIGITS):
+    """
+    Writes labels into the given label file (see format_labels).
+    Tested indirectly
+    """
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write(format_labels(labels, digits))
+
+
+def label_file_name(track_name: str, stem: str) -> str:
+    """
+    Returns the name of the label file for the given label track name
+    and audio stem, i.e. <track_name>_<stem>.txt (see create_labels_glob).
+    Tested
+    """
+    return f"{track_name}_{stem}.{LABEL_FILE_EXTENSION}"
+
+
+def unique_names(names: List[str]) -> List[str]:
+    """
+    Returns the given label track names, repeated names getting a numeric
+    suffix ("chord", "chord-2", ...) so their label files don't collide.
+    Tested
+    """
+    seen = {}
+    unique = []
+    for name in names:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f"{name}-{seen[name]}")
+    return unique
+
+
+def main(filenames: List[str]):
+    """
+    Validates the given label files.
+    """
+    for filename in filenames:
+        labels = read_labels(filename)
+        print(f"{filename}: {len(labels)} labels")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+import asyncio
+import contextlib
+import glob
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import pyaudacity as pa
+import typer
+
+import audacity_async as aa
+import audacity_funcs as af
+import audacity_present as ap
+import audio_cache
+import aup3
+import freshness
+import labels as lb
+
+"""
+rebuild_batch.py
+
+Rebuilds the aup3 files of whole directories (or globs) of audio files.
+
+All songs go through one Audacity session: each song is imported into a new
+project window, saved as <stem>.aup3 and the window is closed again. While
+Audacity imports a song, the following songs are prepared (label discovery,
+label parsing, input hashing, decoded-audio cache lookup) in a worker pool.
+The inputs are hashed once: the manifest records the hashes taken while
+preparing. Audacity is driven by the asyncio client (see audacity_async), so
+a hung Audacity fails the song after a deadline instead of blocking the batch
+forever.
+
+A song failing in Audacity leaves its window with unsaved changes, which
+Close would answer with a modal prompt, blocking all later commands. Hence
+the window is saved to a temporary aup3 (deleted again) before closing it,
+and if even that fails, the batch is aborted.
+
+"""
+
+STATUS_UP_TO_DATE = "up to date"
+STATUS_REBUILT = "rebuilt"
+STATUS_FAILED = "failed"
+
+DISCARDED_PROJECT = "discarded.aup3"
+
+
+class BatchAborted(RuntimeError):
+    pass
+
+
+def is_audio_file(filename: str) -> bool:
+    """
+    Returns true if the given file name has one of the af.AUDIO_EXTENSIONS.
+    Tested
+    """
+    return Path(filename).suffix.lower().lstrip(".") in af.AUDIO_EXTENSIONS
+
+
+def find_audio_files(paths: List[str]) -> List[str]:
+    """
+    Returns the audio files given by paths, each being a directory (its audio
+    files), a glob pattern or an audio file. Every file is listed once,
+    in the order given (directories and globs sorted). Directories and globs
+    leave out the audio tracks exported from aup3s (see rebuildap --audio).
+    Tested
+    """
+    found = []
+    seen = set()
+    exported = {}  # directory: audio files exported from its aup3s
+    for path in paths:
+        expanded = os.path.expanduser(path)
+        if os.path.isdir(expanded):
+            candidates = sorted(
+                entry.path for entry in os.scandir(expanded) if entry.is_file()
+            )
+        elif glob.has_magic(expanded):
+            candidates = sorted(glob.glob(expanded))
+        else:
+            candidates = [expanded]
+        for candidate in candidates:
+            if not is_audio_file(candidate) or candidate in seen:
+                continue
+            if candidate != expanded:  # found, not given: skip exported tracks
+                directory = os.path.dirname(os.path.realpath(candidate))
+                if directory not in exported:
+                    exported[directory] = set(freshness.exported_files(directory))
+                if os.path.realpath(candidate) in exported[directory]:
+                    continue
+            seen.add(candidate)
+            found.append(candidate)
+    return found
+
+
+def prepare(filename: str, force: bool = False) -> Dict:
+    """
+    Prepares the rebuild of the given audio file: finds and parses its label
+    files and checks whether its aup3 is up to date (hashing inputs if needed).
+    To be rebuilt, its inputs are described for the manifest (see
+    freshness.describe) and the file to import is looked up in the
+    decoded-audio cache (see audio_cache.source_for_import).
+    Runs in a worker thread, hence it must not talk to Audacity.
+    Tested
+    """
+    start = time.perf_counter()
+    project = str(Path(filename).with_suffix(f".{af.AUDACITY_EXTENSION}"))
+    label_files = af.get_label_files(filename)
+    labels = [lb.read_labels(label_file) for label_file, _ in label_files]
+    inputs = [filename] + [label_file for label_file, _ in label_files]
+    digests = {}
+    if force:
+        reasons = ["forced"]
+    else:
+        reasons = freshness.check(filename, inputs, project, digests)
+    described = source = None
+    if reasons:
+        described = freshness.describe(filename, inputs, digests)
+        source = audio_cache.source_for_import(
+            str(Path(filename).expanduser().resolve()),
+            described[0][freshness.HASH_ALGORITHM],
+        )
+    return {
+        "filename": filename,
+        "project": project,
+        "label_files": label_files,
+        "labels": labels,
+        "inputs": inputs,
+        "tracks": [Path(filename).stem] + [name for _, name in label_files],
+        "reasons": reasons,
+        "described": described,
+        "source": source,
+        "prepare": time.perf_counter() - start,
+    }
+
+
+async def rebuild_in_audacity(
+    client: aa.AsyncAudacity, song: Dict, verbose: bool = False
+):
+    """
+    Rebuilds the given prepared song in a new project window of the running
+    Audacity, saves it and closes the window again (see discard_project if
+    that fails).
+    """
+    await client.do("New:")
+    try:
+        if verbose:
+            print(f'Importing "{song["filename"]}"')
+        await client.do(f'Import2: Filename="{song["source"]}"')
+        track = len(await client.get_tracks())
+        commands = []
+        for label_file, name in song["label_files"]:
+            if verbose:
+                print(f"labels: >{name}<")
+            commands += af.plan_label_import(track, label_file, name, 0)
+            track += 1
+        await client.do_all(commands)
+        project = Path(song["project"]).expanduser().resolve()
+        await client.do(f'SaveProject2: Filename="{project}"')
+    except BaseException:
+        await discard_project(client)
+        raise
+    await client.do("Close:")
+
+
+async def discard_project(client: aa.AsyncAudacity):
+    """
+    Closes the current project window without the modal prompt for saving its
+    changes: it's saved to a temporary aup3 first, which is deleted after
+    closing. Raises BatchAborted if that fails, as the window (maybe with the
+    prompt) would block the following songs.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            path = Path(directory) / DISCARDED_PROJECT
+            await client.do(f'SaveProject2: Filename="{path}"')
+            await client.do("Close:")
+        except pa.PyAudacityException as e:
+            raise BatchAborted(f"Can't discard the project window: {e}") from e
+
+
+def rebuild_headless(song: Dict, verbose: bool = False):
+    """
+    Writes the given prepared song's aup3 directly (see aup3.write_project).
+    """
+    aup3.write_project(song["project"], song["filename"], song["label_files"], verbose)
+
+
+def rebuild_all(
+    paths: List[str],
+    verbose: bool = False,
+    force: bool = False,
+    headless: bool = False,
+    workers: int = None,
+    timeout: float = aa.DEFAULT_TIMEOUT,
+) -> List[Dict]:
+    """
+    Rebuilds the aup3 files of all audio files given by paths (see
+    find_audio_files) and returns the prepared songs with status and timings.
+    Up-to-date projects are skipped unless forced. timeout is the deadline
+    for each command sent to Audacity.
+    """
+    filenames = find_audio_files(paths)
+    if not filenames:
+        return []
+    if not headless:
+        ap.assert_audacity(verbose)
+    return asyncio.run(
+        _rebuild_all(filenames, verbose, force, headless, workers, timeout)
+    )
+
+
+async def _rebuild_all(
+    filenames: List[str],
+    verbose: bool,
+    force: bool,
+    headless: bool,
+    workers: int,
+    timeout: float,
+) -> List[Dict]:
+    loop = asyncio.get_running_loop()
+    songs = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        prepared = [
+            loop.run_in_executor(executor, prepare, name, force) for name in filenames
+        ]
+        async with contextlib.AsyncExitStack() as stack:
+            client = None
+            if not headless:
+                client = await stack.enter_async_context(aa.AsyncAudacity(timeout))
+            aborted = None
+            for filename, future in zip(filenames, prepared):
+                if aborted:
+                    future.cancel()
+                    songs.append(
+                        {
+                            "filename": filename,
+                            "status": STATUS_FAILED,
+                            "error": aborted,
+                        }
+                    )
+                    continue
+                try:
+                    song = await future
+                except Exception as e:
+                    songs.append(
+                        {"filename": filename, "status": STATUS_FAILED, "error": str(e)}
+                    )
+                    continue
+                songs.append(song)
+                if not song["reasons"]:
+                    song["status"] = STATUS_UP_TO_DATE
+                    continue
+                if verbose:
+                    print(f'rebuilding "{filename}": {", ".join(song["reasons"])}')
+                start = time.perf_counter()
+                try:
+                    if headless:
+                        await loop.run_in_executor(
+                            executor, rebuild_headless, song, verbose
+                        )
+                    else:
+                        await rebuild_in_audacity(client, song, verbose)
+                    await loop.run_in_executor(
+                        None,
+                        freshness.record,
+                        filename,
+                        song["inputs"],
+                        song["project"],
+                        song["tracks"],
+                        song["described"],
+                    )
+                    song["status"] = STATUS_REBUILT
+                except BatchAborted as e:
+                    song["status"] = STATUS_FAILED
+                    song["error"] = str(e)
+                    aborted = f"batch aborted: {e}"
+                except Exception as e:
+                    song["status"] = STATUS_FAILED
+                    song["error"] = str(e)
+                song["rebuild"] = time.perf_counter() - start
+    return songs
+
+
+def format_timings(songs: List[Dict]) -> str:
+    """
+    Returns a table of the given songs' status and timings (in seconds).
+    Tested
+    """
+    width = max([len(Path(song["filename"]).name) for song in songs] + [4])
+    lines = [f"{'song':<{width}}  {'prepare':>8}  {'rebuild':>8}  status"]
+    for song in songs:
+        status = song["status"]
+        if "error" in song:
+            status = f"{status}: {song['error']}"
+        lines.append(
+            f"{Path(song['filename']).name:<{width}}"
+            f"  {song.get('prepare', 0):8.3f}  {song.get('rebuild', 0):8.3f}  {status}"
+        )
+    return "\n".join(lines)
+
+
+def main(paths: List[str]):
+    """
+    Rebuilds the aup3 files of the given directories/globs/audio files.
+    """
+    print(format_timings(rebuild_all(paths, verbose=True)))
+
+
+if __name__ == "__main__":
+    typer.run(main)
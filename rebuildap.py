@@ -1,20 +1,41 @@
 #!/usr/bin/env python
 
 import sys
+from contextlib import nullcontext
 from pathlib import Path
+from typing import List, Optional
 
 import typer
 from typing_extensions import Annotated
 
-import audacity_funcs as af
-import audacity_present as ap
-
 """
 rebuildap.py song.mp3
 
+Only the CLI is set up at module load. Each path imports the modules it needs
+(e.g. asyncio for --batch, sqlite3 for aup3 files) when it's taken, so --help
+and the quick paths don't pay for the others. See benchmarks/import_time.py.
 
 """
 
+# seconds Audacity gets to answer a command in batch mode, same as
+# audacity_async.DEFAULT_TIMEOUT (not imported for the sake of startup time)
+BATCH_TIMEOUT = 60.0
+
+
+def check_label_files(label_files: List[str]):
+    """
+    Parses and validates the given label files, exits reporting the first
+    malformed line.
+    """
+    import labels as lb
+
+    try:
+        for label_file in label_files:
+            lb.read_labels(label_file)
+    except (OSError, lb.LabelFileError) as e:
+        print(e, file=sys.stderr)
+        raise typer.Exit(code=1)
+
 
 def rebuild(
     filename: Annotated[str, typer.Argument(..., help="The audio file name.")] = None,
@@ -24,30 +45,311 @@ def rebuild(
     label: Annotated[
         bool, typer.Option("-l", "--label", help="Import label file.")
     ] = False,
+    interactive: Annotated[
+        bool,
+        typer.Option(
+            "-i",
+            "--interactive",
+            help="Export labels of an aup3 file via Audacity instead of reading the aup3 directly.",
+        ),
+    ] = False,
+    headless: Annotated[
+        bool,
+        typer.Option(
+            "-H",
+            "--headless",
+            help="Write the aup3 file directly, without Audacity.",
+        ),
+    ] = False,
+    force: Annotated[
+        bool,
+        typer.Option(
+            "-f", "--force", help="Rebuild even if the aup3 file is up to date."
+        ),
+    ] = False,
+    batch: Annotated[
+        List[str],
+        typer.Option(
+            "-b",
+            "--batch",
+            help="Rebuild all audio files of the given directory or glob (repeatable).",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "-j", "--jobs", help="Worker threads preparing songs in batch mode."
+        ),
+    ] = None,
+    timeout: Annotated[
+        float,
+        typer.Option(
+            "-t",
+            "--timeout",
+            help="Seconds Audacity gets to answer a command in batch mode.",
+        ),
+    ] = BATCH_TIMEOUT,
+    audio: Annotated[
+        bool,
+        typer.Option(
+            "-a",
+            "--audio",
+            help="Also export the audio tracks of an aup3 file via Audacity "
+            "(only those changed since their last export).",
+        ),
+    ] = False,
+    sync: Annotated[
+        bool,
+        typer.Option(
+            "-s",
+            "--sync",
+            help="Update the label tracks of the open project from the label files "
+            "of the audio file, changing only what changed.",
+        ),
+    ] = False,
+    verify: Annotated[
+        bool,
+        typer.Option(
+            "-V",
+            "--verify",
+            help="Check that the aup3 file (of the audio file) matches its audio "
+            "and label files, without Audacity.",
+        ),
+    ] = False,
+    profile: Annotated[
+        Optional[str],
+        typer.Option(
+            "-p",
+            "--profile",
+            help="Write a JSON trace of the commands sent to Audacity to the given "
+            "file and print where the time went.",
+        ),
+    ] = None,
+):
+    if verify:
+        import verify_aup3
+
+        if not filename:
+            print("--verify needs a file name.", file=sys.stderr)
+            raise typer.Exit(code=1)
+        raise typer.Exit(code=verify_aup3.report([filename], verbose))
+    context = nullcontext()
+    if profile:
+        import command_profile
+
+        context = command_profile.profile(profile)
+    with context:
+        _rebuild(
+            filename,
+            verbose,
+            label,
+            interactive,
+            headless,
+            force,
+            batch,
+            jobs,
+            timeout,
+            audio,
+            sync,
+        )
+
+
+def export_audio(filename: str, verbose: bool, opened: bool = False):
+    """
+    Exports the audio tracks of the given aup3 file into <name>_<stem>.<ext>
+    next to it (see af.audio_file_names), skipping the tracks whose content
+    didn't change since they were exported (see freshness.stale_exports).
+    Audacity is only needed if a track changed. opened tells whether the aup3
+    is open in Audacity already.
+    """
+    import audacity_funcs as af
+    import aup3
+    import freshness
+
+    path = Path(filename).expanduser().resolve()
+    tracks = aup3.get_wave_tracks(str(path))
+    names = af.audio_file_names([name for name, _ in tracks], path.stem)
+    exports = {
+        str(path.parent / name): digest for name, (_, digest) in zip(names, tracks)
+    }
+    stale = freshness.stale_exports(str(path), exports)
+    if verbose:
+        print(f"audio tracks: {len(stale)} of {len(exports)} changed")
+    if not stale:
+        return
+    if not opened:
+        import audacity_present as ap
+
+        ap.assert_audacity(verbose)
+        af.open_project(str(path))
+    audio = af.get_audio_track_indices()
+    if len(audio) != len(tracks):
+        print(
+            f"{path.name} has {len(tracks)} audio tracks,"
+            f" the project open in Audacity {len(audio)}.",
+            file=sys.stderr,
+        )
+        raise typer.Exit(code=1)
+    files = list(exports)
+    af.export_audio_files(
+        [(audio[files.index(name)], name) for name in stale], verbose=verbose
+    )
+    freshness.record_exports(str(path), {name: exports[name] for name in stale})
+
+
+def rebuild_from_manifest(
+    filename: str, verbose: bool, headless: bool = False, force: bool = False
+):
+    """
+    Rebuilds the aup3 recorded in the given manifest from exactly the inputs
+    recorded there, in their order and with their track names, instead of
+    looking for label files. Exits if an input is missing or changed. Like a
+    rebuild from the audio file, the aup3 is saved and the manifest recorded
+    anew (same inputs, new modification times).
+    """
+    import freshness
+
+    try:
+        audio_file, label_files, project = freshness.read_sources(filename)
+    except freshness.ManifestError as e:
+        print(e, file=sys.stderr)
+        raise typer.Exit(code=1)
+    check_label_files([lfile for lfile, _ in label_files])
+    if Path(project).exists() and not force:
+        print(f"{Path(project).name} is up to date, skipping (--force rebuilds it).")
+        return
+    inputs = [audio_file] + [lfile for lfile, _ in label_files]
+    tracks = [Path(audio_file).stem] + [name for _, name in label_files]
+    if headless:
+        import aup3
+
+        if verbose:
+            print(f"writing audacity project from manifest ({Path(project).name})")
+        aup3.write_project(project, audio_file, label_files, verbose)
+        freshness.record(audio_file, inputs, project, tracks)
+        return
+    import audacity_funcs as af
+    import audacity_present as ap
+
+    ap.assert_audacity(verbose)
+    af.open_audio(audio_file, verbose, label_files)
+    af.save_project(project)  # the manifest vouches for the saved aup3
+    freshness.record(audio_file, inputs, project, tracks)
+    if verbose:
+        print(f"rebuilt audacity project from manifest ({Path(project).name})")
+
+
+def _rebuild(
+    filename: str,
+    verbose: bool,
+    label: bool,
+    interactive: bool,
+    headless: bool,
+    force: bool,
+    batch: List[str],
+    jobs: int,
+    timeout: float,
+    audio: bool = False,
+    sync: bool = False,
 ):
+    if batch:
+        import rebuild_batch
+
+        songs = rebuild_batch.rebuild_all(
+            batch, verbose, force, headless, jobs, timeout
+        )
+        print(rebuild_batch.format_timings(songs))
+        if any(song["status"] == rebuild_batch.STATUS_FAILED for song in songs):
+            raise typer.Exit(code=1)
+        return
+    import audacity_funcs as af
+
     if filename:
         if label:
             if verbose:
                 print("importing label into open audacity project.")
+            check_label_files([filename])
             af.make_label_track_from_file(filename)
             return
+        if sync:
+            import audacity_present as ap
+
+            label_files = af.get_label_files(filename)
+            check_label_files([lfile for lfile, _ in label_files])
+            ap.assert_audacity(verbose)
+            if verbose:
+                print("syncing labels into open audacity project.")
+            af.sync_label_tracks(label_files, verbose)
+            return
+        if af.is_audacity_project(filename) and not interactive:
+            import aup3
+
+            if verbose:
+                print(f"exporting labels from audacity project ({Path(filename).name})")
+            aup3.export_label_tracks(filename, verbose=verbose)
+            if audio:
+                export_audio(filename, verbose)
+            return
+        label_files = None
+        if not af.is_audacity_project(filename):
+            import freshness
+
+            if freshness.is_manifest(filename):
+                rebuild_from_manifest(filename, verbose, headless, force)
+                return
+            project = str(Path(filename).with_suffix(f".{af.AUDACITY_EXTENSION}"))
+            label_files = af.get_label_files(filename)
+            check_label_files([lfile for lfile, _ in label_files])
+            inputs = [filename] + [lfile for lfile, _ in label_files]
+            tracks = [Path(filename).stem] + [name for _, name in label_files]
+            if not force:
+                reasons = freshness.check(filename, inputs, project)
+                if not reasons:
+                    print(
+                        f"{Path(project).name} is up to date, skipping"
+                        " (--force rebuilds it)."
+                    )
+                    return
+                if verbose:
+                    for reason in reasons:
+                        print(f"rebuilding: {reason}")
+            if headless:
+                import aup3
+
+                if verbose:
+                    print(
+                        f"writing audacity project from audio and labels ({Path(project).name})"
+                    )
+                aup3.write_project(project, filename, label_files, verbose)
+                freshness.record(filename, inputs, project, tracks)
+                return
+        import audacity_present as ap
+
         ap.assert_audacity(verbose)
-        af.open_audio(filename, verbose)
+        af.open_audio(filename, verbose, label_files)
         if af.is_audacity_project(filename):
             if verbose:
                 print(f"exporting labels from audacity project ({Path(filename).name})")
-            af.export_label_tracks()
-            # TODO: export audio tracks, same naming scheme as labels (but ending in mp3)
-            #       song track: "orig"
-            #       other tracks: guitar (etc.)
+            af.export_label_files(
+                directory=str(Path(filename).expanduser().parent),
+                stem=Path(filename).stem,
+                verbose=verbose,
+                project=filename,  # just opened, exact where GetInfo cuts times
+            )
+            if audio:
+                export_audio(filename, verbose, opened=True)
         else:
+            af.save_project(project)  # the manifest vouches for the saved aup3
+            freshness.record(filename, inputs, project, tracks)
             if verbose:
                 print(
-                    f"rebuilt audacity project from audio and labels ({Path(filename).name})"
+                    f"rebuilt audacity project from audio and labels ({Path(project).name})"
                 )
 
     else:
-        if not ap.is_audacity_running:
+        import audacity_present as ap
+
+        if not ap.is_audacity_running():
             if verbose:
                 print("No filename passed, Audacity not running. Quitting.")
             return
@@ -67,11 +369,13 @@ def rebuild(
         if af.get_selected_label_track_indices():
             if verbose:
                 print("exporting selected label track")
-            af.export_selected_label_tracks()
+            af.export_label_files(
+                af.get_selected_label_track_indices(), verbose=verbose
+            )
         else:
             if verbose:
                 print("exporting all label tracks")
-            af.export_label_tracks()
+            af.export_label_files(verbose=verbose)
 
 
 def custom_help_check() -> None:
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import json
+import os
+import socket
+import sys
+from typing import Dict, List, Optional
+
+"""
+rebuildap_client.py
+
+Thin rebuildap front end: forwards the command line to a running rebuildapd
+(see rebuildapd.py) over its Unix socket and prints the daemon's output.
+Without a daemon (or with REBUILDAP_NO_DAEMON set), rebuildap runs in-process
+as before.
+
+Only the standard library is imported up front, so forwarding a request
+doesn't pay for importing typer, pyaudacity etc.
+
+"""
+
+
+def _default_socket_path() -> str:
+    """
+    Returns the daemon's socket in the user's runtime directory, falling back
+    to a per-user name in /tmp.
+    """
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "rebuildapd.sock")
+    return f"/tmp/rebuildapd.{os.getuid()}.sock" if hasattr(os, "getuid") else ""
+
+
+SOCKET_PATH = os.environ.get("REBUILDAP_SOCKET") or _default_socket_path()
+
+# set to run rebuildap in-process even if a daemon is running
+NO_DAEMON_VARIABLE = "REBUILDAP_NO_DAEMON"
+
+# seconds to wait for the daemon to accept a connection
+CONNECT_TIMEOUT = 0.5
+
+
+class DaemonError(Exception):
+    pass
+
+
+def send_request(request: Dict, socket_path: str = SOCKET_PATH) -> Optional[Dict]:
+    """
+    Sends the given request to the daemon and returns its response, None if
+    no daemon is listening on socket_path.
+    Raises DaemonError if the daemon fails while handling the request.
+    Tested
+    """
+    if not socket_path or not hasattr(socket, "AF_UNIX"):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            return None
+        # requests may take long (imports, interactive exports)
+        sock.settimeout(None)
+        try:
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as f:
+                line = f.readline()
+        except OSError as e:
+            raise DaemonError(f"rebuildapd at {socket_path} failed: {e}")
+    if not line:
+        raise DaemonError(f"rebuildapd at {socket_path} closed the connection.")
+    return json.loads(line)
+
+
+def forward(args: List[str], cwd: str, socket_path: str = SOCKET_PATH) -> Optional[int]:
+    """
+    Lets the daemon run rebuildap with the given arguments in the given
+    directory, prints its output and returns its exit code. Returns None if
+    no daemon is listening.
+    Tested indirectly
+    """
+    response = send_request({"args": args, "cwd": cwd}, socket_path)
+    if response is None:
+        return None
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["code"]
+
+
+def main():
+    if not os.environ.get(NO_DAEMON_VARIABLE):
+        try:
+            code = forward(sys.argv[1:], os.getcwd())
+        except DaemonError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        if code is not None:
+            sys.exit(code)
+    # no daemon: pay for the imports
+    import rebuildap
+
+    rebuildap.main()
+
+
+if __name__ == "__main__":
+    main()
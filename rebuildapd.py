@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+import contextlib
+import io
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Dict, List
+
+import click
+import typer
+
+import audacity_funcs as af
+import audacity_present as ap
+import rebuildap
+import rebuildap_client as client
+
+"""
+rebuildapd.py
+
+rebuildap daemon for editor integrations that run rebuildap on every save.
+
+Listens on a Unix socket (rebuildap_client.SOCKET_PATH) and runs the command
+lines forwarded by the thin rebuildap client (see rebuildap_client.py)
+in-process, one at a time. Modules stay imported, and the pipes to Audacity
+and the cached track state are kept between requests. The cache is only
+dropped when the pipes are (re)opened or its generation changed since the last
+request. A request failing because Audacity was restarted in between (i.e. the
+held pipes broke) is retried once on fresh pipes.
+
+Protocol: one JSON line per connection each way,
+    request:  {"args": [...], "cwd": "..."}, {"ping": true} or {"stop": true}
+    response: {"code": 0, "stdout": "...", "stderr": "..."}
+
+"""
+
+
+# track cache generation at the end of the last request
+_session = {"generation": None}
+
+
+def _prepare_session() -> bool:
+    """
+    (Re)opens the pipes to Audacity if it's running, dropping the cached track
+    state if the pipes are new or the cache changed since the last request.
+    Returns true if the pipes were held from an earlier request.
+    """
+    held = af.is_connected()
+    if not held:
+        if ap.is_audacity_running():
+            af.connect()
+        af.invalidate_track_cache()
+    elif af.get_track_cache_stats()["generation"] != _session["generation"]:
+        af.invalidate_track_cache()
+    return held
+
+
+def _invoke(command: click.Command, args: List[str]) -> int:
+    """
+    Runs the click command with the given arguments and returns its exit code,
+    printing errors like the command line would.
+    """
+    try:
+        code = command.main(args=args, prog_name="rebuildap", standalone_mode=False)
+        return code if isinstance(code, int) else 0
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.exceptions.Abort:
+        return 1
+    except SystemExit as e:
+        # click exits on EPIPE, e.g. on a pipe to Audacity that broke
+        return e.code if isinstance(e.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+
+def run(args: List[str], cwd: str) -> Dict:
+    """
+    Runs rebuildap with the given command line arguments in the given
+    directory and returns its exit code and output.
+    Tested
+    """
+    if "-h" in args or "-?" in args:
+        args = ["--help"]
+    app = typer.Typer(add_completion=False)
+    app.command()(rebuildap.rebuild)
+    command = typer.main.get_command(app)
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    previous = os.getcwd()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            os.chdir(cwd)
+            held = _prepare_session()
+            code = _invoke(command, args)
+            if held and not af.is_connected():
+                # the held pipes broke (Audacity restarted?): retry once
+                for output in (stdout, stderr):
+                    output.seek(0)
+                    output.truncate()
+                _prepare_session()
+                code = _invoke(command, args)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os.chdir(previous)
+            _session["generation"] = af.get_track_cache_stats()["generation"]
+    return {"code": code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        if request.get("ping"):
+            response = {"code": 0, "stdout": "", "stderr": ""}
+        elif request.get("stop"):
+            response = {"code": 0, "stdout": "rebuildapd stopped.\n", "stderr": ""}
+            threading.Thread(target=self.server.shutdown).start()
+        else:
+            start = time.perf_counter()
+            response = run(request.get("args", []), request.get("cwd", "."))
+            if self.server.verbose:
+                print(
+                    f"{' '.join(request.get('args', []))}: exit {response['code']}"
+                    f" in {time.perf_counter() - start:.3f} s"
+                )
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class Server(socketserver.UnixStreamServer):
+    def __init__(self, socket_path: str, verbose: bool = False):
+        self.verbose = verbose
+        # bind with owner-only permissions: no other user may connect, not even
+        # before chmod
+        umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, _Handler)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_path, 0o600)
+
+
+def make_server(socket_path: str = client.SOCKET_PATH, verbose: bool = False) -> Server:
+    """
+    Returns the daemon's server listening on socket_path, replacing a stale
+    socket file. Raises RuntimeError if a daemon is listening already or the
+    path is anything but a socket of the current user.
+    Tested
+    """
+    path = Path(socket_path)
+    try:
+        info = os.lstat(socket_path)
+    except FileNotFoundError:
+        info = None
+    if info is not None:
+        if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+            raise RuntimeError(f"{socket_path} isn't a socket of the current user")
+        if client.send_request({"ping": True}, socket_path):
+            raise RuntimeError(f"rebuildapd is already listening on {socket_path}")
+        path.unlink()
+    return Server(socket_path, verbose)
+
+
+def serve(
+    socket_path: str = typer.Option(
+        client.SOCKET_PATH, "-s", "--socket", help="Unix socket to listen on."
+    ),
+    verbose: bool = typer.Option(False, "-v", "--verbose", help="Log requests."),
+    stop: bool = typer.Option(False, "--stop", help="Stop the running daemon."),
+):
+    """
+    Runs the rebuildap daemon until stopped (--stop or Ctrl-C).
+    """
+    if stop:
+        response = client.send_request({"stop": True}, socket_path)
+        print(response["stdout"] if response else "rebuildapd isn't running.", end="")
+        return
+    try:
+        server = make_server(socket_path, verbose)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        raise typer.Exit(code=1)
+    if verbose:
+        print(f"rebuildapd listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        af.disconnect()
+        Path(socket_path).unlink()
+
+
+def main():
+    typer.run(serve)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,38 @@
 #!/usr/bin/env python
+import asyncio
+import hashlib
+import json
+import os
 import random
+import shutil
+import sqlite3
+import stat
+import struct
+import sys
+import tempfile
+import threading
 import time
+import wave
+from pathlib import Path
 
 import pyaudacity as pa
 import pytest
 
+import audacity_async as aa
 import audacity_funcs as af
 import audacity_present as ap
+import audio_cache
+import aup3
+import command_profile
+import fake_audacity
+import freshness
+import labels as lb
+import rebuild_batch
+import rebuildap
+import rebuildap_client
+import rebuildapd
+import verify_aup3
+from benchmarks import import_time, roundtrips
 
 AUDIO_TRACK_1_NAME = "First Audio Track"
 AUDIO_TRACK_2_NAME = "Second Audio Track"
@@ -14,14 +40,20 @@ AUDIO_TRACK_2_NAME = "Second Audio Track"
 LABEL_TRACK_1_NAME = "First Label Track"
 LABEL_TRACK_2_NAME = "Second Label Track"
 
-SLEEP_BETWEEN_TESTS = 0.3
+# Audacity's GUI is only driven on macOS (see audacity_present), elsewhere the
+# tests run against the fake
+USE_FAKE_AUDACITY = sys.platform != "darwin" or bool(
+    os.environ.get("REBUILDAP_FAKE_AUDACITY")
+)
+
+SLEEP_BETWEEN_TESTS = 0 if USE_FAKE_AUDACITY else 0.3
 
 
 def create_audio_track(track_name: str = "Audio Track"):
-    pa.do("NewMonoTrack")
-    pa.do('SelectTime: Start="1" End="3"')
-    pa.do('Noise: Type="Brownian" Amplitude="0.8"')
-    pa.do(f'SetTrack: Name="{track_name}"')
+    af.do("NewMonoTrack")
+    af.do('SelectTime: Start="1" End="3"')
+    af.do('Noise: Type="Brownian" Amplitude="0.8"')
+    af.do(f'SetTrack: Name="{track_name}"')
 
 
 @pytest.fixture(scope="function", autouse=False)
@@ -70,8 +102,12 @@ def four_tracks_sel(four_tracks):
 
 @pytest.fixture(scope="module", autouse=True)
 def setup():
+    if USE_FAKE_AUDACITY:
+        with fake_audacity.FakeAudacity() as fake:
+            yield fake
+        return
     ap.assert_audacity(False)
-    yield
+    yield None
     ap.close_audacity_window_as()
 
 
@@ -116,6 +152,145 @@ def test_make_label(undo):
     assert tracks[0]["name"] == label
 
 
+def test_make_label_track_from_file(tmp_path, setup):
+    label_file = tmp_path / "beat_song.txt"
+    label_file.write_text('0\t0\t1\n0.5\t0.5\t"2"\n0.5\t1.75\tlong\n')
+    for native, pushes in ((False, 1), (True, 7)):
+        undo_states = setup.undo_stats["undo_states"] if setup else 0
+        af.make_label_track_from_file(str(label_file), native=native)
+        try:
+            if setup:
+                # ImportLabels, or NewLabelTrack, then AddLabel, SetLabel per label
+                assert setup.undo_stats["undo_states"] - undo_states == pushes
+            assert [track["name"] for track in af.get_label_tracks()] == ["beat_song"]
+            assert af.get_labels() == [
+                (0, [[0.0, 0.0, "1"], [0.5, 0.5, '"2"'], [0.5, 1.75, "long"]])
+            ]
+            assert af.get_label_count() == 3
+        finally:
+            af.select_tracks([0])
+            af.remove_selected_tracks()
+
+
+def test_write_label_files(tmp_path, monkeypatch):
+    pytest.importorskip("numpy")
+    label_file = tmp_path / "beat_song.txt"
+    label_file.write_text("0.25\t0.25\t1\n1234.561\t1234.561\t2\n")
+    af.make_label_track_from_file(str(label_file), "beat")
+    (tmp_path / "other.txt").write_text("0.25\t0.25\t1\n")
+    af.make_label_track_from_file(str(tmp_path / "other.txt"), "other")
+    # moved by less than GetInfo's resolution at 1234 s (1 ms)
+    af.do("SetLabel: Label=1 Start=1234.5614 End=1234.5614")
+    interactive = []
+    monkeypatch.setattr(af, "export_labels_list", interactive.extend)
+    try:
+        written, inexact = af.write_label_files(directory=str(tmp_path), stem="song")
+        # the cut 1234.56 isn't taken from the stale beat_song.txt
+        assert written == [str(tmp_path / "other_song.txt")]
+        assert inexact == [0]
+        assert label_file.read_text() == "0.25\t0.25\t1\n1234.561\t1234.561\t2\n"
+
+        # exact from the project saved as a copy
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        assert af.export_label_files(
+            directory=str(tmp_path), stem="song"
+        ) == written + [str(label_file)]
+        assert interactive == []
+        assert label_file.read_text() == (
+            "0.250000\t0.250000\t1\n1234.561400\t1234.561400\t2\n"
+        )
+        assert len(list(tmp_path.glob("rebuildap-*/labels.aup3"))) == 1
+
+        # exact from the aup3 the project was opened from
+        label_file.write_text("0.25\t0.25\t1\n1234.561\t1234.561\t2\n")
+        audio = str(tmp_path / "song.wav")
+        write_wav(audio, [0] * 100)
+        project = str(tmp_path / "song.aup3")
+        saved = tmp_path / "saved.txt"
+        saved.write_text("0.25\t0.25\t1\n1234.5614\t1234.5614\t2\n")
+        aup3.write_project(project, audio, [(str(saved), "beat")])
+        interactive.clear()
+        assert af.export_label_files(
+            directory=str(tmp_path), stem="song", project=project
+        ) == written + [str(label_file)]
+        assert interactive == []
+        assert label_file.read_text() == (
+            "0.250000\t0.250000\t1\n1234.561400\t1234.561400\t2\n"
+        )
+    finally:
+        af.select_tracks([0, 1])
+        af.remove_selected_tracks()
+
+
+def test_async_get_tracks(four_tracks):
+    async def get_tracks():
+        async with aa.AsyncAudacity() as client:
+            return await client.get_tracks()
+
+    assert asyncio.run(get_tracks()) == af.get_tracks()
+
+
+def test_async_do_all():
+    async def do_all(commands):
+        async with aa.AsyncAudacity() as client:
+            return await client.do_all(commands)
+
+    assert len(asyncio.run(do_all(["SelectNone:"] * 100))) == 100
+    with pytest.raises(pa.PyAudacityException, match="NoSuchCommand"):
+        asyncio.run(do_all(["SelectNone:", "NoSuchCommand:", "SelectNone:"]))
+
+
+def test_async_deadline(setup):
+    if setup is None:
+        pytest.skip("needs the fake's latencies")
+
+    async def late_then_next():
+        async with aa.AsyncAudacity() as client:
+            with pytest.raises(aa.DeadlineExceeded, match="within 0.05 s"):
+                await client.do('Message: Text="late"', timeout=0.05)
+            # the late response is dropped, not taken for the next command's
+            return await client.do('Message: Text="next"', timeout=5)
+
+    setup.latencies["Message"] = 0.2
+    try:
+        assert asyncio.run(late_then_next()).startswith("next\n")
+    finally:
+        del setup.latencies["Message"]
+
+
+def test_async_connect_timeout(tmp_path, monkeypatch):
+    pipe_to = str(tmp_path / "to")
+    pipe_from = str(tmp_path / "from")
+    os.mkfifo(pipe_to)
+    os.mkfifo(pipe_from)
+    monkeypatch.setattr(af, "PIPE_TO_AUDACITY", pipe_to)
+    monkeypatch.setattr(af, "PIPE_FROM_AUDACITY", pipe_from)
+
+    async def connect():
+        client = aa.AsyncAudacity()
+        try:
+            await client.connect(timeout=0.1)
+        finally:
+            client.close()
+
+    # nobody opens the command pipe
+    with pytest.raises(aa.DeadlineExceeded, match="didn't open .*to"):
+        asyncio.run(connect())
+    # the command pipe is opened, but nobody opens the response pipe
+    reader = os.open(pipe_to, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        with pytest.raises(aa.DeadlineExceeded, match="didn't open .*from"):
+            asyncio.run(connect())
+    finally:
+        os.close(reader)
+
+
+def test_audacity_ready():
+    assert ap.is_audacity_running()
+    assert ap.is_audacity_ready()
+    assert ap.wait_for_audacity() < ap.PROBE_TIMEOUT
+
+
 def test_select_first_audio(four_tracks):
     af.select_first_audio_track()
     tracks = af.get_selected_tracks()
@@ -274,10 +449,18 @@ def test_select_track(four_tracks):
 def test_focus_track(four_tracks):
     track = 2
 
-    af.focus_track(track)
+    assert af.focus_track(track) == track
     assert af.get_focused_track_index() == track
 
 
+def test_focus_track_keeps_selection(four_tracks_sel):
+    af.focus_track(3)
+    assert af.get_focused_track_index() == 3
+    af.invalidate_track_cache()
+    assert af.get_focused_track_index() == 3
+    assert af.get_selected_track_indices() == [0, 1, 2]
+
+
 def test_focus_track2(four_tracks):
     track = 2
 
@@ -328,6 +511,38 @@ def test_reorder_labels(identifiers, expected):
     assert af.reorder_labels(identifiers) == expected
 
 
+def test_label_index(tmp_path):
+    for name in [
+        "beat_my_song.txt",
+        "part_my_song.txt",
+        "chord_song.txt",
+        ".x_song.txt",
+    ]:
+        (tmp_path / name).write_text("")
+    (tmp_path / "my_song.wav").write_text("")
+    index = af.LabelIndex(racy_seconds=0)
+    directory = str(tmp_path)
+    expected = [str(tmp_path / "part_my_song.txt"), str(tmp_path / "beat_my_song.txt")]
+    assert index.lookup(directory, "my_song") == expected
+    assert index.lookup(directory, "song") == [
+        str(tmp_path / "part_my_song.txt"),
+        str(tmp_path / "chord_song.txt"),
+        str(tmp_path / "beat_my_song.txt"),
+    ]
+    assert index.lookup(directory, "wav") == []
+    assert index.lookup(str(tmp_path / "missing"), "song") == []
+    assert index.scans == 1
+    (tmp_path / "lyric_my_song.txt").write_text("")
+    os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 1))
+    expected.insert(1, str(tmp_path / "lyric_my_song.txt"))
+    assert index.lookup(directory, "my_song") == expected
+    assert index.scans == 2
+    assert af.get_label_files(str(tmp_path / "my_song.wav")) == [
+        (label_file, os.path.basename(label_file)[: -len("_my_song.txt")])
+        for label_file in expected
+    ]
+
+
 def test_is_audacity_project():
     assert af.is_audacity_project("bla.aup3")
 
@@ -349,6 +564,1420 @@ def test_focus(four_tracks):
         assert af.get_focused_track_index() == j
 
 
+@pytest.mark.parametrize(
+    "command, expected",
+    [
+        ("SelectTracks: Track=0 Mode=Set", "SelectTracks"),
+        ("SelectNone:", "SelectNone"),
+        ("NewMonoTrack", "NewMonoTrack"),
+        ('GetInfo: Type="Tracks"', "GetInfo"),
+        ("", ""),
+    ],
+)
+def test_command_name(command, expected):
+    assert af.command_name(command) == expected
+
+
+def test_is_read_only_command():
+    assert af.is_read_only_command('GetInfo: Type="Tracks" Format="JSON"')
+    assert not af.is_read_only_command("SelectNone:")
+    assert af.is_read_only_command('SaveProject2: Filename="/tmp/song.aup3"')
+    assert not af.is_read_only_command("Undo:")
+
+
+def test_track_cache(four_tracks):
+    af.reset_track_cache_stats()
+    af.get_tracks()
+    af.get_selected_track_indices()
+    af.get_label_track_indices()
+    stats = af.get_track_cache_stats()
+    assert stats["misses"] <= 1
+    assert stats["hits"] >= 2
+    af.do("SelectNone:")
+    assert af.get_selected_track_indices() == []
+    assert af.get_track_cache_stats()["misses"] == stats["misses"] + 1
+
+
+def test_track_cache_copies(four_tracks):
+    tracks = af.get_tracks()
+    tracks[0]["name"] = "changed"
+    assert af.get_tracks()[0]["name"] == LABEL_TRACK_1_NAME
+
+
+def test_is_response_ok():
+    assert af.is_response_ok("BatchCommand finished: OK\n")
+    assert af.is_response_ok('[{"name": "x"}]\nBatchCommand finished: OK\n')
+    assert not af.is_response_ok("BatchCommand finished: Failed!\n")
+
+
+def test_batch(four_tracks):
+    with af.batch():
+        af.select_track(0)
+        af.unselect_track(0)
+        af.select_track(2)
+        # queries flush the queued commands
+        assert af.get_selected_track_indices() == [2]
+        af.select_tracks([1, 3])
+    assert af.get_selected_track_indices() == [1, 3]
+
+
+def test_send_commands(four_tracks):
+    responses = af.send_commands(["SelectNone:", "SelectTracks: Track=1 Mode=Add"])
+    assert len(responses) == 2
+    assert all(af.is_response_ok(response) for response in responses)
+    assert af.get_selected_track_indices() == [1]
+
+
+def test_send_commands_fails(four_tracks):
+    with pytest.raises(pa.PyAudacityException):
+        af.send_commands(["SelectNone:", "NoSuchCommand:", "SelectAll:"])
+
+
+@pytest.mark.parametrize(
+    "tracks, expected",
+    [
+        ([], []),
+        ([3], [(3, 1)]),
+        ([0, 1, 2, 5, 6, 9], [(0, 3), (5, 2), (9, 1)]),
+        ([2, 0, 1, 1], [(0, 3)]),
+    ],
+)
+def test_track_runs(tracks, expected):
+    assert af.track_runs(tracks) == expected
+
+
+@pytest.mark.parametrize(
+    "current, target, expected",
+    [
+        # unchanged selection costs nothing
+        ([0, 2], [0, 2], []),
+        ([], [], []),
+        # contiguous tracks are selected by one command
+        ([], [0, 1, 2], ["SelectTracks: Track=0 TrackCount=3 Mode=Add"]),
+        # small diffs are applied incrementally
+        ([0, 1, 2, 5], [0, 1, 2], ["SelectTracks: Track=5 Mode=Remove"]),
+        (
+            [1],
+            [1, 2, 3],
+            ["SelectTracks: Track=2 TrackCount=2 Mode=Add"],
+        ),
+        # large diffs replace the selection
+        (
+            [3],
+            [0, 1, 2, 5, 6, 8],
+            [
+                "SelectTracks: Track=0 TrackCount=3 Mode=Set",
+                "SelectTracks: Track=5 TrackCount=2 Mode=Add",
+                "SelectTracks: Track=8 Mode=Add",
+            ],
+        ),
+        ([0, 2, 4], [], ["SelectNone:"]),
+    ],
+)
+def test_plan_selection(current, target, expected):
+    assert af.plan_selection(current, target) == expected
+
+
+def test_select_tracks_unchanged(four_tracks_sel):
+    af.get_tracks()
+    generation = af.get_track_cache_stats()["generation"]
+    af.select_tracks([0, 1, 2])
+    with af.save_selection():
+        pass
+    assert af.get_track_cache_stats()["generation"] == generation
+
+
+def test_plan_track_states():
+    tracks = [
+        {"kind": "label", "selected": 1},
+        {"kind": "wave", "selected": 1, "mute": 0, "solo": 0},
+        {"kind": "label", "selected": 0},
+        {"kind": "wave", "selected": 0, "mute": 1, "solo": 0},
+    ]
+    # nothing to change, no commands
+    assert af.plan_track_states(tracks, {1: {"mute": False}, 3: {"mute": 1}}) == []
+    # label tracks can't be muted
+    assert af.plan_track_states(tracks, {0: {"mute": True}}) == []
+    assert af.plan_track_states(tracks, {1: {"mute": True}, 3: {"mute": True}}) == [
+        "SelectTracks: Track=0 Mode=Remove",
+        "SetTrack: Mute=1",
+        "SelectTracks: Track=0 Mode=Add",
+    ]
+    assert af.plan_track_states(tracks, {2: {"selected": True}}) == [
+        "SelectTracks: Track=2 Mode=Add"
+    ]
+
+
+def test_set_track_states(four_tracks_sel):
+    af.set_track_states(
+        {1: {"mute": True, "solo": True}, 3: {"solo": True}, 2: {"selected": False}}
+    )
+    af.invalidate_track_cache()
+    assert af.get_muted_track_indices() == [1]
+    assert af.get_solo_track_indices() == [1, 3]
+    assert af.get_selected_track_indices() == [0, 1]
+
+
+def test_quote():
+    assert af.quote("Verse") == '"Verse"'
+    assert af.quote('say "hi" \\o/') == '"say \\"hi\\" \\\\o/"'
+
+
+def test_plan_label_fill():
+    assert af.plan_label_fill(lb.Labels(), 3) == []
+    labels = lb.Labels([(0.0, 0.5, "Intro"), (0.5, 2.0, "Verse")])
+    assert af.plan_label_fill(labels, 3) == [
+        "SelectTime: Start=3.0 End=3.0 RelativeTo=ProjectStart",
+        "AddLabel:",
+        "AddLabel:",
+        'SetLabel: Label=3 Text="Intro" Start=0.0 End=0.5',
+        'SetLabel: Label=4 Text="Verse" Start=0.5 End=2.0',
+    ]
+
+
+def test_is_precise():
+    assert af.is_precise("0")
+    assert af.is_precise("0.123457")
+    assert af.is_precise("1.5e-05")
+    assert not af.is_precise("1.5")
+    assert not af.is_precise("123.457")
+    assert not af.is_precise("1.23457e+06")
+
+
+def test_resolve_labels():
+    assert af.resolve_labels([["0.5", "0.75", "a"], ["0", "0.001", "b"]]) == [
+        (0.5, 0.75, "a", -1.0, -1.0),
+        (0.0, 0.001, "b", -1.0, -1.0),
+    ]
+    assert af.resolve_labels([["0.5", "123.457", "a"]]) is None
+
+
+def test_plan_label_track():
+    labels = lb.Labels([(0.0, 0.5, "Intro")])
+    assert af.plan_label_track(2, 7, "part", labels) == [
+        "NewLabelTrack:",
+        "SelectTracks: Track=2 Mode=Set",
+        'SetTrack: Focused=1 Name="part"',
+        "SelectTime: Start=1.5 End=1.5 RelativeTo=ProjectStart",
+        "AddLabel:",
+        'SetLabel: Label=7 Text="Intro" Start=0.0 End=0.5',
+    ]
+
+
+def test_same_time():
+    assert af.same_time("0.5", 0.5)
+    assert af.same_time("0.5", 0.5000004)
+    assert not af.same_time("0.5", 0.500001)
+    # cut by GetInfo's precision limit: may be any of them
+    assert not af.same_time("123.457", 123.457)
+    assert not af.same_time("123.457", 123.4567)
+
+
+def test_plan_label_sync():
+    current = [["0", "0", "a"], ["0.1", "0.1", "b"], ["0.2", "0.25", "c"]]
+    labels = lb.Labels([(0.0, 0.0, "a"), (0.1, 0.1, "B"), (0.2, 0.25, "c")])
+    assert af.plan_label_sync(3, current, labels, 4) == ['SetLabel: Label=5 Text="B"']
+    same = lb.Labels([(0.0, 0.0, "a"), (0.1, 0.1, "b"), (0.2, 0.25, "c")])
+    assert af.plan_label_sync(3, current, same, 4) == []
+    # moving a label in front of another re-sorts them
+    moved = lb.Labels([(0.0, 0.0, "a"), (0.1, 0.1, "c"), (0.15, 0.15, "b")])
+    assert af.plan_label_sync(3, current, moved, 0) == [
+        'SetLabel: Label=1 Text="c"',
+        'SetLabel: Label=2 Text="b" Start=0.15 End=0.15',
+    ]
+    swapped = lb.Labels([(0.0, 0.0, "a"), (0.2, 0.25, "c"), (0.3, 0.3, "b")])
+    assert af.plan_label_sync(3, current, swapped, 0) == [
+        'SetLabel: Label=1 Text="c" Start=0.2 End=0.25',
+        'SetLabel: Label=2 Text="b" Start=0.3 End=0.3',
+    ]
+    added = lb.Labels(
+        list(zip(same.starts, same.ends, same.titles)) + [(0.3, 0.4, "d")]
+    )
+    assert af.plan_label_sync(3, current, added, 0) == [
+        "SelectTracks: Track=3 Mode=Set",
+        "SetTrack: Focused=1",
+        "SelectTime: Start=1.4 End=1.4 RelativeTo=ProjectStart",
+        "AddLabel:",
+        'SetLabel: Label=3 Text="d" Start=0.3 End=0.4',
+    ]
+    assert af.plan_label_sync(3, current, lb.Labels([(0.0, 0.0, "a")]), 0) is None
+    # times cut by GetInfo are set even if they look the same
+    cut = [["0", "0", "a"], ["1234.56", "1234.56", "b"]]
+    moved = lb.Labels([(0.0, 0.0, "a"), (1234.561, 1234.561, "b")])
+    assert af.plan_label_sync(3, cut, moved, 0) == [
+        "SetLabel: Label=1 Start=1234.561 End=1234.561"
+    ]
+
+
+def test_plan_track_move():
+    assert af.plan_track_move(5, 4) == ["TrackMoveUp:"]
+    assert af.plan_track_move(5, 1) == ["TrackMoveTop:", "TrackMoveDown:"]
+    assert af.plan_track_move(1, 3) == ["TrackMoveDown:"] * 2
+    assert af.plan_track_move(2, 2) == []
+
+
+def test_sync_label_tracks(tmp_path, setup):
+    create_audio_track("song")
+    files = {
+        "lyric": "0\t0\tla\n0.5\t0.5\tlu\n",
+        "chord": "0\t0.5\tC\n0.5\t0.75\tG\n",
+        "beat": "0\t0\t1\n0.25\t0.25\t2\n",
+    }
+    for name, text in files.items():
+        (tmp_path / f"{name}_song.txt").write_text(text)
+        af.make_label_track_from_file(str(tmp_path / f"{name}_song.txt"), name)
+    audio = str(tmp_path / "song.wav")
+    try:
+        label_files = af.get_label_files(audio)
+        assert af.sync_label_tracks(label_files) == {
+            name: af.SYNC_UNCHANGED for name in files
+        }
+
+        # a one-line lyric edit is a single SetLabel
+        (tmp_path / "lyric_song.txt").write_text("0\t0\tla\n0.5\t0.5\tlo\n")
+        undo_states = setup.undo_stats["undo_states"] if setup else 0
+        af.reset_pipe_stats()
+        af.start_profiling()
+        status = af.sync_label_tracks(label_files)
+        records = af.stop_profiling()
+        assert status["lyric"] == af.SYNC_UPDATED
+        assert [r["command"] for r in records].count("SetLabel") == 1
+        assert af.get_pipe_stats()["exchanges"] <= 3
+        if setup:
+            assert setup.undo_stats["undo_states"] - undo_states == 1
+
+        # fewer labels: replaced at its position, more labels: added in place
+        (tmp_path / "chord_song.txt").write_text("0\t0.75\tC\n")
+        (tmp_path / "beat_song.txt").write_text("0\t0\t1\n0.25\t0.25\t2\n0.5\t0.5\t3\n")
+        (tmp_path / "part_song.txt").write_text("0\t0.75\tverse\n")
+        label_files = af.get_label_files(audio)
+        assert af.sync_label_tracks(label_files) == {
+            "lyric": af.SYNC_UNCHANGED,
+            "chord": af.SYNC_REPLACED,
+            "beat": af.SYNC_UPDATED,
+            "part": af.SYNC_ADDED,
+        }
+        tracks = af.get_tracks()
+        assert [t["name"] for t in tracks] == ["song", "lyric", "chord", "beat", "part"]
+        assert af.get_labels() == [
+            (1, [[0.0, 0.0, "la"], [0.5, 0.5, "lo"]]),
+            (2, [[0.0, 0.75, "C"]]),
+            (3, [[0.0, 0.0, "1"], [0.25, 0.25, "2"], [0.5, 0.5, "3"]]),
+            (4, [[0.0, 0.75, "verse"]]),
+        ]
+
+        # more edits than undo states for replacing the track: replaced
+        beats = "".join(f"{i / 8}\t{i / 8}\t{i}\n" for i in range(8))
+        (tmp_path / "beat_song.txt").write_text(beats)
+        assert af.sync_label_tracks(label_files)["beat"] == af.SYNC_REPLACED
+        assert [t["name"] for t in af.get_tracks()][3] == "beat"
+
+        # a move by less than GetInfo's resolution at 1234 s is synced
+        (tmp_path / "x_song.txt").write_text("1234.561\t1234.561\ty\n")
+        label_files = af.get_label_files(audio)
+        assert af.sync_label_tracks(label_files)["x"] == af.SYNC_ADDED
+        (tmp_path / "x_song.txt").write_text("1234.5614\t1234.5614\ty\n")
+        assert af.sync_label_tracks(label_files)["x"] == af.SYNC_UPDATED
+        if setup:
+            assert setup.project.tracks[-1]["labels"] == [(1234.5614, 1234.5614, "y")]
+
+            # a failed import keeps the track it would have replaced
+            names = [t["name"] for t in af.get_tracks()]
+            labels = af.get_labels()
+            (tmp_path / "beat_song.txt").write_text("0\t0\t1\n")
+            (tmp_path / "z_song.txt").write_text("0\t0\tz\n")
+            label_files = af.get_label_files(audio)
+            for failing in ("ImportLabels", "SetTrack"):  # latter after importing
+                setup.failures.add(failing)
+                try:
+                    with pytest.raises(pa.PyAudacityException):
+                        af.sync_label_tracks(label_files)
+                finally:
+                    setup.failures.clear()
+                assert [t["name"] for t in af.get_tracks()] == names
+                assert af.get_labels() == labels
+    finally:
+        af.select_tracks(list(range(af.get_track_count())))
+        af.remove_selected_tracks()
+
+
+def test_plan_label_import():
+    assert af.plan_label_import(2, "/songs/part_song.txt", "part", 0) == [
+        "SelectTracks: Track=0 Mode=Set",
+        "SelTrackStartToEnd:",
+        'ImportLabels: fname="/songs/part_song.txt"',
+        "SelectTracks: Track=2 Mode=Set",
+        'SetTrack: Focused=1 Name="part"',
+    ]
+    assert af.plan_label_import(0, "/songs/part_song.txt", "part")[0].startswith(
+        "ImportLabels:"
+    )
+
+
+def test_wait_until():
+    calls = []
+
+    def ready():
+        calls.append(time.perf_counter())
+        return len(calls) == 4
+
+    assert ap.wait_until(ready, 5, "test") < 1
+    # backoff: the pauses between probes grow
+    pauses = [b - a for a, b in zip(calls, calls[1:])]
+    assert pauses == sorted(pauses)
+    with pytest.raises(pa.PyAudacityException, match="Gave up waiting for never"):
+        ap.wait_until(lambda: False, 0.2, "never")
+
+
+def test_daemon_run_help():
+    response = rebuildapd.run(["-h"], ".")
+    assert response["code"] == 0
+    assert "Usage" in response["stdout"]
+
+
+def test_daemon(tmp_path):
+    # macOS limits socket paths to ~100 characters, too short for tmp_path
+    socket_path = f"/tmp/rebuildapd-test.{os.getpid()}.sock"
+    server = rebuildapd.make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        with pytest.raises(RuntimeError, match="already listening"):
+            rebuildapd.make_server(socket_path)
+        request = {"args": ["-l", "missing.txt"], "cwd": str(tmp_path)}
+        response = rebuildap_client.send_request(request, socket_path)
+        assert response["code"] == 1
+        assert "missing.txt" in response["stderr"]
+        assert rebuildap_client.send_request({"stop": True}, socket_path)["code"] == 0
+        thread.join(5)
+        assert not thread.is_alive()
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+        af.disconnect()
+    assert rebuildap_client.send_request(request, socket_path) is None
+
+
+def test_daemon_socket_mode(monkeypatch):
+    socket_path = f"/tmp/rebuildapd-test-mode.{os.getpid()}.sock"
+    # owner-only from bind on, i.e. without the chmod after it
+    monkeypatch.setattr(rebuildapd.os, "chmod", lambda path, mode: None)
+    server = rebuildapd.make_server(socket_path)
+    try:
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) & 0o077 == 0
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
+
+
+def test_daemon_socket_checks(tmp_path):
+    not_socket = tmp_path / "rebuildapd.sock"
+    not_socket.write_text("")
+    with pytest.raises(RuntimeError, match="isn't a socket"):
+        rebuildapd.make_server(str(not_socket))
+    assert not_socket.exists()
+    link = tmp_path / "link.sock"
+    link.symlink_to(not_socket)
+    with pytest.raises(RuntimeError, match="isn't a socket"):
+        rebuildapd.make_server(str(link))
+
+
+def test_socket_path(monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert rebuildap_client._default_socket_path() == "/run/user/1000/rebuildapd.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert (
+        rebuildap_client._default_socket_path() == f"/tmp/rebuildapd.{os.getuid()}.sock"
+    )
+
+
+@pytest.mark.skipif(not USE_FAKE_AUDACITY, reason="restarts Audacity")
+def test_daemon_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(af, "PIPE_TO_AUDACITY", str(tmp_path / "to"))
+    monkeypatch.setattr(af, "PIPE_FROM_AUDACITY", str(tmp_path / "from"))
+    monkeypatch.setattr(ap, "is_audacity_running", lambda: True)
+    counts = []
+
+    def rebuild(command: str):
+        if command == "select":
+            af.do("SelectNone:")
+        counts.append(af.get_track_count())
+
+    monkeypatch.setattr(rebuildap, "rebuild", rebuild)
+    af.disconnect()
+    try:
+        with fake_audacity.FakeAudacity() as fake:
+            fake.execute("NewLabelTrack:")
+            assert rebuildapd.run(["count"], ".")["code"] == 0
+            assert rebuildapd.run(["count"], ".")["code"] == 0
+            # the cache is kept between requests
+            assert fake.counts["GetInfo"] == 1
+        # Audacity restarted: the held pipes are broken
+        with fake_audacity.FakeAudacity() as fake:
+            response = rebuildapd.run(["select"], ".")
+            assert response == {"code": 0, "stdout": "", "stderr": ""}
+            assert fake.counts["SelectNone"] == 1
+        assert counts == [1, 1, 0]
+    finally:
+        af.disconnect()
+        af.invalidate_track_cache()
+
+
+def test_pipe_stats(four_tracks):
+    af.invalidate_track_cache()
+    af.reset_pipe_stats()
+    af.send_commands(["SelectNone:", "SelectAll:"])
+    af.get_tracks()
+    assert af.get_pipe_stats() == {"exchanges": 2, "commands": 3, "get_info": 1}
+    af.reset_pipe_stats()
+    assert af.get_pipe_stats() == {"exchanges": 0, "commands": 0, "get_info": 0}
+
+
+def test_roundtrips_compare():
+    baseline = {"4": {"focus_track": {"exchanges": 3, "commands": 7, "get_info": 1}}}
+    results = {
+        "4": {
+            "focus_track": {"exchanges": 3, "commands": 6, "get_info": 2},
+            "new_operation": {"exchanges": 9, "commands": 9, "get_info": 9},
+        }
+    }
+    assert roundtrips.compare(results, baseline) == [
+        "focus_track (4 tracks): get_info 2 > baseline 1"
+    ]
+
+
+def test_roundtrips_baseline():
+    baseline = json.loads(roundtrips.BASELINE.read_text())
+    results = {"4": roundtrips.run_size(4)}
+    assert roundtrips.compare(results, baseline) == []
+
+
+def test_profiling(four_tracks):
+    af.invalidate_track_cache()
+    af.start_profiling()
+    assert af.is_profiling()
+    af.select_tracks([1, 3])
+    af.send_commands(["SelectNone:"])
+    records = af.stop_profiling()
+    assert not af.is_profiling()
+    assert [(r["command"], r["function"]) for r in records] == [
+        ("GetInfo", "get_tracks"),
+        ("SelectTracks", "select_tracks"),
+        ("SelectNone", "test.test_profiling"),
+    ]
+    assert all(0 <= r["seconds"] <= r["latency"] for r in records)
+    assert records[0]["bytes"] > 100
+    assert af.stop_profiling() == []
+
+
+def test_profile_summary():
+    records = [
+        {
+            "command": "Import2",
+            "function": "import_audio",
+            "latency": 2.0,
+            "seconds": 2.0,
+            "bytes": 26,
+        },
+        {
+            "command": "GetInfo",
+            "function": "get_tracks",
+            "latency": 0.5,
+            "seconds": 0.25,
+            "bytes": 500,
+        },
+        {
+            "command": "GetInfo",
+            "function": "get_tracks",
+            "latency": 0.25,
+            "seconds": 0.25,
+            "bytes": 500,
+        },
+    ]
+    assert command_profile.summarize(records) == [
+        {
+            "function": "import_audio",
+            "commands": 1,
+            "seconds": 2.0,
+            "max_latency": 2.0,
+            "bytes": 26,
+        },
+        {
+            "function": "get_tracks",
+            "commands": 2,
+            "seconds": 0.5,
+            "max_latency": 0.5,
+            "bytes": 1000,
+        },
+    ]
+    lines = command_profile.format_summary(
+        command_profile.summarize(records, "command"), 5.0, "command"
+    )
+    assert lines.splitlines()[1].split() == [
+        "Import2",
+        "1",
+        "2.000",
+        "40.0%",
+        "2.000",
+        "26",
+    ]
+    assert lines.splitlines()[-1].split()[-2:] == ["2.500", "50.0%"]
+
+
+def test_profile(tmp_path, four_tracks):
+    trace_file = tmp_path / "trace.json"
+    with command_profile.profile(str(trace_file)):
+        af.get_labels()
+    trace = json.loads(trace_file.read_text())
+    assert [r["function"] for r in trace["trace"]] == ["get_labels"]
+    assert trace["commands"][0]["command"] == "GetInfo"
+    with command_profile.profile(None):
+        assert not af.is_profiling()
+
+
+def test_import_time_compare():
+    baseline = {"startup": {"microseconds": 1000, "modules": ["rebuildap", "typer"]}}
+    assert (
+        import_time.compare(
+            {"startup": {"microseconds": 1400, "modules": ["rebuildap", "typer"]}},
+            baseline,
+        )
+        == []
+    )
+    assert import_time.compare(
+        {"startup": {"microseconds": 1600, "modules": ["pyaudacity", "rebuildap"]}},
+        baseline,
+    ) == ["startup: imports pyaudacity", "startup: 1.6 ms > baseline 1.0 ms"]
+    # what the standard library and dependencies import varies between machines
+    assert (
+        import_time.compare(
+            {"startup": {"microseconds": 1000, "modules": ["_winapi", "rebuildap"]}},
+            baseline,
+        )
+        == []
+    )
+
+
+def test_import_time_tracked_modules():
+    assert import_time.tracked_modules(
+        ["typer._click.core", "re", "_sre", "rebuildap", "typer", "psutil._common"]
+    ) == ["psutil", "rebuildap", "typer"]
+
+
+def test_lazy_imports():
+    result = import_time.measure(["rebuildap"])
+    assert "rebuildap" in result["modules"]
+    for module in ("asyncio", "sqlite3", "pyperclip", "audacity_funcs", "hashlib"):
+        assert module not in result["modules"]
+
+
+def test_parse_command():
+    assert fake_audacity.parse_command("NewMonoTrack") == ("NewMonoTrack", {})
+    assert fake_audacity.parse_command(
+        'SetLabel: Label=3 Text="say \\"hi\\"" Start=0.5'
+    ) == ("SetLabel", {"Label": "3", "Text": 'say "hi"', "Start": "0.5"})
+
+
+def test_fake_execute():
+    fake = fake_audacity.FakeAudacity()
+    assert fake.execute("NoSuchCommand:").endswith(fake_audacity.RESPONSE_FAILED)
+    assert fake.execute("Undo:").endswith(fake_audacity.RESPONSE_FAILED)
+    fake.execute("NewLabelTrack:")
+    fake.execute('SetTrack: Name="beat"')
+    fake.execute("SelectTime: Start=2 End=2")
+    for _ in range(3):
+        fake.execute("AddLabel:")
+    fake.execute('SetLabel: Label=0 Text="1" Start=0.5 End=0.5')
+    assert fake.execute('GetInfo: Type="Labels" Format="JSON"') == (
+        '[[0,[[0.5,0.5,"1"],[2,2,""],[2,2,""]]]]\n' + fake_audacity.RESPONSE_OK
+    )
+    # like Audacity, every label edit is an undo state copying all labels
+    assert fake.undo_stats == {"undo_states": 5, "undo_labels": 9}
+    fake.execute("Undo:")
+    assert [t["labels"] for t in fake.project.tracks] == [[(2.0, 2.0, "")] * 3]
+    for _ in range(3):
+        fake.execute("Undo:")
+    assert [t["labels"] for t in fake.project.tracks] == [[]]
+    # SetTrack's name isn't redone
+    fake.execute("Undo:")
+    fake.execute("Redo:")
+    assert [t["name"] for t in fake.project.tracks] == [
+        fake_audacity.NEW_LABEL_TRACK_NAME
+    ]
+    assert fake.counts["AddLabel"] == 3
+
+
+def test_fake_running(setup):
+    assert fake_audacity.running() is setup
+    fake = fake_audacity.FakeAudacity()
+    assert fake_audacity.running() is not fake
+
+
+def test_fake_failures():
+    fake = fake_audacity.FakeAudacity(failures=["ImportLabels"])
+    assert fake.execute("SetTrack: Track=0 Name=x").endswith(
+        fake_audacity.RESPONSE_FAILED
+    )
+    assert fake.execute('ImportLabels: fname="a.txt"') == (
+        "ImportLabels failed.\n" + fake_audacity.RESPONSE_FAILED
+    )
+    assert fake.project.tracks == []
+    assert fake.counts["ImportLabels"] == 1
+
+
+def test_fake_latency():
+    fake = fake_audacity.FakeAudacity(latencies={"Message": 0.05})
+    start = time.perf_counter()
+    fake.execute("SelectNone:")
+    assert time.perf_counter() - start < 0.05
+    fake.execute('Message: Text="hi"')
+    assert time.perf_counter() - start >= 0.05
+
+
+def encode_names(names):
+    data = bytes([aup3.FT_CHAR_SIZE, 4])
+    for i, name in enumerate(names):
+        encoded = name.encode("utf-32-le")
+        data += bytes([aup3.FT_NAME]) + struct.pack("<HH", i, len(encoded)) + encoded
+    return data
+
+
+def test_decode_document():
+    names = ["project", "labeltrack", "name", "label", "t", "t1", "title", "rate"]
+    n = {name: i for i, name in enumerate(names)}
+
+    def string(name, value):
+        encoded = value.encode("utf-32-le")
+        return (
+            bytes([aup3.FT_STRING])
+            + struct.pack("<Hi", n[name], len(encoded))
+            + encoded
+        )
+
+    def double(name, value):
+        return bytes([aup3.FT_DOUBLE]) + struct.pack("<Hdi", n[name], value, 19)
+
+    def tag(kind, name):
+        return bytes([kind]) + struct.pack("<H", n[name])
+
+    doc = (
+        bytes([aup3.FT_CHAR_SIZE, 4])
+        + tag(aup3.FT_START_TAG, "project")
+        + bytes([aup3.FT_INT])
+        + struct.pack("<Hi", n["rate"], 44100)
+        + tag(aup3.FT_START_TAG, "labeltrack")
+        + string("name", "lyric")
+        + tag(aup3.FT_START_TAG, "label")
+        + double("t", 1.0 / 3)
+        + double("t1", 2.5)
+        + string("title", "Ünïcode")
+        + tag(aup3.FT_END_TAG, "label")
+        + tag(aup3.FT_END_TAG, "labeltrack")
+        + tag(aup3.FT_END_TAG, "project")
+    )
+    project = aup3.decode_document(encode_names(names) + doc)
+    assert project.tag == "project"
+    assert project.get("rate") == 44100
+    assert aup3.get_label_tracks(project) == [
+        ("lyric", [(1.0 / 3, 2.5, "Ünïcode", -1.0, -1.0)])
+    ]
+
+
+def test_decode_document_corrupt():
+    with pytest.raises(aup3.Aup3Error):
+        aup3.decode_document(encode_names(["project"]) + bytes([aup3.FT_START_TAG, 7]))
+
+
+def test_format_labels():
+    labels = [(1.0 / 3, 2.5, "Intro", -1.0, -1.0), (3.0, 3.0, "", 100.0, 2000.5)]
+    assert lb.format_labels(labels) == (
+        "0.333333\t2.500000\tIntro\n"
+        "3.000000\t3.000000\t\n"
+        "\\\t100.000000\t2000.500000\n"
+    )
+
+
+def test_label_file_name():
+    assert lb.label_file_name("chord", "mysong") == "chord_mysong.txt"
+
+
+def test_unique_names():
+    assert lb.unique_names(["chord", "beat", "chord", "chord"]) == [
+        "chord",
+        "beat",
+        "chord-2",
+        "chord-3",
+    ]
+
+
+def test_read_labels(tmp_path):
+    label_file = tmp_path / "part_song.txt"
+    label_file.write_text("0\t1.5\tIntro\n1.5\t3.25\tVerse\n\\\t100\t2000\n2\t2\n")
+    labels = lb.read_labels(str(label_file))
+    assert labels == [
+        (0.0, 1.5, "Intro", -1.0, -1.0),
+        (1.5, 3.25, "Verse", 100.0, 2000.0),
+        (2.0, 2.0, "", -1.0, -1.0),
+    ]
+    assert labels.starts.typecode == "d"
+    assert list(labels.ends) == [1.5, 3.25, 2.0]
+    assert labels[1] == (1.5, 3.25, "Verse", 100.0, 2000.0)
+
+
+def test_parse_labels_roundtrip():
+    labels = lb.Labels([(i * 0.5, i * 0.5 + 0.25, f"b{i}") for i in range(1000)])
+    assert lb.parse_labels(lb.format_labels(labels).splitlines()) == labels
+
+
+@pytest.mark.parametrize(
+    "text, lineno, message",
+    [
+        ("0\t1\tok\nx\t2\tbad\n", 2, "start 'x' isn't a number"),
+        ("0\tnan\n", 1, "end 'nan' isn't finite"),
+        ("2\t1\tbackwards\n", 1, "label ends .* before it starts"),
+        ("2\t3\n1\t2\n", 2, "not sorted"),
+        ("\\\t100\t200\n", 1, "spectral line without label"),
+        ("0\t1\n\\\t100\n", 2, "spectral line needs 2 values"),
+    ],
+)
+def test_parse_labels_invalid(text, lineno, message):
+    with pytest.raises(lb.LabelFileError, match=message) as e:
+        lb.parse_labels(text.splitlines(), "song.txt")
+    assert e.value.lineno == lineno
+    assert str(e.value).startswith(f"song.txt:{lineno}: ")
+
+
+def test_parse_labels_unvalidated():
+    labels = lb.parse_labels(["2\t3\n", "1\t0\n"], validate=False)
+    assert list(labels.starts) == [2.0, 1.0]
+
+
+def test_encode_decode_document():
+    project = aup3.ET.Element("project", {"rate": 44100.0, "name": "x", "big": 2**40})
+    aup3.ET.SubElement(project, "tags", {"flag": True})
+    decoded = aup3.decode_document(b"".join(aup3.encode_document(project)))
+    assert decoded.attrib == {"rate": 44100.0, "name": "x", "big": 2**40}
+    assert decoded[0].tag == "tags"
+    assert decoded[0].get("flag") is True
+
+
+def test_write_project(tmp_path):
+    pytest.importorskip("numpy")
+    audio = tmp_path / "song.wav"
+    frames = [int(10000 * ((i % 100) / 50 - 1)) for i in range(300000)]
+    with wave.open(str(audio), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(struct.pack(f"<{len(frames)}h", *frames))
+    labels = tmp_path / "part_song.txt"
+    labels.write_text("0.000000\t1.500000\tIntro\n1.500000\t3.250000\tVerse\n")
+    project = tmp_path / "song.aup3"
+    aup3.write_project(str(project), str(audio), [(str(labels), "part")])
+
+    document = aup3.read_project_document(str(project))
+    assert aup3.get_label_tracks(document) == [
+        ("part", [(0.0, 1.5, "Intro", -1.0, -1.0), (1.5, 3.25, "Verse", -1.0, -1.0)])
+    ]
+    (track,) = document.iter(aup3.TAG_WAVE_TRACK)
+    assert track.get("name") == "song"
+    assert track.get("channel") == aup3.CHANNEL_MONO
+    (sequence,) = track.iter("sequence")
+    assert sequence.get("numsamples") == len(frames)
+    assert len(list(sequence)) == 2  # 300000 samples need two blocks
+
+    labels.unlink()
+    aup3.export_label_tracks(str(project))
+    assert (
+        labels.read_text() == "0.000000\t1.500000\tIntro\n1.500000\t3.250000\tVerse\n"
+    )
+
+
+def test_channel_layout():
+    assert aup3.channel_layout(1) == [aup3.CHANNEL_MONO]
+    assert aup3.channel_layout(2) == [aup3.CHANNEL_LEFT, aup3.CHANNEL_RIGHT]
+    assert aup3.channel_layout(4) == [aup3.CHANNEL_MONO] * 4
+
+
+def test_decode_audio_blocks(tmp_path):
+    np = pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0, 16384] * 2500, channels=2)
+    rate, channels, blocks = aup3.decode_audio_blocks(audio, frames=1000)
+    assert (rate, channels) == (44100, 2)
+    shapes = [block.shape for block in blocks]
+    assert shapes == [(1000, 2), (1000, 2), (500, 2)]
+    _, _, blocks = aup3.decode_audio_blocks(audio, frames=1000)
+    assert np.all(next(blocks)[:, 1] == 0.5)
+
+
+def test_write_project_channels(tmp_path):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, list(range(4)) * 1000, channels=4)
+    project = str(tmp_path / "song.aup3")
+    aup3.write_project(project, audio, [])
+    document = aup3.read_project_document(project)
+    tracks = list(document.iter(aup3.TAG_WAVE_TRACK))
+    # like Audacity imports them: a mono track per channel, none linked
+    assert [t.get("channel") for t in tracks] == [aup3.CHANNEL_MONO] * 4
+    assert [t.get("linked") for t in tracks] == [0] * 4
+    assert (
+        aup3.get_wave_track_extents(document)
+        == [("song", 44100, 1, pytest.approx(1000 / 44100))] * 4
+    )
+
+
+def test_write_project_like_audacity(tmp_path, setup):
+    """
+    Compares the aup3 write_project writes with the one Audacity saves for
+    the same audio and labels: layout of the tables and tracks, types of the
+    attributes, and the summaries of Audacity's sample blocks.
+    """
+    if setup:
+        pytest.skip("needs an aup3 saved by Audacity")
+    np = pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [(i * 37) % 20000 - 10000 for i in range(600000)], channels=2)
+    labels = tmp_path / "part_song.txt"
+    labels.write_text("0.25\t1.5\tIntro\n1.5\t3.25\tVerse\n")
+    theirs, ours = str(tmp_path / "audacity.aup3"), str(tmp_path / "ours.aup3")
+    af.new_project()
+    try:
+        af.import_audio(audio, cached=False)
+        af.make_label_track_from_file(str(labels), "part")
+        af.save_project(theirs)
+    finally:
+        af.close_project()
+    aup3.write_project(ours, audio, [(str(labels), "part")])
+
+    def layout(filename):
+        with sqlite3.connect(filename) as con:
+            application_id = con.execute("PRAGMA application_id").fetchone()
+            columns = {
+                table: [row[1:3] for row in con.execute(f"PRAGMA table_info({table})")]
+                for table in ("project", "autosave", "sampleblocks")
+            }
+        return application_id, columns
+
+    assert layout(ours) == layout(theirs)
+    their_doc = aup3.read_project_document(theirs)
+    our_doc = aup3.read_project_document(ours)
+    assert aup3.get_label_tracks(our_doc) == aup3.get_label_tracks(their_doc)
+    assert aup3.get_wave_track_extents(our_doc) == aup3.get_wave_track_extents(
+        their_doc
+    )
+    for tag in (aup3.TAG_WAVE_TRACK, "waveclip", "sequence", "waveblock"):
+        for our, their in zip(our_doc.iter(tag), their_doc.iter(tag)):
+            shared = set(our.attrib) & set(their.attrib)
+            assert {k: type(our.get(k)) for k in shared} == {
+                k: type(their.get(k)) for k in shared
+            }, tag
+            if tag != "waveblock":
+                assert {k: our.get(k) for k in shared - {"name", "offset"}} == {
+                    k: their.get(k) for k in shared - {"name", "offset"}
+                }, tag
+    with sqlite3.connect(theirs) as con:
+        for row in con.execute(
+            "SELECT sampleformat, summin, summax, summary256, summary64k, samples"
+            " FROM sampleblocks"
+        ):
+            samples = np.frombuffer(row[5], dtype="<f4")
+            assert row[0] == aup3.SAMPLE_FORMAT_FLOAT
+            assert (row[1], row[2]) == (samples.min(), samples.max())
+            for blob, frame in ((row[3], 256), (row[4], 65536)):
+                assert np.allclose(
+                    np.frombuffer(blob, dtype="<f4"),
+                    aup3._summary(np, samples, frame).ravel(),
+                )
+
+
+def test_freshness(tmp_path):
+    audio = tmp_path / "song.mp3"
+    labels = tmp_path / "part_song.txt"
+    project = tmp_path / "song.aup3"
+    audio.write_bytes(b"audio")
+    labels.write_text("0\t1\tIntro\n")
+    inputs = [str(audio), str(labels)]
+    assert freshness.check(str(audio), inputs, str(project)) == [
+        "song.aup3 doesn't exist"
+    ]
+    project.write_bytes(b"project")
+    assert freshness.check(str(audio), inputs, str(project)) == [
+        "no manifest song.rebuildap.json"
+    ]
+
+    freshness.record(str(audio), inputs, str(project))
+    assert freshness.check(str(audio), inputs, str(project)) == []
+
+    # touched but unchanged content is up to date
+    stat = labels.stat()
+    os.utime(labels, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert freshness.check(str(audio), inputs, str(project)) == []
+    manifest = freshness.read_manifest(str(audio))
+    assert manifest["inputs"]["part_song.txt"]["mtime_ns"] == stat.st_mtime_ns + 10**9
+
+    labels.write_text("0\t1\tOutro\n")
+    chord = tmp_path / "chord_song.txt"
+    chord.write_text("")
+    assert freshness.check(str(audio), inputs + [str(chord)], str(project)) == [
+        "new input chord_song.txt",
+        "changed input part_song.txt",
+    ]
+    assert freshness.check(str(audio), [str(audio)], str(project)) == [
+        "removed input part_song.txt"
+    ]
+
+
+def test_file_digests(tmp_path):
+    contents = [b"", b"a", os.urandom(3 << 20)]
+    filenames = []
+    for i, content in enumerate(contents):
+        filenames.append(str(tmp_path / f"{i}.bin"))
+        Path(filenames[-1]).write_bytes(content)
+    expected = [hashlib.sha256(content).hexdigest() for content in contents]
+    assert freshness.file_digests(filenames) == expected
+    assert freshness.file_digests(filenames[2:]) == expected[2:]
+
+
+def test_read_sources(tmp_path):
+    audio = tmp_path / "song.mp3"
+    audio.write_bytes(b"audio")
+    label_files = []
+    for name in ("part", "beat"):
+        label_files.append((str(tmp_path / f"{name}_song.txt"), name))
+        Path(label_files[-1][0]).write_text(f"0\t1\t{name}\n")
+    inputs = [str(audio)] + [lfile for lfile, _ in label_files]
+    project = str(tmp_path / "song.aup3")
+    freshness.record(str(audio), inputs, project, ["song", "part", "beat"])
+    manifest = str(freshness.manifest_path(str(audio)))
+    assert freshness.is_manifest(manifest)
+    assert not freshness.is_manifest(str(audio))
+    assert freshness.read_sources(manifest) == (str(audio), label_files, project)
+
+    Path(label_files[1][0]).write_text("0\t1\tbar\n")
+    with pytest.raises(freshness.ManifestError, match="changed beat_song.txt"):
+        freshness.read_sources(manifest)
+    os.remove(label_files[0][0])
+    with pytest.raises(freshness.ManifestError, match="missing part_song.txt"):
+        freshness.read_sources(manifest)
+    other = tmp_path / "other.rebuildap.json"
+    with pytest.raises(freshness.ManifestError, match="other.rebuildap.json"):
+        freshness.read_sources(str(other))
+    other.write_text('{"version": 1, "inputs": {}}')
+    with pytest.raises(freshness.ManifestError, match="no inputs"):
+        freshness.read_sources(str(other))
+
+
+def test_rebuild_from_manifest(tmp_path):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 1000)
+    (tmp_path / "part_song.txt").write_text("0\t1\tIntro\n")
+    (tmp_path / "lyric_song.txt").write_text("0\t1\tla\n")
+    inputs = [audio, str(tmp_path / "lyric_song.txt"), str(tmp_path / "part_song.txt")]
+    project = str(tmp_path / "song.aup3")
+    freshness.record(audio, inputs, project, ["song", "words", "sections"])
+    manifest = str(freshness.manifest_path(audio))
+    rebuildap.rebuild_from_manifest(manifest, False, headless=True)
+    tracks = aup3.get_label_tracks(aup3.read_project_document(project))
+    assert [name for name, _ in tracks] == ["words", "sections"]
+    assert freshness.check(audio, inputs, project) == []
+
+
+def test_rebuild_from_manifest_in_audacity(tmp_path, monkeypatch):
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 1000)
+    (tmp_path / "part_song.txt").write_text("0\t1\tIntro\n")
+    (tmp_path / "lyric_song.txt").write_text("0\t0.5\tla\n")
+    inputs = [audio, str(tmp_path / "lyric_song.txt"), str(tmp_path / "part_song.txt")]
+    project = tmp_path / "song.aup3"
+    freshness.record(audio, inputs, str(project), ["song", "words", "sections"])
+    manifest = freshness.manifest_path(audio)
+    recorded = json.loads(manifest.read_text())
+    os.utime(audio, ns=(0, 0))  # touched: recorded anew
+    monkeypatch.setattr(ap, "assert_audacity", lambda verbose: 0.0)
+    af.new_project()
+    try:
+        rebuildap.rebuild_from_manifest(str(manifest), False)
+    finally:
+        af.close_project()
+    saved = aup3.read_project_document(str(project))
+    assert [name for name, _ in aup3.get_label_tracks(saved)] == ["words", "sections"]
+    assert freshness.check(audio, inputs, str(project)) == []
+    rerecorded = json.loads(manifest.read_text())["inputs"]
+    assert [entry["track"] for entry in rerecorded.values()] == [
+        "song",
+        "words",
+        "sections",
+    ]
+    assert rerecorded["song.wav"]["mtime_ns"] == 0
+    assert rerecorded["song.wav"]["sha256"] == recorded["inputs"]["song.wav"]["sha256"]
+
+
+def test_rebuild_saves_project(tmp_path, monkeypatch, capsys):
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 1000)
+    (tmp_path / "part_song.txt").write_text("0\t1\tIntro\n")
+    project = tmp_path / "song.aup3"
+    project.write_text("stale")  # e.g. committed before the labels changed
+    monkeypatch.setattr(ap, "assert_audacity", lambda verbose: 0.0)
+    af.new_project()
+    try:
+        rebuildap.rebuild(audio)
+    finally:
+        af.close_project()
+    saved = aup3.read_project_document(str(project))
+    assert [name for name, *_ in aup3.get_wave_track_extents(saved)] == ["song"]
+    assert aup3.get_label_tracks(saved) == [("part", [(0.0, 1.0, "Intro", -1.0, -1.0)])]
+    assert (
+        freshness.check(audio, [audio, str(tmp_path / "part_song.txt")], str(project))
+        == []
+    )
+    capsys.readouterr()
+    rebuildap.rebuild(audio)
+    assert "song.aup3 is up to date, skipping" in capsys.readouterr().out
+
+
+def test_exports(tmp_path):
+    audio = tmp_path / "song.mp3"
+    project = tmp_path / "song.aup3"
+    audio.write_bytes(b"audio")
+    project.write_bytes(b"project")
+    orig, guitar = str(tmp_path / "orig_song.mp3"), str(tmp_path / "guitar_song.mp3")
+    exports = {orig: "1", guitar: "2"}
+    assert freshness.stale_exports(str(project), exports) == [orig, guitar]
+    (tmp_path / "orig_song.mp3").write_bytes(b"orig")
+    (tmp_path / "guitar_song.mp3").write_bytes(b"guitar")
+    assert freshness.stale_exports(str(project), exports) == [orig, guitar]
+    freshness.record_exports(str(project), exports)
+    assert freshness.stale_exports(str(project), exports) == []
+    assert freshness.stale_exports(str(project), {orig: "1", guitar: "3"}) == [guitar]
+    assert sorted(freshness.exported_files(str(tmp_path))) == [guitar, orig]
+
+    # exports don't make a manifest of inputs, and survive recording those
+    assert freshness.check(str(audio), [str(audio)], str(project)) == [
+        "no manifest song.rebuildap.json"
+    ]
+    freshness.record(str(audio), [str(audio)], str(project))
+    assert freshness.check(str(audio), [str(audio)], str(project)) == []
+    assert freshness.stale_exports(str(project), exports) == []
+
+
+def test_input_digest(tmp_path):
+    audio = tmp_path / "song.mp3"
+    audio.write_bytes(b"audio")
+    digest = freshness.file_digest(str(audio))
+    assert freshness.input_digest(str(audio)) == digest
+    freshness.record(str(audio), [str(audio)], str(tmp_path / "song.aup3"))
+    manifest = freshness.manifest_path(str(audio))
+    manifest.write_text(manifest.read_text().replace(digest, "recorded"))
+    assert freshness.input_digest(str(audio)) == "recorded"
+
+
+def test_audio_cache_decode(monkeypatch):
+    runs = []
+    monkeypatch.setattr(
+        audio_cache.subprocess, "run", lambda args, **_: runs.append(args)
+    )
+    audio_cache.decode("song.mp3", "song.wav")
+    # beyond 4 GiB (hours of float samples), a WAV file needs the RF64 header
+    assert runs[0][runs[0].index("-rf64") + 1] == "auto"
+
+
+def test_audio_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(audio_cache, "MAX_BYTES", 1 << 20)
+    monkeypatch.setattr(audio_cache, "decode", shutil.copyfile)  # needs no ffmpeg
+    filling = []
+    monkeypatch.setattr(audio_cache, "fill_in_background", filling.append)
+    song, other = tmp_path / "song.mp3", tmp_path / "other.ogg"
+    song.write_bytes(b"song")
+    other.write_bytes(b"other")
+    assert not audio_cache.is_cacheable("song.WAV")
+    assert audio_cache.is_cacheable(str(song))
+
+    assert audio_cache.source_for_import(str(song)) == str(song)
+    assert filling == [str(song)]
+    entry = audio_cache.fill(str(song))
+    assert Path(entry).name == "song.wav"
+    assert Path(entry).parent.name == freshness.file_digest(str(song))
+    assert audio_cache.fill(str(song)) == entry
+    assert audio_cache.source_for_import(str(song)) == entry
+    assert filling == [str(song)]
+
+    # the least recently used entry is evicted first
+    other_entry = audio_cache.fill(str(other))
+    os.utime(entry, ns=(0, 0))
+    os.utime(other_entry, ns=(0, 1))
+    assert audio_cache.lookup(str(song)) == entry
+    assert audio_cache.evict(max_bytes=len(b"song")) == [other_entry]
+    assert audio_cache.lookup(str(other)) is None
+    assert not Path(other_entry).parent.exists()
+
+    commands = []
+    monkeypatch.setattr(af, "do", commands.append)
+    af.import_audio(str(song))
+    af.import_audio(str(song), cached=False)
+    assert commands == [
+        f'Import2: Filename="{entry}"',
+        f'Import2: Filename="{song}"',
+    ]
+
+
+def write_wav(filename: str, frames: list, channels: int = 1):
+    with wave.open(filename, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(44100)
+        w.writeframes(struct.pack(f"<{len(frames)}h", *frames))
+
+
+def test_get_wave_tracks(tmp_path):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [i % 1000 for i in range(20000)], channels=2)
+    first, second = str(tmp_path / "first.aup3"), str(tmp_path / "second.aup3")
+    aup3.write_project(first, audio, [])
+    aup3.write_project(second, audio, [])
+    ((name, digest),) = aup3.get_wave_tracks(first)
+    assert name == "song"
+    assert aup3.get_wave_tracks(second) == [(name, digest)]
+    write_wav(audio, [i % 999 for i in range(20000)], channels=2)
+    aup3.write_project(second, audio, [])
+    assert aup3.get_wave_tracks(second)[0][1] != digest
+
+
+def test_audio_file_names():
+    assert af.audio_file_names(["song", "guitar", "guitar"], "song") == [
+        "orig_song.mp3",
+        "guitar_song.mp3",
+        "guitar-2_song.mp3",
+    ]
+    assert af.audio_file_names(["bass"], "song", "wav") == ["bass_song.wav"]
+
+
+def test_export_audio(tmp_path, undo):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 44100)
+    project = str(tmp_path / "song.aup3")
+    aup3.write_project(project, audio, [])
+    af.import_audio(audio)  # what opening the aup3 in Audacity would show
+
+    af.reset_pipe_stats()
+    rebuildap.export_audio(project, False, opened=True)
+    orig = tmp_path / "orig_song.mp3"
+    with wave.open(str(orig)) as w:
+        assert w.getnframes() == fake_audacity.EXPORT_RATE
+    assert af.get_pipe_stats()["exchanges"] == 2  # GetInfo and the export batch
+
+    af.reset_pipe_stats()
+    rebuildap.export_audio(project, False, opened=True)
+    assert af.get_pipe_stats()["exchanges"] == 0
+    assert rebuild_batch.find_audio_files([str(tmp_path)]) == [audio]
+    assert rebuild_batch.find_audio_files([str(orig)]) == [str(orig)]
+
+
+def test_compare_labels():
+    labels = [(0.0, 1.0, "a", -1.0, -1.0), (1.0, 2.0, "b", -1.0, -1.0)]
+    assert verify_aup3.compare_labels(labels, list(labels)) is None
+    assert (
+        verify_aup3.compare_labels([(0.0, 1.0000001, "a", -1.0, -1.0)], labels[:1])
+        is None
+    )
+    assert verify_aup3.compare_labels(labels[:1], labels) == "1 labels instead of 2"
+    assert (
+        verify_aup3.compare_labels([labels[0], (1.0, 2.0, "c", -1.0, -1.0)], labels)
+        == "label 2 is '1.000000\\t2.000000\\tc' instead of '1.000000\\t2.000000\\tb'"
+    )
+
+
+def test_compare_audio():
+    assert verify_aup3.compare_audio(("song", 44100, 2, 10.0), (44100, 2, 10.02)) == []
+    assert verify_aup3.compare_audio(("song", 48000, 1, 9.0), (44100, 2, 10.0)) == [
+        "48000 Hz instead of 44100 Hz",
+        "1 channel(s) instead of 2",
+        "9.000 s instead of 10.000 s",
+    ]
+
+
+def test_verify(tmp_path):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 44100 * 2, channels=2)
+    part, beat = tmp_path / "part_song.txt", tmp_path / "beat_song.txt"
+    part.write_text("0\t1\tIntro\n1\t2\tVerse\n")
+    beat.write_text("0\t0\t1\n")
+    project = str(tmp_path / "song.aup3")
+    label_files = af.get_label_files(audio)
+    aup3.write_project(project, audio, label_files)
+    assert verify_aup3.expected_sources(project) == (audio, label_files, False)
+    assert verify_aup3.probe_audio(audio) == (44100, 2, 1.0)
+    assert aup3.get_wave_track_extents(aup3.read_project_document(project)) == [
+        ("song", 44100, 2, 1.0)
+    ]
+    assert verify_aup3.verify(project) == []
+    assert verify_aup3.verify(audio) == []
+    assert verify_aup3.report([project]) == 0
+
+    part.write_text("0\t1\tIntro\n1\t2.5\tVerse\n")
+    (tmp_path / "chord_song.txt").write_text("")
+    write_wav(audio, [0] * 22050, channels=1)
+    assert verify_aup3.verify(project) == [
+        "part: label 2 is '1.000000\\t2.000000\\tVerse'"
+        " instead of '1.000000\\t2.500000\\tVerse' (part_song.txt)",
+        "chord: missing label track (chord_song.txt)",
+        "song: 2 channel(s) instead of 1 (song.wav)",
+        "song: 1.000 s instead of 0.500 s (song.wav)",
+    ]
+    assert verify_aup3.report([project]) == 1
+    assert verify_aup3.report([str(tmp_path / "other.aup3")]) == 1
+
+    # with a manifest, its sources count and a changed audio file is reported
+    freshness.record(audio, [audio, str(beat)], project, ["song", "part"])
+    assert verify_aup3.verify(project) == [
+        "part: label 1 is '0.000000\\t1.000000\\tIntro'"
+        " instead of '0.000000\\t0.000000\\t1' (beat_song.txt)",
+        "beat: label track without label file",
+        "song: 2 channel(s) instead of 1 (song.wav)",
+        "song: 1.000 s instead of 0.500 s (song.wav)",
+    ]
+    write_wav(audio, [0] * 44100 * 2, channels=2)
+    os.utime(audio, ns=(0, 0))
+    assert verify_aup3.verify(project)[-1] == "song: song.wav changed since the rebuild"
+
+
+def test_verify_channels(tmp_path):
+    pytest.importorskip("numpy")
+    audio = str(tmp_path / "song.wav")
+    write_wav(audio, [0] * 4 * 4410, channels=4)
+    project = str(tmp_path / "song.aup3")
+    aup3.write_project(project, audio, [])
+    assert verify_aup3.verify(project) == []
+
+
+def test_find_audio_files(tmp_path):
+    for name in ("b.mp3", "a.wav", "part_a.txt", "c.aup3"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "d.mp3").write_bytes(b"")
+    a, b, d = (str(tmp_path / name) for name in ("a.wav", "b.mp3", "sub/d.mp3"))
+    assert rebuild_batch.find_audio_files([str(tmp_path)]) == [a, b]
+    assert rebuild_batch.find_audio_files([f"{tmp_path}/*.mp3", d, b]) == [b, d]
+
+
+def test_prepare(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(audio_cache, "MAX_BYTES", 1 << 20)
+    filling = []
+    monkeypatch.setattr(audio_cache, "fill_in_background", filling.append)
+    audio = tmp_path / "song.mp3"
+    audio.write_bytes(b"audio")
+    (tmp_path / "beat_song.txt").write_text("0\t0\t1\n")
+    (tmp_path / "part_song.txt").write_text("0\t1\tIntro\n")
+    song = rebuild_batch.prepare(str(audio))
+    assert [name for _, name in song["label_files"]] == ["part", "beat"]
+    assert song["labels"][0] == [(0.0, 1.0, "Intro", -1.0, -1.0)]
+    assert song["inputs"][0] == str(audio)
+    assert song["reasons"] == ["song.aup3 doesn't exist"]
+    assert song["described"][0][freshness.HASH_ALGORITHM] == freshness.file_digest(
+        str(audio)
+    )
+    assert song["source"] == str(audio) and filling == [str(audio)]
+    assert rebuild_batch.prepare(str(audio), force=True)["reasons"] == ["forced"]
+
+
+def test_rebuild_all(tmp_path, monkeypatch):
+    songs = {"one": ["part", "beat"], "two": ["lyric"]}
+    for stem, names in songs.items():
+        write_wav(str(tmp_path / f"{stem}.wav"), [0] * 100)
+        for name in names:
+            (tmp_path / f"{name}_{stem}.txt").write_text(f"0\t0.5\t{name}\n")
+    monkeypatch.setattr(ap, "assert_audacity", lambda verbose: 0.0)
+    tracks = af.get_track_count()
+    rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    assert af.get_track_count() == tracks  # every song in a window of its own
+    assert [Path(song["filename"]).stem for song in rebuilt] == list(songs)
+    for song, (stem, names) in zip(rebuilt, songs.items()):
+        assert song["status"] == rebuild_batch.STATUS_REBUILT
+        assert song["prepare"] > 0 and song["rebuild"] > 0
+        saved = aup3.read_project_document(str(tmp_path / f"{stem}.aup3"))
+        assert [name for name, *_ in aup3.get_wave_track_extents(saved)] == [stem]
+        tracks = aup3.get_label_tracks(saved)
+        assert [name for name, _ in tracks] == names
+        assert tracks[0][1] == [(0.0, 0.5, names[0], -1.0, -1.0)]
+        assert freshness.check(song["filename"], song["inputs"], song["project"]) == []
+    rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    assert [song["status"] for song in rebuilt] == [rebuild_batch.STATUS_UP_TO_DATE] * 2
+
+
+def test_rebuild_all_hashes_once(tmp_path, monkeypatch):
+    write_wav(str(tmp_path / "song.wav"), [0] * 100)
+    (tmp_path / "part_song.txt").write_text("0\t0.5\tpart\n")
+    monkeypatch.setattr(ap, "assert_audacity", lambda verbose: 0.0)
+    hashed = []
+    file_digest = freshness.file_digest
+    monkeypatch.setattr(
+        freshness, "file_digest", lambda name: hashed.append(name) or file_digest(name)
+    )
+    rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    assert rebuilt[0]["status"] == rebuild_batch.STATUS_REBUILT
+    assert sorted(hashed) == sorted(rebuilt[0]["inputs"])
+    (tmp_path / "part_song.txt").write_text("0\t0.5\tPart\n")
+    hashed.clear()
+    rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    assert rebuilt[0]["status"] == rebuild_batch.STATUS_REBUILT
+    assert hashed == [str(tmp_path / "part_song.txt")]
+
+
+def test_rebuild_all_failures(tmp_path, monkeypatch, setup):
+    if not setup:
+        pytest.skip("needs failures injected into the fake Audacity")
+    for stem in ("one", "two"):
+        write_wav(str(tmp_path / f"{stem}.wav"), [0] * 100)
+        (tmp_path / f"part_{stem}.txt").write_text("0\t0.5\tpart\n")
+    monkeypatch.setattr(ap, "assert_audacity", lambda verbose: 0.0)
+    windows = len(setup.projects)
+    save_prompts = setup.save_prompts
+    # a failed song's window is closed without prompting for saving
+    setup.failures.add("ImportLabels")
+    try:
+        rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    finally:
+        setup.failures.clear()
+    assert [song["status"] for song in rebuilt] == [rebuild_batch.STATUS_FAILED] * 2
+    assert "ImportLabels" in rebuilt[0]["error"]
+    assert len(setup.projects) == windows
+    assert setup.save_prompts == save_prompts
+    assert not list(tmp_path.glob("*.aup3"))
+    assert not (tmp_path / "one.rebuildap.json").exists()
+    # if it can't be, the batch is aborted
+    setup.failures.update(["ImportLabels", "SaveProject2"])
+    news = setup.counts["New"]
+    try:
+        rebuilt = rebuild_batch.rebuild_all([str(tmp_path)])
+    finally:
+        setup.failures.clear()
+        while len(setup.projects) > windows:
+            af.close_project()
+    assert "Can't discard" in rebuilt[0]["error"]
+    assert rebuilt[1]["error"].startswith("batch aborted")
+    assert setup.counts["New"] - news == 1
+
+
+def test_format_timings():
+    songs = [
+        {"filename": "/x/a.mp3", "status": "rebuilt", "prepare": 0.5, "rebuild": 2},
+        {"filename": "/x/bb.mp3", "status": "failed", "error": "oops"},
+    ]
+    assert rebuild_batch.format_timings(songs).splitlines() == [
+        "song     prepare   rebuild  status",
+        "a.mp3      0.500     2.000  rebuilt",
+        "bb.mp3     0.000     0.000  failed: oops",
+    ]
+
+
 def main():
     pass
 
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+import json
+import shutil
+import subprocess
+import sys
+import wave
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import typer
+
+import audacity_funcs as af
+import aup3
+import freshness
+import labels as lb
+
+"""
+verify_aup3.py song.aup3
+
+Checks that aup3 files still match their sources, e.g. before committing
+them, without Audacity: the aup3 is read directly (see aup3.py).
+
+The sources are taken from the aup3's manifest (see freshness.py) if there
+is one, otherwise they're looked up like rebuildap does: the audio file
+<stem>.<ext> next to the aup3 and its label files.
+
+Per label track, its labels are compared with its label file at the
+precision of label files. Label tracks missing, without label file or in
+another order than the sources are reported as well.
+The audio track is identified by name (the audio file's stem), sample rate,
+channels and duration (within DURATION_TOLERANCE, as decoders differ in
+padding). With a manifest, an audio file changed since the rebuild (by
+content hash) is reported, too. Audio tracks added to the project are left alone.
+
+Probing other audio files than PCM WAV needs ffprobe.
+
+"""
+
+# seconds the audio track's duration may differ from the audio file's
+DURATION_TOLERANCE = 0.05
+
+
+def expected_sources(project: str) -> Tuple[Optional[str], List[Tuple[str, str]], bool]:
+    """
+    Returns the audio file (None if there's none), the (label file, label
+    track name) pairs in import order of the given aup3, and whether the audio
+    file changed since the rebuild (only known with a manifest).
+    Tested
+    """
+    manifest = freshness.read_manifest(project) or {}
+    if manifest.get("inputs"):
+        base = freshness.manifest_path(project).parent
+        inputs = sorted(manifest["inputs"].items(), key=lambda item: item[1]["order"])
+        files = [str(base / name) for name, _ in inputs]
+        recorded = inputs[0][1]
+        try:
+            current = freshness.describe_input(files[0], recorded)
+            changed = current[freshness.HASH_ALGORITHM] != recorded.get(
+                freshness.HASH_ALGORITHM
+            )
+        except OSError:
+            changed = True
+        label_files = [
+            (file, entry["track"]) for file, (_, entry) in zip(files[1:], inputs[1:])
+        ]
+        return files[0], label_files, changed
+    path = Path(project)
+    for extension in af.AUDIO_EXTENSIONS:
+        audio_file = path.with_suffix(f".{extension}")
+        if audio_file.is_file():
+            return str(audio_file), af.get_label_files(str(audio_file)), False
+    return None, af.get_label_files(project), False
+
+
+def probe_audio(filename: str) -> Optional[Tuple[int, int, float]]:
+    """
+    Returns sample rate, channels and duration in seconds of the given audio
+    file, None if it can't be probed.
+    Tested
+    """
+    try:
+        with wave.open(filename, "rb") as w:
+            return w.getframerate(), w.getnchannels(), w.getnframes() / w.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    if not shutil.which("ffprobe"):
+        return None
+    probe = subprocess.run(
+        ["ffprobe", "-v", "error", "-select_streams", "a:0"]
+        + ["-show_entries", "stream=sample_rate,channels,duration"]
+        + ["-of", "json", filename],
+        capture_output=True,
+        text=True,
+    )
+    try:
+        stream = json.loads(probe.stdout)["streams"][0]
+        return (
+            int(stream["sample_rate"]),
+            int(stream["channels"]),
+            float(stream["duration"]),
+        )
+    except (ValueError, KeyError, IndexError):
+        return None
+
+
+def compare_labels(actual, expected, digits: int = lb.LABEL_DIGITS) -> Optional[str]:
+    """
+    Returns how the actual labels differ from the expected ones when written
+    with the given number of decimals, None if they don't.
+    Tested
+    """
+    for i, (a, e) in enumerate(zip(actual, expected), 1):
+        a_text = lb.format_labels([a], digits)
+        e_text = lb.format_labels([e], digits)
+        if a_text != e_text:
+            return f"label {i} is {a_text.strip()!r} instead of {e_text.strip()!r}"
+    if len(actual) != len(expected):
+        return f"{len(actual)} labels instead of {len(expected)}"
+    return None
+
+
+def compare_audio(
+    track: Tuple[str, int, int, float], source: Tuple[int, int, float]
+) -> List[str]:
+    """
+    Returns how the given audio track, (name, rate, channels, seconds),
+    differs from its source, (rate, channels, seconds).
+    Tested
+    """
+    _, rate, channels, seconds = track
+    source_rate, source_channels, source_seconds = source
+    problems = []
+    if rate != source_rate:
+        problems.append(f"{rate} Hz instead of {source_rate} Hz")
+    if channels != source_channels:
+        problems.append(f"{channels} channel(s) instead of {source_channels}")
+    if abs(seconds - source_seconds) > DURATION_TOLERANCE:
+        problems.append(f"{seconds:.3f} s instead of {source_seconds:.3f} s")
+    return problems
+
+
+def verify(filename: str) -> List[str]:
+    """
+    Returns the mismatches ("<track>: <problem>") between the given aup3 (or
+    the aup3 of the given audio file) and its sources, an empty list if it
+    matches them. Raises aup3.Aup3Error if the aup3 can't be read.
+    Tested
+    """
+    path = Path(filename).expanduser().resolve()
+    if not af.is_audacity_project(str(path)):
+        path = path.with_suffix(f".{af.AUDACITY_EXTENSION}")
+    project = aup3.read_project_document(str(path))
+    audio_file, label_files, changed = expected_sources(str(path))
+    mismatches = []
+
+    tracks = aup3.get_label_tracks(project)
+    actual = dict(
+        zip(lb.unique_names([name for name, _ in tracks]), [t for _, t in tracks])
+    )
+    expected = {name: label_file for label_file, name in label_files}
+    for name, label_file in expected.items():
+        if name not in actual:
+            mismatches.append(f"{name}: missing label track ({Path(label_file).name})")
+            continue
+        try:
+            problem = compare_labels(actual[name], lb.read_labels(label_file, False))
+        except (OSError, lb.LabelFileError) as e:
+            problem = str(e)
+        if problem:
+            mismatches.append(f"{name}: {problem} ({Path(label_file).name})")
+    mismatches += [
+        f"{name}: label track without label file"
+        for name in actual
+        if name not in expected
+    ]
+    actual_order = [name for name in actual if name in expected]
+    expected_order = [name for name in expected if name in actual]
+    if actual_order != expected_order:
+        mismatches.append(
+            f"label tracks: order {', '.join(actual_order)}"
+            f" instead of {', '.join(expected_order)}"
+        )
+
+    if audio_file is None:
+        mismatches.append(f"{path.stem}: no audio file found")
+        return mismatches
+    stem = Path(audio_file).stem
+    waves = [
+        track for track in aup3.get_wave_track_extents(project) if track[0] == stem
+    ]
+    if not waves:
+        mismatches.append(f"{stem}: missing audio track ({Path(audio_file).name})")
+    else:
+        source = probe_audio(audio_file)
+        if source is not None:
+            track = waves[0]
+            if source[1] > 2:  # imported as a mono track per channel
+                track = (
+                    stem,
+                    track[1],
+                    sum(wave[2] for wave in waves),
+                    max(wave[3] for wave in waves),
+                )
+            mismatches += [
+                f"{stem}: {problem} ({Path(audio_file).name})"
+                for problem in compare_audio(track, source)
+            ]
+    if changed:
+        mismatches.append(f"{stem}: {Path(audio_file).name} changed since the rebuild")
+    return mismatches
+
+
+def report(filenames: List[str], verbose: bool = False) -> int:
+    """
+    Verifies the given aup3 files, prints their mismatches and returns the
+    exit code: 1 if any of them doesn't match its sources, 0 otherwise.
+    Tested
+    """
+    code = 0
+    for filename in filenames:
+        try:
+            mismatches = verify(filename)
+        except aup3.Aup3Error as e:
+            mismatches = [str(e)]
+        for mismatch in mismatches:
+            print(f"{filename}: {mismatch}", file=sys.stderr)
+        if mismatches:
+            code = 1
+        elif verbose:
+            print(f"{filename}: OK")
+    return code
+
+
+def main(
+    filenames: List[str],
+    verbose: bool = typer.Option(False, "-v", "--verbose", help="Report matches."),
+):
+    """
+    Checks that the given aup3 files match their audio and label files.
+    """
+    raise typer.Exit(code=report(filenames, verbose))
+
+
+if __name__ == "__main__":
+    typer.run(main)